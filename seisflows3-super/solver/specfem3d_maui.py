@@ -88,12 +88,7 @@ class Specfem3DMaui(custom_import("solver", "specfem3d")):
         """
         unix.cd(self.cwd)
 
-        setpar(key="SIMULATION_TYPE", val="1", file="DATA/Par_file")
-        setpar(key="SAVE_FORWARD", val=".true.", file="DATA/Par_file")
-        if PAR.ATTENUATION:
-            setpar(key="ATTENUATION ", val=".true.", file="DATA/Par_file")
-        else:
-            setpar(key="ATTENUATION ", val=".false.", file="DATA/Par_file")
+        self.set_forward_parameters()
 
         call_solver(mpiexec=PAR.MPIEXEC, executable="bin/xspecfem3D")
 
@@ -142,6 +137,7 @@ class Specfem3DMaui(custom_import("solver", "specfem3d")):
             self.check_mesh_properties(model_path)
             
             # Copy model files and then run xgenerate databases
+            self.unshare_databases()
             src = glob(os.path.join(model_path, "*"))
             dst = self.model_databases
             unix.cp(src, dst)
@@ -205,7 +201,7 @@ class Specfem3DMaui(custom_import("solver", "specfem3d")):
             # Copy database files to each of the other source directories
             dst_db = os.path.join(PATH.SOLVER, source_name, 
                                   "OUTPUT_FILES", "DATABASES_MPI", "")
-            unix.cp(src_db, dst_db)
+            self.provision_databases(src_db, dst_db)
 
             # Copy mesher h files into the overlying directory
             dst_h = os.path.join(PATH.SOLVER, source_name, "OUTPUT_FILES", "")
@@ -234,10 +230,8 @@ class Specfem3DMaui(custom_import("solver", "specfem3d")):
                             "traces/obs", "traces/syn", "traces/adj"]:
                 unix.mkdir(cwd_dir)
 
-            # Copy exectuables
-            src = glob(os.path.join(PATH.SPECFEM_BIN, "*"))
-            dst = os.path.join("bin", "")
-            unix.cp(src, dst)
+            # Copy or symlink exectuables
+            self.provision_executables(dst="bin")
 
             # Copy all input files except source files
             src = glob(os.path.join(PATH.SPECFEM_DATA, "*"))
@@ -162,12 +162,12 @@ class Maui(custom_import("system", "slurm")):
             f"--ntasks={PAR.NPROC:d}",
             f"--time={PAR.TASKTIME:d}",
             f"--output={os.path.join(PATH.WORKDIR, 'logs', '%A_%a')}",
-            f"--array=0-{PAR.NTASK-1 % PAR.NTASKMAX}",
+            f"--array=0-{PAR.NTASK - 1}%{PAR.NTASKMAX}",
             f"{os.path.join(ROOT_DIR, 'scripts', 'run')}",
             f"--output {PATH.OUTPUT}",
             f"--classname {classname}",
             f"--funcname {method}",
-            f"--environment {PAR.ENVIRONS or ''}"
+            f"--environment {self.environs}"
         ])
         self.logger.debug(maui_run_call)
         super().run(classname, method, single, run_call=maui_run_call, **kwargs)
@@ -192,12 +192,12 @@ class Maui(custom_import("system", "slurm")):
             f"--cpus-per-task={PAR.CPUS_PER_TASK}",
             f"--time={PAR.ANCIL_TASKTIME:d}",
             f"--output={os.path.join(PATH.WORKDIR, 'logs', '%A_%a')}",
-            f"--array=0-{PAR.NTASK-1 % PAR.NTASKMAX}",
+            f"--array=0-{PAR.NTASK - 1}%{PAR.NTASKMAX}",
             f"{os.path.join(ROOT_DIR, 'scripts', 'run')}",
             f"--output {PATH.OUTPUT}",
             f"--classname {classname}",
             f"--funcname {method}",
-            f"--environment {PAR.ENVIRONS or ''}"
+            f"--environment {self.environs}"
         ])
         self.logger.debug(ancil_run_call)
         super().run(classname, method, single=False, run_call=ancil_run_call,
@@ -15,7 +15,9 @@ of as comprising the complete 'state' of a SeisFlows session
 import os
 import sys
 import json
+import time
 import types
+import hashlib
 import pickle
 import copyreg
 import logging
@@ -68,6 +70,12 @@ CFGPATHS = dict(
 !!! ^^^ WARNING ^^^ !!!
 """
 
+# Available modules, cached by return_modules() until a module directory changes
+_registry = {"stamp": None, "modules": None}
+
+# Time spent importing each module through custom_import(), in seconds
+_import_times = {}
+
 
 def init_seisflows(check=True):
     """
@@ -130,22 +138,92 @@ def init_seisflows(check=True):
 def save():
     """
     Export the current session to disk
+
+    .. note::
+        Checkpointing is incremental. The serialized state of each module is
+        hashed and only files whose contents have changed since they were
+        last written are rewritten, each through a temporary file which
+        replaces the original so that a checkpoint is never partially written
     """
     logger.info("exporting current working environment to disk")
     output = sys.modules[PATH]["OUTPUT"]
-    unix.mkdir(output)
+    if not os.path.isdir(output):
+        unix.mkdir(output)
 
-    # Save the paths and parameters into a JSON file
-    for name in [PAR, PATH]:
-        fullfile = os.path.join(output, f"{name}.json")
-        with open(fullfile, "w") as f:
-            json.dump(sys.modules[name].__dict__, f, sort_keys=True, indent=4)
+    start = time.time()
 
-    # Save the current workflow as pickle objects
+    # Serialize the paths and parameters as JSON and the current workflow as
+    # pickle objects
+    files = {}
+    for name in [PAR, PATH]:
+        files[f"{name}.json"] = json.dumps(sys.modules[name].__dict__,
+                                           sort_keys=True, indent=4).encode()
     for name in NAMES:
-        fullfile = os.path.join(output, f"seisflows_{name}.p")
-        with open(fullfile, "wb") as f:
-            pickle.dump(sys.modules[f"seisflows_{name}"], f)
+        files[f"seisflows_{name}.p"] = pickle.dumps(
+            sys.modules[f"seisflows_{name}"])
+
+    nwritten, nbytes = 0, 0
+    for fid, data in files.items():
+        if _write_if_changed(os.path.join(output, fid), data):
+            nwritten += 1
+            nbytes += len(data)
+
+    logger.debug(f"checkpoint wrote {nwritten}/{len(files)} files "
+                 f"({nbytes / 1E3:.1f} kB) in {time.time() - start:.3f}s, "
+                 f"skipped {len(files) - nwritten} unchanged files")
+
+
+# Digests and (modification time, size) stamps of checkpoint files written by
+# this process, keyed by absolute path, see _write_if_changed()
+_WRITTEN = {}
+
+
+def clear_written():
+    """
+    Forget the digests of previously written checkpoint files, so that the
+    next checkpoint compares its files against the contents on disk
+    """
+    _WRITTEN.clear()
+
+
+def _write_if_changed(fid, data):
+    """
+    Write `data` to `fid` unless the file already contains it. Digests of
+    previously written files are kept (in `_WRITTEN`) so that unchanged files
+    do not need to be read back, as long as the file on disk has not been
+    modified since
+
+    :type fid: str
+    :param fid: file to write
+    :type data: bytes
+    :param data: contents of the file
+    :rtype: bool
+    :return: True if the file was written, False if it was unchanged
+    """
+    fid = os.path.abspath(fid)
+    digest = hashlib.blake2b(data, digest_size=16).digest()
+
+    if os.path.exists(fid):
+        stat = os.stat(fid)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if fid in _WRITTEN and _WRITTEN[fid][1] == stamp:
+            if _WRITTEN[fid][0] == digest:
+                return False
+        elif stat.st_size == len(data):
+            with open(fid, "rb") as f:
+                if hashlib.blake2b(f.read(), digest_size=16).digest() == digest:
+                    _WRITTEN[fid] = (digest, stamp)
+                    return False
+
+    tmp = f"{fid}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, fid)
+
+    stat = os.stat(fid)
+    _WRITTEN[fid] = (digest, (stat.st_mtime_ns, stat.st_size))
+
+    return True
 
 
 def load(path):
@@ -183,6 +261,7 @@ def flush():
         mod_name = f"seisflows_{name}"
         if mod_name in sys.modules:
             del sys.modules[mod_name]
+    clear_written()
 
 
 def config_logger(level="DEBUG", filename=None, filemode="a", verbose=True):
@@ -429,6 +508,61 @@ class SeisFlowsPathsParameters:
                     setattr(sys_par, key, attrs["default"])
 
 
+def return_modules():
+    """
+    Search for the names of available modules in SeisFlows name space.
+    This simple function checks for files with a '.py' extension inside
+    each of the sub-directories, ignoring private files like __init__.py.
+
+    The result is cached and only searched again when the modification time
+    of one of the sub-directories changes, i.e., when a module is added,
+    removed or renamed
+
+    :rtype: dict of dict of lists
+    :return: a dict with keys matching names and values as dicts for each
+        package. nested list contains all the avaialble modules
+    """
+    repo_dir = os.path.abspath(os.path.join(ROOT_DIR, ".."))
+    mod_dirs = {(NAME, PACKAGE): os.path.join(repo_dir, PACKAGE, NAME)
+                for NAME in NAMES for PACKAGE in PACKAGES}
+
+    stamp = []
+    for mod_dir in mod_dirs.values():
+        try:
+            stamp.append(os.stat(mod_dir).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+
+    if _registry["stamp"] != stamp:
+        module_dict = {NAME: {} for NAME in NAMES}
+        for (NAME, PACKAGE), mod_dir in mod_dirs.items():
+            module_dict[NAME][PACKAGE] = []
+            if not os.path.isdir(mod_dir):
+                continue
+            for pyfile in sorted(os.listdir(mod_dir)):
+                stripped_pyfile, ext = os.path.splitext(pyfile)
+                if ext == ".py" and not stripped_pyfile.startswith("_"):
+                    module_dict[NAME][PACKAGE].append(stripped_pyfile)
+        _registry.update(stamp=stamp, modules=module_dict)
+
+    # Return a copy so that callers cannot modify the cached registry
+    return {NAME: {PACKAGE: list(modules) for PACKAGE, modules in
+                   package_dict.items()}
+            for NAME, package_dict in _registry["modules"].items()}
+
+
+def import_times():
+    """
+    Return the time spent importing modules with custom_import(), slowest
+    first, used to benchmark the startup cost of the command line tool
+
+    :rtype: dict
+    :return: seconds spent importing, keyed by full dotted module name
+    """
+    return dict(sorted(_import_times.items(), key=lambda x: x[1],
+                       reverse=True))
+
+
 def custom_import(name=None, module=None, classname=None):
     """
     Imports SeisFlows module and extracts class that is the camelcase version
@@ -487,11 +621,13 @@ def custom_import(name=None, module=None, classname=None):
         else:
             classname = module.title().replace("_", "")
 
-    # Check if modules exist, otherwise raise custom exception
+    # Check if modules exist, otherwise raise custom exception. The module
+    # registry avoids searching the import system for the standard modules
+    registry = return_modules()[name]
     _exists = False
     for package in PACKAGES:
         full_dotted_name = ".".join([package, name, module])
-        if module_exists(full_dotted_name):
+        if module in registry[package] or module_exists(full_dotted_name):
             _exists = True
             break
     if not _exists:
@@ -504,7 +640,10 @@ def custom_import(name=None, module=None, classname=None):
     # If importing the module doesn't work, throw an error. Usually this happens
     # when am external dependency isn't available, e.g., Pyatoa
     try:
+        start = time.perf_counter()
         module = import_module(full_dotted_name)
+        _import_times.setdefault(full_dotted_name,
+                                 time.perf_counter() - start)
     except Exception as e:
         print(msg.cli(f"Module could not be imported {full_dotted_name}",
                       items=[str(e)], header="custom import error", border="="))
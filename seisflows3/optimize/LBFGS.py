@@ -12,6 +12,7 @@ from seisflows3.tools import unix
 from seisflows3.tools.msg import DEG
 from seisflows3.tools.wrappers import exists
 from seisflows3.tools.math import angle
+from seisflows3.tools.vectors import axpy
 from seisflows3.config import custom_import, SeisFlowsPathsParameters
 
 PAR = sys.modules["seisflows_parameters"]
@@ -79,14 +80,44 @@ class LBFGS(custom_import("optimize", "base")):
         :type s_file: str
         :param s_file: path to store memory of the model differences
             i.e., `m_new - m_old`
+        :type memory_head: int
+        :param memory_head: row of the memmaps holding the most recent model
+            and gradient differences. Memory is stored as a ring buffer so that
+            older rows do not need to be shifted when new memory is added
+        :type rh: np.array
+        :param rh: cached values of 1 / (y_k . s_k) for each row of memory
+        :type yty: np.array
+        :param yty: cached values of y_k . y_k for each row of memory
+        :type chunk_size: int
+        :param chunk_size: number of vector elements read from the memmaps at
+            a time when applying the inverse Hessian
         """
         super().__init__()
         self.LBFGS_iter = 0
         self.memory_used = 0
+        self.memory_head = 0
+        self.rh = None
+        self.yty = None
+        self.chunk_size = 2 ** 20
         self.LBFGS_dir = "LBFGS"
         self.y_file = os.path.join(self.LBFGS_dir, "Y")
         self.s_file = os.path.join(self.LBFGS_dir, "S")
 
+    def __setstate__(self, state):
+        """
+        Restore an instance from a checkpoint. Checkpoints written by older
+        versions predate the ring buffer memory and the chunked application
+        of the inverse Hessian, so the attributes these introduced are given
+        their initial values. Memory of such checkpoints is converted to the
+        ring buffer layout by the next call to update()
+
+        :type state: dict
+        :param state: attributes of the pickled instance
+        """
+        self.__dict__.update({"memory_head": 0, "rh": None, "yty": None,
+                              "chunk_size": 2 ** 20})
+        self.__dict__.update(state)
+
     @property
     def required(self):
         """
@@ -206,13 +237,11 @@ class LBFGS(custom_import("optimize", "base")):
         self.logger.info("restarting L-BFGS optimization algorithm by clearing "
                          "internal memory")
         self.LBFGS_iter = 1
-        self.memory_used = 0
 
-        unix.cd(PATH.OPTIMIZE)
-        s = np.memmap(filename=self.s_file, mode="r+")
-        y = np.memmap(filename=self.y_file, mode="r+")
-        s[:] = 0.
-        y[:] = 0.
+        # Memory rows past `memory_used` are never read, so the memmaps do not
+        # need to be zeroed, they will be recreated by the next update()
+        self.memory_used = 0
+        self.memory_head = 0
 
     def update(self):
         """
@@ -224,6 +253,11 @@ class LBFGS(custom_import("optimize", "base")):
             which allow for access of small segments of large files on disk,
             without reading the entire file. Memmaps are array like objects.
 
+        .. note::
+            Memory is stored row-major, one row per vector, as a ring buffer.
+            The newest vectors overwrite the oldest row, and `memory_head`
+            points to the newest row, so no data are shifted on disk.
+
         .. note::
             Notation for s and y taken from Liu & Nocedal 1989
             iterate notation: sk = x_k+1 - x_k and yk = g_k+1 - gk
@@ -235,52 +269,109 @@ class LBFGS(custom_import("optimize", "base")):
         """
         unix.cd(PATH.OPTIMIZE)
 
-        # Determine the iterates for model m and gradient g
-        s_k = self.load(self.m_new) - self.load(self.m_old)
-        y_k = self.load(self.g_new) - self.load(self.g_old)
-
-        # Determine the shape of the memory map (length of model, length of mem)
-        m = len(s_k)
+        # Determine the shape of the memory map (length of mem, length of model)
         n = PAR.LBFGSMEM
+        m = len(self.load(self.m_new))
+
+        # Memory written by older versions, which have no cached dot products
+        if self.memory_used and self.rh is None:
+            self._convert_memory(n, m)
 
         # Initial iteration, need to create the memory map
         if self.memory_used == 0:
             s = np.memmap(filename=self.s_file, mode="w+", dtype="float32",
-                          shape=(m, n))
+                          shape=(n, m))
             y = np.memmap(filename=self.y_file, mode="w+", dtype="float32",
-                          shape=(m, n))
-            # Store the model and gradient differences in memmaps
-            s[:, 0] = s_k
-            y[:, 0] = y_k
-            self.memory_used = 1
-        # Subsequent iterations will append to memory maps
+                          shape=(n, m))
+            self.rh = np.zeros(n)
+            self.yty = np.zeros(n)
+            self.memory_used = 0
+            self.memory_head = 0
+        # Subsequent iterations overwrite the oldest row of memory
         else:
             s = np.memmap(filename=self.s_file, mode="r+", dtype="float32",
-                          shape=(m, n))
+                          shape=(n, m))
             y = np.memmap(filename=self.y_file, mode="r+", dtype="float32",
-                          shape=(m, n))
-            # Shift all stored memory by one index to make room for latest mem
-            s[:, 1:] = s[:, :-1]
-            y[:, 1:] = y[:, :-1]
-            # Store the latest model and gradient in first index
-            s[:, 0] = s_k
-            y[:, 0] = y_k
-
-            # Keep track of the memory used
-            if self.memory_used < PAR.LBFGSMEM:
-                self.memory_used += 1
+                          shape=(n, m))
+            self.memory_head = (self.memory_head + 1) % n
+
+        # Store the latest model and gradient differences, the iterates for
+        # model m and gradient g, streamed into memory in chunks
+        head = self.memory_head
+        axpy(-1., self.load(self.m_old), self.load(self.m_new), out=s[head],
+             chunk_size=self.chunk_size)
+        axpy(-1., self.load(self.g_old), self.load(self.g_new), out=y[head],
+             chunk_size=self.chunk_size)
+
+        # Cache dot products of the stored (single precision) vectors so that
+        # they do not need to be recomputed each time apply() is called
+        self.rh[head] = 1 / self._dot(y[head], s[head])
+        self.yty[head] = self._dot(y[head], y[head])
+
+        # Keep track of the memory used
+        if self.memory_used < n:
+            self.memory_used += 1
 
         return s, y
 
+    def _convert_memory(self, n, m):
+        """
+        Convert memory written by older versions, which stored one vector
+        per column with the newest vector in the first column, to the ring
+        buffer layout. Columns are copied in chunks of `chunk_size` elements.
+        Memory that does not match the current model or LBFGSMEM is discarded
+
+        :type n: int
+        :param n: number of vectors in memory, PAR.LBFGSMEM
+        :type m: int
+        :param m: length of the model vector
+        """
+        nbytes = n * m * np.dtype("float32").itemsize
+        if not all(os.path.exists(fid) and os.path.getsize(fid) == nbytes
+                   for fid in [self.s_file, self.y_file]):
+            self.logger.info("discarding L-BFGS memory of a different shape")
+            self.memory_used = 0
+            return
+
+        self.logger.info("converting L-BFGS memory to ring buffer layout")
+        kk = min(self.memory_used, n)
+        rows = [-ii % n for ii in range(kk)]
+        for fid in [self.s_file, self.y_file]:
+            old = np.memmap(filename=fid, mode="r", dtype="float32",
+                            shape=(m, n))
+            new = np.memmap(filename=f"{fid}.tmp", mode="w+", dtype="float32",
+                            shape=(n, m))
+            for i in range(0, m, self.chunk_size):
+                new[rows, i:i + self.chunk_size] = \
+                    old[i:i + self.chunk_size, :kk].T
+            new.flush()
+            del old, new
+            os.replace(f"{fid}.tmp", fid)
+
+        s = np.memmap(filename=self.s_file, mode="r", dtype="float32",
+                      shape=(n, m))
+        y = np.memmap(filename=self.y_file, mode="r", dtype="float32",
+                      shape=(n, m))
+        self.rh = np.zeros(n)
+        self.yty = np.zeros(n)
+        for row in rows:
+            self.rh[row] = 1 / self._dot(y[row], s[row])
+            self.yty[row] = self._dot(y[row], y[row])
+        self.memory_used = kk
+        self.memory_head = 0
+
     def apply(self, q, s=None, y=None):
         """
-        Applies L-BFGS inverse Hessian to given vector
+        Applies L-BFGS inverse Hessian to given vector.
+
+        The memmaps are streamed in chunks of `chunk_size` elements. Each pass
+        over the memory rows fuses the vector update of one recursion step with
+        the dot product of the next, so every row is read once per loop.
 
         :type q: np.array
         :param q: gradient direction to apply L-BFGS to
         :type s: np.memmap
         :param s: memory of model differences
-        :param s: memory of model differences
         :type y: np.memmap
         :param y: memory of gradient direction differences
         :rtype r: np.array
@@ -290,22 +381,32 @@ class LBFGS(custom_import("optimize", "base")):
 
         # If no memmaps are given as arguments, instantiate them
         if s is None or y is None:
-            m = len(q)
             n = PAR.LBFGSMEM
-            s = np.memmap(filename=self.s_file, mode="w+", dtype="float32",
-                          shape=(m, n))
-            y = np.memmap(filename=self.y_file, mode="w+", dtype="float32",
-                          shape=(m, n))
+            m = len(q)
+            s = np.memmap(filename=self.s_file, mode="r", dtype="float32",
+                          shape=(n, m))
+            y = np.memmap(filename=self.y_file, mode="r", dtype="float32",
+                          shape=(n, m))
+
+        # Rows of memory ordered from newest to oldest
+        kk = self.memory_used
+        rows = [(self.memory_head - ii) % PAR.LBFGSMEM for ii in range(kk)]
+        chunks = [slice(i, i + self.chunk_size)
+                  for i in range(0, len(q), self.chunk_size)]
 
         # First matrix product
         # Recursion step 2 from appendix A of Modrak & Tromp 2016
-        kk = self.memory_used
-        rh = np.zeros(kk)
+        q = np.array(q, dtype="float64")
         al = np.zeros(kk)
+        al[0] = self.rh[rows[0]] * self._dot(s[rows[0]], q)
         for ii in range(kk):
-            rh[ii] = 1 / np.dot(y[:, ii], s[:, ii])
-            al[ii] = rh[ii] * np.dot(s[:, ii], q)
-            q = q - al[ii] * y[:, ii]
+            sq = 0.
+            for c in chunks:
+                q[c] -= al[ii] * y[rows[ii], c]
+                if ii + 1 < kk:
+                    sq += np.dot(s[rows[ii + 1], c], q[c])
+            if ii + 1 < kk:
+                al[ii + 1] = self.rh[rows[ii + 1]] * sq
 
         # Apply a preconditioner if available
         if self.precond:
@@ -314,18 +415,39 @@ class LBFGS(custom_import("optimize", "base")):
             r = q
 
         # Use scaling M3 proposed by Liu and Nocedal 1989
-        sty = np.dot(y[:, 0], s[:, 0])
-        yty = np.dot(y[:, 0], y[:, 0])
+        sty = 1 / self.rh[rows[0]]
+        yty = self.yty[rows[0]]
         r *= sty/yty
 
         # Second matrix product
         # Recursion step 4 from appendix A of Modrak & Tromp 2016
+        be = self.rh[rows[-1]] * self._dot(y[rows[-1]], r)
         for ii in range(kk - 1, -1, -1):
-            be = rh[ii] * np.dot(y[:, ii], r)
-            r = r + s[:, ii] * (al[ii] - be)
+            yr = 0.
+            for c in chunks:
+                r[c] += s[rows[ii], c] * (al[ii] - be)
+                if ii > 0:
+                    yr += np.dot(y[rows[ii - 1], c], r[c])
+            if ii > 0:
+                be = self.rh[rows[ii - 1]] * yr
 
         return r
 
+    def _dot(self, x, y):
+        """
+        Dot product of two (possibly memory mapped) vectors, computed in
+        chunks of `chunk_size` elements to limit memory usage
+
+        :type x: np.array
+        :param x: vector 1
+        :type y: np.array
+        :param y: vector 2
+        :rtype: float
+        :return: the dot product between `x` and `y`
+        """
+        return sum([np.dot(x[i:i + self.chunk_size], y[i:i + self.chunk_size])
+                    for i in range(0, len(x), self.chunk_size)])
+
     def check_status(self, g, r):
         """
         Check the status of the apply() function, determine if restart necessary
@@ -9,19 +9,24 @@ different optimization algorithms.
 """
 import os
 import sys
+import json
 import logging
 import numpy as np
 
 from seisflows3.tools import msg, unix
-from seisflows3.tools.math import angle, dot
+from seisflows3.tools.vectors import VectorStore, vector_stats
 from seisflows3.plugins import line_search, preconds
-from seisflows3.tools.specfem import check_poissons_ratio
+from seisflows3.tools.specfem import check_poissons_bounds
 from seisflows3.config import SeisFlowsPathsParameters, CFGPATHS
 
 PAR = sys.modules["seisflows_parameters"]
 PATH = sys.modules["seisflows_paths"]
 solver = sys.modules["seisflows_solver"]
 
+# Vectors of the optimization, kept out of the class so that they are not
+# pickled when the optimization module is checkpointed
+_store = None
+
 
 class Base:
     """
@@ -113,6 +118,9 @@ class Base:
         self.p_new = "p_new.npy"
         self.p_old = "p_old.npy"
         self.alpha = "alpha.npy"
+        self.alpha_trials = "alpha_trials.txt"
+        self.f_trials = "f_trials.txt"
+        self.search_state = "line_search.json"
 
     @property
     def required(self):
@@ -143,6 +151,23 @@ class Base:
                docstr="Max allowable step length, as a fraction of "
                       "current model parameters")
 
+        sf.par("OPTIMIZE_CACHE", required=False, default=4, par_type=int,
+               docstr="Number of most recently used optimization vectors, "
+                      "e.g., m_new, g_new, p_new, kept in memory by the "
+                      "master job so that repeated reads do not hit the "
+                      "disk. Vectors are always written to disk. 0 disables "
+                      "the cache")
+
+        sf.par("OPTIMIZE_MMAP", required=False, default=False, par_type=bool,
+               docstr="If True, optimization vectors are memory mapped when "
+                      "read from disk rather than fully read into memory. "
+                      "Useful for large 3D models")
+
+        sf.par("LINESEARCH_NTRIAL", required=False, default=1, par_type=int,
+               docstr="Number of trial step lengths evaluated concurrently "
+                      "at each step of the line search, in one call of "
+                      "system.run(). 1 evaluates one trial step at a time")
+
         # Define the Paths required by this module
         sf.path("OPTIMIZE", required=False,
                 default=os.path.join(PATH.SCRATCH, "optimize"),
@@ -176,6 +201,8 @@ class Base:
         assert 0. < PAR.STEPLENMAX, f"STEPLENMAX must be >= 0."
         assert PAR.STEPLENINIT < PAR.STEPLENMAX, \
             f"STEPLENINIT must be < STEPLENMAX"
+        assert PAR.LINESEARCH_NTRIAL >= 1, f"LINESEARCH_NTRIAL must be >= 1"
+        assert PAR.OPTIMIZE_CACHE >= 0, f"OPTIMIZE_CACHE must be >= 0"
 
     def setup(self):
         """
@@ -234,12 +261,11 @@ class Base:
         """
         self.logger.info(f"computing search direction with {PAR.OPTIMIZE}")
 
-        g_new = self.load(self.g_new)
         if self.precond is not None:
-            p_new = -1 * self.precond(g_new)
+            p_new = -1 * self.precond(self.load(self.g_new))
+            self.save(self.p_new, p_new)
         else:
-            p_new = -1 * g_new
-        self.save(self.p_new, p_new)
+            self.axpy(self.p_new, -1., self.g_new)
 
     def initialize_search(self):
         """
@@ -250,10 +276,11 @@ class Base:
         g = self.load(self.g_new)
         p = self.load(self.p_new)
         f = self.loadtxt(self.f_new)
-        norm_m = max(abs(m))
-        norm_p = max(abs(p))
-        gtg = dot(g, g)
-        gtp = dot(g, p)
+        stats = vector_stats(m=m, g=g, p=p)
+        norm_m = stats["m_max"]
+        norm_p = stats["p_max"]
+        gtg = stats["gtg"]
+        gtp = stats["gtp"]
 
         # Restart plugin line search if the optimization library restarts
         if self.restarted:
@@ -275,11 +302,15 @@ class Base:
             alpha = PAR.STEPLENINIT * norm_m / norm_p
             self.logger.debug(f"manually set initial step length: {alpha:.2E}")
 
+        # Concurrent trial models are written by the workflow on demand
+        if PAR.LINESEARCH_NTRIAL > 1:
+            self.set_trial_steps(alpha)
+            return
+
         # The new model is the old model, scaled by the step direction and
         # gradient threshold to remove any outlier values
-        m_try = m + alpha * p
+        m_try = self.axpy(self.m_try, alpha, self.p_new, self.m_new)
 
-        self.save(self.m_try, m_try)
         self.savetxt(self.alpha, alpha)
         self.check_model(m_try, self.m_try)
 
@@ -288,23 +319,32 @@ class Base:
         Updates line search status and step length and checks if the line search
         has been completed.
 
+        If LINESEARCH_NTRIAL > 1, all concurrently evaluated trial steps are
+        passed to the line search, which accepts the best of them or proposes
+        the next set of trial steps.
+
         Available status codes from line_search.update():
             status == 1  : finished
             status == 0 : not finished
             status == -1  : failed
         """
-        alpha, status = self.line_search.update(
-            iter=self.iter, step_len=self.loadtxt(self.alpha),
-            func_val=self.loadtxt(self.f_try)
-        )
+        if PAR.LINESEARCH_NTRIAL > 1:
+            alpha, status = self.line_search.update_trials(
+                iter=self.iter, step_lens=self.loadtrials(self.alpha_trials),
+                func_vals=self.loadtrials(self.f_trials)
+            )
+        else:
+            alpha, status = self.line_search.update(
+                iter=self.iter, step_len=self.loadtxt(self.alpha),
+                func_val=self.loadtxt(self.f_try)
+            )
 
         # New search direction needs to be searchable on disk
-        if status in [0, 1]:
-            m = self.load(self.m_new)
-            p = self.load(self.p_new)
+        if status == 0 and PAR.LINESEARCH_NTRIAL > 1:
+            self.set_trial_steps(alpha)
+        elif status in [0, 1]:
             self.savetxt(self.alpha, alpha)
-            m_try = m + alpha * p
-            self.save(self.m_try, m_try)
+            m_try = self.axpy(self.m_try, alpha, self.p_new, self.m_new)
             self.check_model(m_try, self.m_try)
 
         return status
@@ -323,53 +363,191 @@ class Base:
         x = self.line_search.search_history()[0]
         f = self.line_search.search_history()[1]
 
-        # Clean scratch directory
+        # Clean scratch directory, through the vector store so that cached
+        # vectors follow their files
         unix.cd(PATH.OPTIMIZE)
+        store = self.vectors()
 
         # Remove the old model parameters
         if self.iter > 1:
             self.logger.info("removing previously accepted model files (old)")
             for fid in [self.m_old, self.f_old, self.g_old, self.p_old]:
-                unix.rm(fid)
+                store.remove(fid)
 
         self.logger.info("shifting current model (new) to previous model (old)")
-        unix.mv(self.m_new, self.m_old)
-        unix.mv(self.f_new, self.f_old)
-        unix.mv(self.g_new, self.g_old)
-        unix.mv(self.p_new, self.p_old)
+        store.move(self.m_new, self.m_old)
+        store.move(self.f_new, self.f_old)
+        store.move(self.g_new, self.g_old)
+        store.move(self.p_new, self.p_old)
 
         self.logger.info("setting accepted line search model as current model")
-        unix.mv(self.m_try, self.m_new)
+        store.move(self.m_try, self.m_new)
         self.savetxt(self.f_new, f.min())
         self.logger.info(f"current misfit is {self.f_new}={f.min():.3E}")
 
         # !!! TODO Describe what stats are being written here
         self.logger.info(f"writing optimization stats to: {CFGPATHS.STATSDIR}")
+        stats = vector_stats(g=g, p=p)
         self.write_stats(self.log_factor, value=
-                         -dot(g, g) ** -0.5 * (f[1] - f[0]) / (x[1] - x[0])
+                         -stats["gtg"] ** -0.5 * (f[1] - f[0]) / (x[1] - x[0])
                          )
-        self.write_stats(self.log_gradient_norm_L1, value=np.linalg.norm(g, 1))
-        self.write_stats(self.log_gradient_norm_L2, value=np.linalg.norm(g, 2))
+        self.write_stats(self.log_gradient_norm_L1, value=stats["g_norm1"])
+        self.write_stats(self.log_gradient_norm_L2, value=stats["g_norm2"])
         self.write_stats(self.log_misfit, value=f[0])
         self.write_stats(self.log_restarted, value=self.restarted)
         self.write_stats(self.log_slope, value=(f[1] - f[0]) / (x[1] - x[0]))
         self.write_stats(self.log_step_count, value=self.line_search.step_count)
         self.write_stats(self.log_step_length, value=x[f.argmin()])
         self.write_stats(self.log_theta,
-                         value=180. * np.pi ** -1 * angle(p, -g))
+                         value=180. * np.pi ** -1 * stats["theta"])
 
         self.logger.info("resetting line search step count to 0")
         self.line_search.step_count = 0
 
+    @property
+    def ntrial(self):
+        """
+        Number of trial models to be evaluated at the current step of the
+        line search, which is always 1 unless LINESEARCH_NTRIAL > 1
+        """
+        if PAR.LINESEARCH_NTRIAL > 1:
+            return len(self.loadtrials(self.alpha_trials))
+        else:
+            return 1
+
+    def set_trial_steps(self, alpha):
+        """
+        Spread concurrent trial step lengths around the step length
+        calculated by the line search and write them to disk, where they are
+        read by trial_model() and update_search()
+
+        :type alpha: float
+        :param alpha: step length calculated by the line search
+        """
+        alphas = self.line_search.trial_steps(alpha, PAR.LINESEARCH_NTRIAL)
+        self.savetrials(self.alpha_trials, alphas)
+
+        alpha_str = ", ".join([f"{_:.2E}" for _ in alphas])
+        self.logger.info(f"trial step lengths: {alpha_str}")
+
+    def trial_model(self, i):
+        """
+        Returns the i'th trial model of a concurrent line search step
+
+        :type i: int
+        :param i: index of the trial step length
+        :rtype: np.array
+        :return: trial model m_new + alpha_i * p_new
+        """
+        alpha = self.loadtrials(self.alpha_trials)[i]
+        m_try = self.axpy(self.m_try, alpha, self.p_new, self.m_new)
+        self.check_model(m_try, f"{self.m_try}[{i}]")
+
+        return m_try
+
+    def write_search_state(self, step):
+        """
+        Persist a compact record of the line search after each step of the
+        workflow's line search, so that an interrupted line search can be
+        resumed with resume_search() without re-running completed trial steps.
+
+        Steps of the line search are: 'initialize', 'evaluate' (the pending
+        trial step lengths), 'update' (the pending trial steps have been
+        evaluated), 'finalize' and 'done'
+
+        :type step: str
+        :param step: the next step of the line search
+        """
+        state = {"iter": self.iter, "step": step, **self.line_search.state}
+        if step in ["evaluate", "update"]:
+            state["alpha"] = self._pending(self.alpha, self.alpha_trials)
+        if step == "update":
+            state["misfits"] = self._pending(self.f_try, self.f_trials)
+
+        fid = os.path.join(PATH.OPTIMIZE, self.search_state)
+        with open(f"{fid}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{fid}.tmp", fid)
+
+    def resume_search(self):
+        """
+        Determine the next step of the line search. If a line search of the
+        current iteration was interrupted, the line search history is rebuilt
+        from the record written by write_search_state(), and its pending step
+        lengths and function evaluations are restored to disk
+
+        :rtype: str
+        :return: the next step of the line search, see write_search_state()
+        """
+        fid = os.path.join(PATH.OPTIMIZE, self.search_state)
+        if os.path.exists(fid):
+            with open(fid) as f:
+                state = json.load(f)
+            if state["iter"] == self.iter and state["step"] != "done":
+                self.line_search.load_state(state)
+                if "alpha" in state:
+                    self._restore(self.alpha, self.alpha_trials,
+                                  state["alpha"])
+                if "misfits" in state:
+                    self._restore(self.f_try, self.f_trials,
+                                  state["misfits"])
+                self.logger.info(f"resuming line search at step "
+                                 f"'{state['step']}' ({self.eval_str})")
+                return state["step"]
+
+        if self.line_search.step_count == 0:
+            return "initialize"
+        else:
+            return "evaluate"
+
+    def clear_search_state(self):
+        """
+        Remove the line search record so that the next line search starts
+        from the line search history held in memory
+        """
+        unix.rm(os.path.join(PATH.OPTIMIZE, self.search_state))
+
+    def _pending(self, filename, filename_trials):
+        """
+        Read the values of the pending trial step(s) from disk
+
+        :type filename: str
+        :param filename: file holding the value of a single trial step
+        :type filename_trials: str
+        :param filename_trials: file holding one value per concurrent trial
+        :rtype: list of float
+        :return: one value per pending trial step
+        """
+        if PAR.LINESEARCH_NTRIAL > 1:
+            return self.loadtrials(filename_trials).tolist()
+        else:
+            return [self.loadtxt(filename)]
+
+    def _restore(self, filename, filename_trials, values):
+        """
+        Write the values of the pending trial step(s) back to disk, inverse of
+        _pending()
+
+        :type filename: str
+        :param filename: file holding the value of a single trial step
+        :type filename_trials: str
+        :param filename_trials: file holding one value per concurrent trial
+        :type values: list of float
+        :param values: one value per pending trial step
+        """
+        if PAR.LINESEARCH_NTRIAL > 1:
+            self.savetrials(filename_trials, values)
+        else:
+            self.savetxt(filename, values[0])
+
     def retry_status(self):
         """
         After a failed line search, this determines if restart is worthwhile
         by checking, in effect, if the search direction was the same as gradient
         direction
         """
-        g = self.load(self.g_new)
-        p = self.load(self.p_new)
-        theta = angle(p, -g)
+        theta = vector_stats(g=self.load(self.g_new),
+                             p=self.load(self.p_new))["theta"]
 
         self.logger.debug(f"theta: {theta:6.3f}")
 
@@ -390,8 +568,7 @@ class Base:
         """
         # Steepest descent (base) does not need to be restarted
         if PAR.OPTIMIZE != "base":
-            g = self.load(self.g_new)
-            self.save(self.p_new, -g)
+            self.axpy(self.p_new, -1., self.g_new)
             self.line_search.clear_history()
             self.restarted = 1
 
@@ -438,55 +615,89 @@ class Base:
         :type tag: str
         :param tag: tag of the model to be used for more specific error msgs
         """
-        # Dynamic way to split up the model based on number of params
-        pars = {}
-        for i, par in enumerate(solver.parameters):
-            pars[par] = np.split(m, len(solver.parameters))[i]
+        # Bounds of each model parameter, split up as by the solver
+        stats = vector_stats(m=m, parameters=solver.parameters)
+        bounds = dict(stats["bounds"])
 
         # Check Poisson's ratio, which will error our SPECFEM if outside limits
-        if (pars["vp"] is not None) and (pars["vs"] is not None):
+        if "pr" in stats:
             self.logger.debug(f"checking poissons ratio for: '{tag}'")
-            pars["pr"] = check_poissons_ratio(vp=pars["vp"], vs=pars["vs"])
-            if pars["pr"].min() < 0:
+            bounds["pr"] = stats["pr"]
+            check_poissons_bounds(pmin=stats["pr"][0], pmax=stats["pr"][1])
+            if stats["pr"][0] < 0:
                 self.logger.warning("minimum poisson's ratio is negative")
 
         # Tell the User min and max values of the updated model
         self.logger.info(f"model parameters ({tag} {self.eval_str}):")
         parts = "{minval:.2f} <= {key} <= {maxval:.2f}"
-        for key, vals in pars.items():
-            self.logger.info(parts.format(minval=vals.min(), key=key,
-                                          maxval=vals.max())
+        for key, (minval, maxval) in bounds.items():
+            self.logger.info(parts.format(minval=minval, key=key,
+                                          maxval=maxval)
                              )
 
+    @staticmethod
+    def vectors():
+        """
+        The store of optimization vectors in PATH.OPTIMIZE, which is created
+        on first use, and again if its path or parameters change
+
+        :rtype: seisflows3.tools.vectors.VectorStore
+        :return: store of optimization vectors
+        """
+        global _store
+        if _store is None or (_store.path, _store.maxsize, _store.mmap) != \
+                (PATH.OPTIMIZE, PAR.OPTIMIZE_CACHE, PAR.OPTIMIZE_MMAP):
+            _store = VectorStore(path=PATH.OPTIMIZE,
+                                 maxsize=PAR.OPTIMIZE_CACHE,
+                                 mmap=PAR.OPTIMIZE_MMAP)
+        return _store
+
     @staticmethod
     def load(filename):
         """
-        Convenience function to reads vectors from disk as Numpy files,
-        reads directly from PATH.OPTIMIZE. Works around Numpy's behavior of
-        appending '.npy' to files that it saves.
+        Convenience function to reads vectors from PATH.OPTIMIZE as Numpy
+        files. Vectors that were recently read or written are returned from
+        memory, see OPTIMIZE_CACHE.
 
         :type filename: str
         :param filename: filename to read from
         :rtype: np.array
-        :return: vector read from disk
+        :return: read-only vector
         """
-        fid = os.path.join(PATH.OPTIMIZE, filename)
-        if not os.path.exists(fid):
-            fid += ".npy"
-        return np.load(fid)
+        return Base.vectors().load(filename)
 
     @staticmethod
     def save(filename, array):
         """
-        Convenience function to write vectors to disk as numpy files.
-        Reads directly from PATH.OPTIMIZE
+        Convenience function to write vectors to PATH.OPTIMIZE as numpy files.
+        A read-only view of the array is kept in memory for subsequent reads
 
         :type filename: str
-        :param filename: filename to read from
+        :param filename: filename to write to
         :type array: np.array
         :param array: array to be saved
         """
-        np.save(os.path.join(PATH.OPTIMIZE, filename), array)
+        Base.vectors().save(filename, array)
+
+    @staticmethod
+    def axpy(filename, alpha, x, y=None):
+        """
+        Convenience function to write `alpha` * `x` + `y` to PATH.OPTIMIZE,
+        e.g., a trial model m_try = m_new + alpha * p_new. Computed in chunks,
+        which are streamed to disk if OPTIMIZE_MMAP is set
+
+        :type filename: str
+        :param filename: filename to write to
+        :type alpha: float
+        :param alpha: scale factor of `x`
+        :type x: str
+        :param x: filename of the vector to scale
+        :type y: str
+        :param y: filename of the vector to add, optional
+        :rtype: np.array
+        :return: read-only result
+        """
+        return Base.vectors().axpy(filename, alpha, x, y)
 
     @staticmethod
     def loadtxt(filename):
@@ -518,4 +729,28 @@ class Base:
             filename += ".txt"
         np.savetxt(os.path.join(PATH.OPTIMIZE, filename), [scalar], "%11.6e")
 
+    @staticmethod
+    def loadtrials(filename):
+        """
+        Reads one value per trial step from the optimize directory on disk
+
+        :type filename: str
+        :param filename: filename to read from
+        :rtype: np.array
+        :return: values read from disk
+        """
+        return np.loadtxt(os.path.join(PATH.OPTIMIZE, filename), ndmin=1)
+
+    @staticmethod
+    def savetrials(filename, values):
+        """
+        Writes one value per trial step to the optimize directory on disk
+
+        :type filename: str
+        :param filename: filename to write to
+        :type values: np.array
+        :param values: values to write to disk
+        """
+        np.savetxt(os.path.join(PATH.OPTIMIZE, filename), values, "%11.6e")
+
 
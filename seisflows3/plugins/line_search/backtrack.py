@@ -3,6 +3,7 @@
 This is the subclass class for seisflows.plugins.line_search.backtrack
 """
 import logging
+import numpy as np
 
 from seisflows3.tools import msg
 from seisflows3.plugins.line_search.bracket import Bracket
@@ -88,6 +89,28 @@ class Backtrack(Bracket):
 
         return alpha, status
 
+    def trial_steps(self, alpha, ntrial):
+        """
+        Backtracking only ever reduces the step length, so concurrent trial
+        steps decrease from `alpha` by powers of the golden ratio, e.g., for 3
+        trials: [0.382 * alpha, 0.618 * alpha, alpha]. Falls back to
+        the bracketing trial steps while the line search is bracketing
+
+        :type alpha: float
+        :param alpha: step length calculated by the line search
+        :type ntrial: int
+        :param ntrial: number of trial step lengths
+        :rtype: np.array
+        :return: sorted, unique trial step lengths
+        """
+        update_count = self.search_history()[5]
+        if update_count == 0:
+            return super().trial_steps(alpha, ntrial)
+
+        steps = [alpha * 0.618034 ** i for i in range(ntrial)]
+
+        return np.unique(np.clip(steps, None, self.step_len_max))
+
     @staticmethod
     def _check_decrease(step_lens, func_vals, c=1.e-4):
         """
@@ -130,6 +130,88 @@ class Base:
 
         return alpha, status
 
+    def update_trials(self, iter, step_lens, func_vals):
+        """
+        Update search history with a number of concurrently evaluated trial
+        steps and calculate a new step length from all of them at once. The
+        step count is expected to have been increased by the number of trials
+
+        :type iter: int
+        :param iter: current iteration defined by OPTIMIZE.iter
+        :type step_lens: np.array
+        :param step_lens: trial step lengths determined by optimization
+        :type func_vals: np.array
+        :param func_vals: evaluations of the objective function, one per trial
+        :rtype alpha: float
+        :return alpha: the calculated trial step length
+        :rtype status: int
+        :return status: current status of the line search
+        """
+        for step_len, func_val in zip(step_lens, func_vals):
+            self.step_lens += [float(step_len)]
+            self.func_vals += [float(func_val)]
+            self.write_log(iter=iter, step_len=step_len, func_val=func_val)
+
+        # Call calcuate step, must be implemented by subclass
+        alpha, status = self.calculate_step()
+
+        return alpha, status
+
+    def trial_steps(self, alpha, ntrial):
+        """
+        Spread a number of trial step lengths around the step length `alpha`
+        so that they can be evaluated concurrently. Alternates between
+        increasing and decreasing `alpha` by powers of the golden ratio,
+        mirroring the bracketing rules, e.g., for 4 trials:
+        [0.618 * alpha, alpha, 1.618 * alpha, 2.618 * alpha]
+
+        :type alpha: float
+        :param alpha: step length calculated by the line search
+        :type ntrial: int
+        :param ntrial: number of trial step lengths
+        :rtype: np.array
+        :return: sorted, unique trial step lengths, which are fewer than
+            `ntrial` if the step length safeguard caps some of them
+        """
+        steps = [alpha]
+        for i in range(1, ntrial):
+            power = (i + 1) // 2
+            if i % 2:
+                steps.append(alpha * 1.618034 ** power)
+            else:
+                steps.append(alpha * 0.618034 ** power)
+
+        return np.unique(np.clip(steps, None, self.step_len_max))
+
+    @property
+    def state(self):
+        """
+        A compact, JSON serializable record of the line search history, from
+        which the history can be rebuilt with load_state()
+
+        :rtype: dict
+        :return: step count, step lengths, function values and dot products
+        """
+        return {"step_count": self.step_count,
+                "step_lens": [float(_) for _ in self.step_lens],
+                "func_vals": [float(_) for _ in self.func_vals],
+                "gtg": [float(_) for _ in self.gtg],
+                "gtp": [float(_) for _ in self.gtp]}
+
+    def load_state(self, state):
+        """
+        Rebuild the line search history from a record written by `state`,
+        e.g., to resume a line search that was interrupted mid-search
+
+        :type state: dict
+        :param state: record of the line search history
+        """
+        self.step_count = state["step_count"]
+        self.step_lens = list(state["step_lens"])
+        self.func_vals = list(state["func_vals"])
+        self.gtg = list(state["gtg"])
+        self.gtp = list(state["gtp"])
+
     def clear_history(self):
         """
         Clears internal line search history
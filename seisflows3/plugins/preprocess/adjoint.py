@@ -14,9 +14,8 @@ All functions defined have four required positional arguments
     :param dt: time step in sec
 """
 import numpy as np
-from scipy.signal import hilbert as analytic
 
-from seisflows3.tools.math import hilbert
+from seisflows3.tools.math import hilbert, analytic_signal as analytic
 from seisflows3.plugins.preprocess import misfit
 
 
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Batched misfit and adjoint source functions used by the 'default' preprocess
+class. These are vectorized equivalents of the functions defined in
+seisflows3.plugins.preprocess.misfit and seisflows3.plugins.preprocess.adjoint
+which operate on all traces of a stream at once. The analytic signal of each
+input array is computed once, with a single FFT-based Hilbert transform along
+the time axis, and shared between the misfit and adjoint source calculations.
+
+All functions defined have four required positional arguments
+
+    :type syn: np.array
+    :param syn: synthetic data array with shape (ntrace, nt)
+    :type obs: np.array
+    :param obs: observed data array with shape (ntrace, nt)
+    :type nt: int
+    :param nt: number of time steps in the data array
+    :type dt: float
+    :param dt: time step in sec
+
+and return a tuple of (residuals, adjoint sources) with shapes (ntrace,) and
+(ntrace, nt) respectively.
+"""
+import numpy as np
+
+from seisflows3.tools.math import analytic_signal
+
+
+def analytic(w):
+    """
+    Batched analytic signal, computed with one FFT along the time axis for
+    all traces. Shares the analytic signal cache used by the per-trace
+    functions
+
+    :type w: np.array
+    :param w: real signal data with shape (ntrace, nt)
+    :rtype: np.array
+    :return: complex analytic signal with shape (ntrace, nt)
+    """
+    return analytic_signal(w, axis=-1)
+
+
+def waveform(syn, obs, nt, dt, *args, **kwargs):
+    """
+    Direct waveform differencing, adjoint source from Tromp et al 2005 Eq 9
+
+    :type syn: np.array
+    :param syn: synthetic data array
+    :type obs: np.array
+    :param obs: observed data array
+    :type nt: int
+    :param nt: number of time steps in the data array
+    :type dt: float
+    :param dt: time step in sec
+    """
+    wrsd = syn - obs
+    residuals = np.sqrt(np.sum(wrsd * wrsd * dt, axis=-1))
+
+    return residuals, wrsd
+
+
+def envelope(syn, obs, nt, dt, eps=0.05, *args, **kwargs):
+    """
+    Waveform envelope difference from Yuan et al. 2015 Eq. 9 with adjoint
+    source from Eq. 16
+
+    :type syn: np.array
+    :param syn: synthetic data array
+    :type obs: np.array
+    :param obs: observed data array
+    :type nt: int
+    :param nt: number of time steps in the data array
+    :type dt: float
+    :param dt: time step in sec
+    """
+    analytic_syn = analytic(syn)
+    env_syn = np.abs(analytic_syn)
+    env_obs = np.abs(analytic(obs))
+
+    # Residual of envelopes
+    env_rsd = env_syn - env_obs
+    residuals = np.sqrt(np.sum(env_rsd * env_rsd * dt, axis=-1))
+
+    env_tmp = env_rsd / (env_syn + eps * env_syn.max(axis=-1, keepdims=True))
+    wadj = env_tmp * syn - np.imag(analytic(env_tmp * np.imag(analytic_syn)))
+
+    return residuals, wadj
+
+
+def instantaneous_phase(syn, obs, nt, dt, eps=0.05, *args, **kwargs):
+    """
+    Instantaneous phase difference from Bozdag et al. 2011 with adjoint
+    source from Eq. 27
+
+    :type syn: np.array
+    :param syn: synthetic data array
+    :type obs: np.array
+    :param obs: observed data array
+    :type nt: int
+    :param nt: number of time steps in the data array
+    :type dt: float
+    :param dt: time step in sec
+    """
+    analytic_syn = analytic(syn)
+    analytic_obs = analytic(obs)
+
+    phi_syn = np.arctan2(np.imag(analytic_syn), np.real(analytic_syn))
+    phi_obs = np.arctan2(np.imag(analytic_obs), np.real(analytic_obs))
+
+    phi_rsd = phi_syn - phi_obs
+    residuals = np.sqrt(np.sum(phi_rsd * phi_rsd * dt, axis=-1))
+
+    env_syn = np.abs(analytic_syn)
+    env_max = np.max(env_syn ** 2., axis=-1, keepdims=True)
+    denom = env_syn ** 2. + eps * env_max
+
+    wadj_1 = phi_rsd * np.imag(analytic_syn) / denom
+    wadj_2 = np.imag(analytic(phi_rsd * syn / denom))
+
+    return residuals, wadj_1 + wadj_2
+
+
+def traveltime(syn, obs, nt, dt, *args, **kwargs):
+    """
+    Cross-correlation traveltime, adjoint source from Tromp et al. 2005 Eq. 45.
+    Cross-correlations for all traces are computed with one FFT convolution
+
+    :type syn: np.array
+    :param syn: synthetic data array
+    :type obs: np.array
+    :param obs: observed data array
+    :type nt: int
+    :param nt: number of time steps in the data array
+    :type dt: float
+    :param dt: time step in sec
+    """
+    from scipy.signal import fftconvolve
+
+    cc = np.abs(fftconvolve(obs, syn[:, ::-1], axes=-1))
+    residuals = (np.argmax(cc, axis=-1) - nt + 1) * dt
+
+    return residuals, _traveltime_adjoint(syn, nt, dt, residuals)
+
+
+def traveltime_inexact(syn, obs, nt, dt, *args, **kwargs):
+    """
+    A faster cc traveltime function but possibly innacurate
+
+    :type syn: np.array
+    :param syn: synthetic data array
+    :type obs: np.array
+    :param obs: observed data array
+    :type nt: int
+    :param nt: number of time steps in the data array
+    :type dt: float
+    :param dt: time step in sec
+    """
+    residuals = (np.argmax(obs, axis=-1) - np.argmax(syn, axis=-1)) * dt
+
+    return residuals, _traveltime_adjoint(syn, nt, dt, residuals)
+
+
+def _traveltime_adjoint(syn, nt, dt, residuals):
+    """
+    Normalized time derivative of the synthetics scaled by the traveltime
+    residuals, shared by the traveltime adjoint sources
+
+    :type syn: np.array
+    :param syn: synthetic data array
+    :type nt: int
+    :param nt: number of time steps in the data array
+    :type dt: float
+    :param dt: time step in sec
+    :type residuals: np.array
+    :param residuals: traveltime residual for each trace
+    """
+    wadj = np.zeros((len(syn), nt))
+    wadj[:, 1:-1] = (syn[:, 2:] - syn[:, 0:-2]) / (2. * dt)
+    wadj *= 1. / (np.sum(wadj * wadj, axis=-1, keepdims=True) * dt)
+    wadj *= residuals[:, np.newaxis]
+
+    return wadj
@@ -15,7 +15,8 @@ All functions defined have four required positional arguments
     :param dt: time step in sec
 """
 import numpy as np
-from scipy.signal import hilbert as analytic
+
+from seisflows3.tools.math import analytic_signal as analytic
 
 
 def waveform(syn, obs, nt, dt, *args, **kwargs):
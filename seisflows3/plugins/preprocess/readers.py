@@ -3,12 +3,11 @@ SeisFlows uses obspy stream objects for holding and processing seismic data.
 In some cases, obspy.read doesn't provide the desired behavior, so we
 introduce an additonal level of indirection
 
-Used by the PREPROCESS class and specified by the READER parameter
+Used by the PREPROCESS class and specified by the READER parameter.
+ObsPy is imported by each reader so that it is only loaded once data are read
 """
 import os
 from numpy import loadtxt
-from obspy import read 
-from obspy.core import Stream, Stats, Trace
 
 
 def su(path, filename):
@@ -20,6 +19,8 @@ def su(path, filename):
     :type filename: str
     :param filename: file to read
     """
+    from obspy import read
+
     st = read(os.path.join(path, filename), format='SU', byteorder='<')
     
     return st
@@ -34,6 +35,8 @@ def ascii(path, filename):
     :type filenames: list
     :param filenames: files to read
     """
+    from obspy.core import Stream, Stats, Trace
+
     st = Stream()
     stats = Stats()
 
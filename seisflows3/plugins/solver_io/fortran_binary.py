@@ -7,7 +7,7 @@ from shutil import copyfile
 from seisflows3.tools.wrappers import iterable
 
 
-def read_slice(path, parameters, iproc):
+def read_slice(path, parameters, iproc, mmap=False):
     """ 
     Reads SPECFEM model slice(s)
     
@@ -17,15 +17,23 @@ def read_slice(path, parameters, iproc):
     :param parameters: parameters to read, e.g. 'vs', 'vp'
     :type iproc: int
     :param iproc: processor/slice number to read
+    :type mmap: bool
+    :param mmap: return read-only memory-mapped views of the files rather than
+        reading their contents into memory. Each view holds an open file
+        descriptor until it is garbage collected, so callers should copy the
+        data they need and drop the views, see solver.base.Base.load()
     """
     vals = []
     for key in iterable(parameters):
         filename = os.path.join(path, f"proc{int(iproc):06d}_{key}.bin")
-        vals += [_read(filename)]
+        if mmap:
+            vals += [_read_mmap(filename)]
+        else:
+            vals += [_read(filename)]
     return vals
 
 
-def write_slice(data, path, parameters, iproc):
+def write_slice(data, path, parameters, iproc, mmap=False):
     """ 
     Writes SPECFEM model slice
 
@@ -37,10 +45,16 @@ def write_slice(data, path, parameters, iproc):
     :param parameters: parameters to write, e.g. 'vs', 'vp'
     :type iproc: int
     :param iproc: processor/slice number to write
+    :type mmap: bool
+    :param mmap: write the data in place through a memory map of a
+        preallocated file rather than through a temporary float32 copy
     """
     for key in iterable(parameters):
         filename = os.path.join(path, f"proc{int(iproc):06d}_{key}.bin")
-        _write(data, filename)
+        if mmap:
+            _write_mmap(data, filename)
+        else:
+            _write(data, filename)
 
 
 def copy_slice(src, dst, iproc, parameter):
@@ -57,6 +71,7 @@ def copy_slice(src, dst, iproc, parameter):
     :param iproc: processor/slice number to copy
     """
     filename = f"proc{int(iproc):06d}_{parameter}.bin"
+    _unlink_shared(os.path.join(dst, filename))
     copyfile(os.path.join(src, filename), 
              os.path.join(dst, filename))
 
@@ -89,8 +104,77 @@ def _write(v, filename):
     n = np.array([4 * len(v)], dtype='int32')
     v = np.array(v, dtype='float32')
 
+    _unlink_shared(filename)
     with open(filename, 'wb') as file:
         n.tofile(file)
         v.tofile(file)
         n.tofile(file)
 
+
+def _read_mmap(filename, mode="r"):
+    """
+    Memory maps Fortran style binary data without reading it into memory.
+    The returned array is a view that skips the leading and trailing record
+    markers, so only the pages that are actually accessed are read from disk
+
+    :type filename: str
+    :param filename: Fortran binary file to map
+    :type mode: str
+    :param mode: memory map mode, 'r' for read-only or 'r+' for read-write
+    :rtype: np.memmap
+    :return: float32 view of the data record
+    """
+    nbytes = os.path.getsize(filename)
+    n = np.fromfile(filename, dtype="int32", count=1)[0]
+
+    if n == nbytes - 8:
+        return np.memmap(filename, dtype="float32", mode=mode, offset=4,
+                         shape=(n // 4,))
+    else:
+        return np.memmap(filename, dtype="float32", mode=mode)
+
+
+def _write_mmap(v, filename):
+    """
+    Writes Fortran style binary files in place through a memory map.
+    The file is preallocated (or reused if it already has the correct size),
+    the record markers are written directly and the data are cast to single
+    precision as they are copied into the mapped region
+
+    :type v: np.array
+    :param v: data to write
+    :type filename: str
+    :param filename: Fortran binary file to write to
+    """
+    n = len(v)
+    nbytes = 4 * n + 8
+    marker = np.array([4 * n], dtype="int32").tobytes()
+
+    _unlink_shared(filename)
+    if not (os.path.exists(filename) and os.path.getsize(filename) == nbytes):
+        with open(filename, "wb") as file:
+            file.truncate(nbytes)
+
+    with open(filename, "r+b") as file:
+        file.write(marker)
+        file.seek(nbytes - 4)
+        file.write(marker)
+
+    if n:
+        data = np.memmap(filename, dtype="float32", mode="r+", offset=4,
+                         shape=(n,))
+        data[:] = v
+        data.flush()
+        del data
+
+
+def _unlink_shared(filename):
+    """
+    Removes a file that is hardlinked to other files before it is rewritten,
+    so that writing does not modify the data seen through the other links
+
+    :type filename: str
+    :param filename: file that is about to be written
+    """
+    if os.path.isfile(filename) and os.stat(filename).st_nlink > 1:
+        os.remove(filename)
@@ -7,14 +7,16 @@ and write adjoint sources that are expected by the solver.
 """
 import os
 import sys
-import obspy
+import json
+import hashlib
 import logging
 import numpy as np
 
 from seisflows3.tools import msg
 from seisflows3.tools import signal, unix
-from seisflows3.tools.wrappers import exists
-from seisflows3.plugins.preprocess import adjoint, misfit, readers, writers
+from seisflows3.tools.math import analytic_signal
+from seisflows3.plugins.preprocess import (adjoint, batched, misfit, readers,
+                                          writers)
 from seisflows3.config import SeisFlowsPathsParameters
 
 PAR = sys.modules["seisflows_parameters"]
@@ -38,6 +40,7 @@ class Base:
         """
         self.misfit = None
         self.adjoint = None
+        self.batched = None
         self.reader = None
         self.writer = None
 
@@ -102,6 +105,20 @@ class Base:
                       "TNORML1: normalize per trace by L1 of itself; OR"
                       "TNORML2: normalize per trace by L2 of itself")
 
+        sf.par("BATCH_MISFIT", required=False, default=True, par_type=bool,
+               docstr="If True, residuals and adjoint sources are calculated "
+                      "for all traces of a stream at once using the "
+                      "vectorized functions in "
+                      "seisflows.plugins.preprocess.batched, when available "
+                      "for the chosen MISFIT. If False, or if not available, "
+                      "traces are processed one at a time")
+
+        sf.par("CACHE_OBS", required=False, default=False, par_type=bool,
+               docstr="If True, processed (filtered, muted, normalized) "
+                      "observed data are cached as .npz files in each solver "
+                      "directory the first time they are used, so that "
+                      "subsequent evaluations only need to process synthetics")
+
         # TODO: Add the mute parameters here, const, slope and dist
 
         return sf
@@ -195,6 +212,8 @@ class Base:
             self.logger.debug(f"misfit function is: '{PAR.MISFIT}'")
             self.misfit = getattr(misfit, PAR.MISFIT.lower())
             self.adjoint = getattr(adjoint, PAR.MISFIT.lower())
+            if PAR.BATCH_MISFIT:
+                self.batched = getattr(batched, PAR.MISFIT.lower(), None)
         elif PAR.BACKPROJECT:
             self.logger.debug(f"backproject function is: '{PAR.BACKPROJECT}'")
             self.adjoint = getattr(adjoint, PAR.BACKPROJECT.lower())
@@ -226,31 +245,33 @@ class Base:
         if taskid == 0:
             self.logger.debug("preparing files for gradient evaluation")
 
+        residuals = []
+        ncomputed, navoided = 0, 0
+        if PAR.CACHE_OBS:
+            os.makedirs(os.path.join(cwd, "traces", "obs_cache"), exist_ok=True)
+
         for filename in filenames:
-            obs = self.reader(path=os.path.join(cwd, "traces", "obs"),
-                              filename=filename)
             syn = self.reader(path=os.path.join(cwd, "traces", "syn"),
                               filename=filename)
-
-            # Process observations and synthetics identically
-            if PAR.FILTER:
-                if taskid == 0:
-                    self.logger.debug(f"applying {PAR.FILTER} filter to data")
-                obs = self._apply_filter(obs)
-                syn = self._apply_filter(syn)
-            if PAR.MUTE:
-                if taskid == 0:
-                    self.logger.debug(f"applying {PAR.MUTE} mutes to data")
-                obs = self._apply_mute(obs)
-                syn = self._apply_mute(syn)
-            if PAR.NORMALIZE:
-                if taskid == 0:
-                    self.logger.debug(f"normalizing data with: {PAR.NORMALIZE}")
-                obs = self._apply_normalize(obs)
-                syn = self._apply_normalize(syn)
-
+            syn = self._apply_processing(syn, taskid)
+
+            # Observations only need to be processed once per event, after
+            # which they can be retrieved from the cache
+            obs = self._read_cached_obs(cwd, filename, template=syn, **kwargs)
+            if obs is None:
+                obs = self.reader(path=os.path.join(cwd, "traces", "obs"),
+                                  filename=filename)
+                obs = self._apply_processing(obs, taskid)
+                self._write_cached_obs(cwd, filename, obs, **kwargs)
+
+            # Analytic signals are cached while the misfit and adjoint sources
+            # of this file are calculated, so that they share their transforms
+            with analytic_signal:
+                residuals_, adjoints = self._calculate_misfit(syn, obs)
+            ncomputed += analytic_signal.computed
+            navoided += analytic_signal.avoided
             if PAR.MISFIT is not None:
-                self._write_residuals(cwd, syn, obs)
+                residuals += residuals_
 
             # Write the adjoint traces. Rename file extension for Specfem
             if PAR.FORMAT.upper() == "ASCII":
@@ -261,8 +282,18 @@ class Base:
                 # TODO implement this
                 raise NotImplementedError
 
-            self._write_adjoint_traces(path=os.path.join(cwd, "traces", "adj"),
-                                      syn=syn, obs=obs, filename=filename_out)
+            self._write_adjoint_traces(
+                path=os.path.join(cwd, "traces", "adj"), syn=syn,
+                adjoints=adjoints, filename=filename_out
+            )
+
+        # All residuals for this evaluation are written at once
+        if PAR.MISFIT is not None:
+            self._write_residuals(cwd, residuals)
+
+        if taskid == 0 and (ncomputed or navoided):
+            self.logger.debug(f"analytic signal cache: {ncomputed} transforms "
+                              f"computed, {navoided} avoided")
 
         # Copy over the STATIONS file to STATIONS_ADJOINT required by Specfem
         # ASSUMING that all stations are used in adjoint simulation
@@ -275,15 +306,34 @@ class Base:
         Sums squares of residuals
 
         :type files: str
-        :param files: list of single-column text files containing residuals
+        :param files: list of residual files written by _write_residuals()
         :rtype: float
         :return: sum of squares of residuals
         """
         total_misfit = 0.
         for filename in files:
-            total_misfit += np.sum(np.loadtxt(filename) ** 2.)
+            residuals = self.read_residuals(filename)
+            total_misfit += np.dot(residuals, residuals)
+
+        return float(total_misfit)
+
+    @staticmethod
+    def read_residuals(filename):
+        """
+        Reads a residuals file, which is stored in NumPy's binary .npy format.
+        Single-column text files written by older versions are also accepted
 
-        return total_misfit
+        :type filename: str
+        :param filename: residuals file to read
+        :rtype: np.array
+        :return: residuals
+        """
+        with open(filename, "rb") as f:
+            if f.read(6) == b"\x93NUMPY":
+                f.seek(0)
+                return np.load(f)
+
+        return np.loadtxt(filename)
 
     def finalize(self):
         """
@@ -292,51 +342,198 @@ class Base:
         """
         pass
 
-    def _write_residuals(self, path, syn, obs):
+    def _apply_processing(self, st, taskid=None):
         """
-        Computes residuals between observed and synthetic seismogram based on
-        the misfit function PAR.MISFIT. Saves the residuals for each
-        data-synthetic pair into a text file located at:
+        Apply the User-chosen filter, mutes and normalization to a stream.
+        Observations and synthetics are processed identically.
 
-        ./scratch/solver/*/residuals
+        :type st: obspy.core.stream.Stream
+        :param st: stream to process
+        :type taskid: int
+        :param taskid: task id used to restrict logging to the first task
+        :rtype: obspy.core.stream.Stream
+        :return: processed stream
+        """
+        if PAR.FILTER:
+            if taskid == 0:
+                self.logger.debug(f"applying {PAR.FILTER} filter to data")
+            st = self._apply_filter(st)
+        if PAR.MUTE:
+            if taskid == 0:
+                self.logger.debug(f"applying {PAR.MUTE} mutes to data")
+            st = self._apply_mute(st)
+        if PAR.NORMALIZE:
+            if taskid == 0:
+                self.logger.debug(f"normalizing data with: {PAR.NORMALIZE}")
+            st = self._apply_normalize(st)
 
-        The resulting file will be a single-column ASCII file that needs to be
-        summed before use by the solver
+        return st
+
+    def _cached_obs_filename(self, cwd, filename, source_name=None, **kwargs):
+        """
+        Returns the cache file for processed observations. The key hashes the
+        event, the data filename (including its size and modification time,
+        so that replaced data are never served from the cache) and every
+        parameter that affects processing.
+
+        :type cwd: str
+        :param cwd: solver working directory
+        :type filename: str
+        :param filename: name of the observed data file in traces/obs
+        :type source_name: str
+        :param source_name: name of the event the data belongs to
+        :rtype: str or None
+        :return: path to the .npz cache file, or None if the observed data file
+            does not exist
+        """
+        fid = os.path.join(cwd, "traces", "obs", filename)
+        if not os.path.exists(fid):
+            return None
+        stat = os.stat(fid)
+
+        processing = ["FORMAT", "FILTER", "MIN_FREQ", "MAX_FREQ", "MUTE",
+                      "EARLY_SLOPE", "EARLY_CONST", "LATE_SLOPE", "LATE_CONST",
+                      "SHORT_DIST", "LONG_DIST", "NORMALIZE"]
+        key = {"source_name": source_name, "filename": filename,
+               "size": stat.st_size, "mtime": stat.st_mtime_ns}
+        for par in processing:
+            key[par] = PAR[par] if par in PAR else None
+
+        digest = hashlib.md5(
+            json.dumps(key, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+        return os.path.join(cwd, "traces", "obs_cache",
+                            f"{filename}_{digest[:16]}.npz")
+
+    def _read_cached_obs(self, cwd, filename, template, **kwargs):
+        """
+        Retrieve processed observations from the cache, using a stream with
+        matching traces (i.e., the synthetics) as a template for the headers.
+        The cache is only used if the template has the same traces, in the
+        same order and with the same number of samples, as the cached
+        observations. Otherwise the observations need to be read again
+
+        :type cwd: str
+        :param cwd: solver working directory
+        :type filename: str
+        :param filename: name of the observed data file in traces/obs
+        :type template: obspy.core.stream.Stream
+        :param template: stream whose traces correspond to the observations
+        :rtype: obspy.core.stream.Stream or None
+        :return: processed observations, or None if not cached
+        """
+        if not PAR.CACHE_OBS:
+            return None
+
+        cache = self._cached_obs_filename(cwd, filename, **kwargs)
+        if cache is None or not os.path.exists(cache):
+            return None
+
+        with np.load(cache) as f:
+            data, ids = f["data"], f["ids"].tolist()
+        if ids != [tr.id for tr in template] or \
+                any(tr.stats.npts != data.shape[1] for tr in template):
+            return None
+
+        obs = template.copy()
+        for tr, data_ in zip(obs, data):
+            tr.data = data_
+
+        return obs
+
+    def _write_cached_obs(self, cwd, filename, obs, **kwargs):
+        """
+        Store processed observations in the cache as a (ntrace, nt) array,
+        alongside the trace ids which identify the order of the traces.
+        Streams with traces of different lengths are not cached. The cache
+        directory is expected to exist, see prepare_eval_grad()
+
+        :type cwd: str
+        :param cwd: solver working directory
+        :type filename: str
+        :param filename: name of the observed data file in traces/obs
+        :type obs: obspy.core.stream.Stream
+        :param obs: processed observations
+        """
+        if not PAR.CACHE_OBS or not len(obs):
+            return
+
+        cache = self._cached_obs_filename(cwd, filename, **kwargs)
+        if cache is None or len(set([tr.stats.npts for tr in obs])) != 1:
+            return
+
+        np.savez(cache, data=np.stack([tr.data for tr in obs]),
+                 ids=np.array([tr.id for tr in obs]))
+
+    def _calculate_misfit(self, syn, obs):
+        """
+        Calculates residuals and adjoint sources for all traces in a stream.
+        If a batched misfit function is available, all traces are evaluated
+        in a single vectorized call, otherwise the per-trace misfit and adjoint
+        functions are called for each observed-synthetic pair.
 
-        :type path: str
-        :param path: location "adjoint traces" will be written
         :type syn: obspy.core.stream.Stream
         :param syn: synthetic data
         :type obs: obspy.core.stream.Stream
         :param syn: observed data
+        :rtype: tuple (list or None, list)
+        :return: (residuals, adjoint sources) for each trace. Residuals are
+            None if no misfit function has been defined (e.g., backprojection)
         """
-        residuals = []
-        for obs_, syn_ in zip(obs, syn):
-            residuals.append(self.misfit(syn_.data, obs_.data, PAR.NT, PAR.DT))
+        npts = set([tr.stats.npts for tr in syn + obs])
+        if self.batched is not None and len(syn) and len(npts) == 1:
+            residuals, adjoints = self.batched(
+                np.stack([tr.data for tr in syn]),
+                np.stack([tr.data for tr in obs]), PAR.NT, PAR.DT
+            )
+            return list(residuals), list(adjoints)
+
+        residuals = None
+        if self.misfit is not None:
+            residuals = [self.misfit(syn_.data, obs_.data, PAR.NT, PAR.DT)
+                         for syn_, obs_ in zip(syn, obs)]
+        adjoints = [self.adjoint(syn_.data, obs_.data, PAR.NT, PAR.DT)
+                    for syn_, obs_ in zip(syn, obs)]
+
+        return residuals, adjoints
+
+    def _write_residuals(self, path, residuals):
+        """
+        Saves the residuals for each data-synthetic pair, calculated based on
+        the misfit function PAR.MISFIT, into a single binary array located at:
 
-        filename = os.path.join(path, "residuals")
-        if exists(filename):
-            residuals = np.append(residuals, np.loadtxt(filename))
+        ./scratch/solver/*/residuals
 
-        np.savetxt(filename, residuals)
+        The file is written in NumPy's .npy format (without the file extension)
+        and should be read back using read_residuals()
 
-    def _write_adjoint_traces(self, path, syn, obs, filename):
+        :type path: str
+        :param path: location "adjoint traces" will be written
+        :type residuals: list of float
+        :param residuals: residuals for each trace
+        """
+        filename = os.path.join(path, "residuals")
+        with open(filename, "wb") as f:
+            np.save(f, np.asarray(residuals, dtype="float64"))
+
+    def _write_adjoint_traces(self, path, syn, adjoints, filename):
         """
         Writes "adjoint traces" required for gradient computation
 
         :type path: str
         :param path: location "adjoint traces" will be written
         :type syn: obspy.core.stream.Stream
-        :param syn: synthetic data
-        :type obs: obspy.core.stream.Stream
-        :param syn: observed data
+        :param syn: synthetic data, used as a template for the adjoint traces
+        :type adjoints: list of np.array
+        :param adjoints: adjoint source for each trace in `syn`
         :type filename: str
         :param filename: filename to write adjoint traces to
         """
         # Use the synthetics as a template for the adjoint sources
         adj = syn.copy()
-        for adj_, obs_, syn_ in zip(adj, obs, syn):
-            adj.data = self.adjoint(syn_.data, obs_.data, PAR.NT, PAR.DT)
+        for adj_, data in zip(adj, adjoints):
+            adj_.data = data
 
         self.writer(adj, path, filename)
 
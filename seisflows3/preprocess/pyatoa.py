@@ -14,7 +14,7 @@ import pyatoa
 from glob import glob
 from pyatoa.utils.images import merge_pdfs
 
-from seisflows3.tools import unix, msg
+from seisflows3.tools import unix, msg, transfer
 from seisflows3.config import custom_import
 from seisflows3.config import SeisFlowsPathsParameters
 
@@ -248,7 +248,8 @@ class Pyatoa(custom_import("preprocess", "base")):
 
     def write_residuals(self, path, scaled_misfit):
         """
-        Computes residuals and saves them to a text file in the appropriate path
+        Computes residuals and saves them to a binary file in the appropriate
+        path, which can be read back with read_residuals()
 
         :type path: str        
         :param path: scratch directory path, e.g. PATH.GRAD or PATH.FUNC
@@ -259,8 +260,7 @@ class Pyatoa(custom_import("preprocess", "base")):
         :param source_name: name of the source related to the misfit, used
             for file naming
         """
-        residuals_file = os.path.join(path, "residuals")        
-        np.savetxt(residuals_file, [scaled_misfit], fmt="%11.6e")
+        self._write_residuals(path, [scaled_misfit])
 
     def sum_residuals(self, files):
         """
@@ -268,8 +268,8 @@ class Pyatoa(custom_import("preprocess", "base")):
         Total misfit defined by Tape et al. (2010)
 
         :type files: str
-        :param files: list of single-column text files containing residuals
-            that will have been generated using prepare_eval_grad()
+        :param files: list of residual files that will have been generated
+            using prepare_eval_grad()
         :rtype: float
         :return: average misfit
         """
@@ -283,7 +283,7 @@ class Pyatoa(custom_import("preprocess", "base")):
 
         total_misfit = 0
         for filename in files:
-            total_misfit += np.sum(np.loadtxt(filename))
+            total_misfit += np.sum(self.read_residuals(filename))
 
         total_misfit /= PAR.NTASK
 
@@ -340,9 +340,8 @@ class Pyatoa(custom_import("preprocess", "base")):
             unix.mkdir(snapshot_dir)
 
         srcs = glob(os.path.join(self.path_datasets, "*.h5"))
-        for src in srcs:
-            dst = os.path.join(snapshot_dir, os.path.basename(src))
-            unix.cp(src, dst)
+        stats = transfer.copy(srcs, snapshot_dir)
+        self.logger.debug(f"snapshot of datasets: {stats}")
 
     def make_final_pdfs(self):
         """
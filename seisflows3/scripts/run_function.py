@@ -15,13 +15,17 @@ compute system.
     OR
     >> sbatch run --output ./OUTPUT --classname solver --funcname eval_func
 """
+import time
+START = time.time()  # used to measure the startup latency of the task
+
 import os
 import sys
-import pickle
 import argparse
+import subprocess
 
-from seisflows3.config import load, config_logger
-
+# Only imports the standard library, so that tasks handed to a task worker do
+# not pay for importing SeisFlows3 and its dependencies
+from seisflows3.tools import worker
 
 
 def parse_args():
@@ -80,43 +84,101 @@ def export(myenv):
             del os.environ[item]
 
 
-if __name__ == '__main__':
-    """ 
-    Runs task within a currently executing workflow 
+def array_taskids(index):
     """
-    args = parse_args()
-
-    if args.environment:
-        export(args.environment)
+    Returns the task ids that are run by a given job array index. Each array
+    index runs SEISFLOWS_NPACK consecutive slots (1 unless system.slurm packs
+    tasks), and slots are mapped to task ids through SEISFLOWS_TASKORDER,
+    a ':' separated list of task ids, if the system has reordered the tasks
+
+    :type index: int
+    :param index: job array index, e.g., SLURM_ARRAY_TASK_ID
+    :rtype: list of int
+    :return: task ids run by this array index
+    """
+    npack = int(os.environ.get("SEISFLOWS_NPACK", 1))
+    slots = range(index * npack, (index + 1) * npack)
 
-    # Load the last checkpointed working state from the 'seisflows_?.p` files
-    # Allowing access through sys.modules
-    load(args.output)
+    order = os.environ.get("SEISFLOWS_TASKORDER")
+    if order:
+        order = [int(taskid) for taskid in order.split(":")]
+        return [order[slot] for slot in slots if slot < len(order)]
 
-    # Load keyword arguments required by this function
-    # Files will be something like: 'solver_eval_func.p'
-    kwargs_fid = f"{args.classname}_{args.funcname}.p"
-    kwargs_path = os.path.join(args.output, "kwargs", kwargs_fid)
-    with open(kwargs_path, "rb") as f:
-        kwargs = pickle.load(f)
+    ntask = int(os.environ.get("SEISFLOWS_NTASK", slots[-1] + 1))
+    return [slot for slot in slots if slot < ntask]
 
-    # Load in some of the working state from sys.modules
-    PAR = sys.modules["seisflows_parameters"]
-    PATH = sys.modules["seisflows_paths"]
-    system = sys.modules["seisflows_system"]
 
-    # Configure the CPU-dependent logger which will log to stdout only
-    # But mainsolver will log to the main log file as well
-    if system.taskid == 0: 
-        filename = PATH.LOGFILE
-    else:
-        filename = None
-    config_logger(level=PAR.LOG_LEVEL, verbose=PAR.VERBOSE, filename=filename)
+def run_packed(taskids, output):
+    """
+    Runs multiple tasks assigned to this array job concurrently, each in a
+    separate process that is given its own task id. Used by system.slurm when
+    PAR.PACK_TASKS packs multiple small tasks onto one node.
+
+    The job allocation holds the cores of all packed tasks, so each process
+    is told that its job has only the cores of a single task. Otherwise
+    MPIEXEC (e.g., 'srun') would start every task on all cores of the job.
+    The task ids of failed tasks are written to 'failed_tasks/<job id>' in the
+    output directory, so that system.slurm resubmits only these tasks
+
+    :type taskids: list of int
+    :param taskids: the task ids to run
+    :type output: str
+    :param output: the SeisFlows3 output directory
+    :rtype: int
+    :return: non-zero if any of the packed tasks failed
+    """
+    npack = int(os.environ.get("SEISFLOWS_NPACK", 1))
+    ntasks = {}
+    if "SLURM_NTASKS" in os.environ:
+        nproc = str(max(1, int(os.environ["SLURM_NTASKS"]) // npack))
+        ntasks = {"SLURM_NTASKS": nproc, "SLURM_NPROCS": nproc,
+                  "SLURM_EXACT": "1"}
+
+    procs = []
+    for taskid in taskids:
+        env = {**os.environ, **ntasks, "SEISFLOWS_TASKID": str(taskid)}
+        procs.append(subprocess.Popen([sys.executable] + sys.argv, env=env))
+    returncodes = [proc.wait() for proc in procs]
+
+    failed = [taskid for taskid, code in zip(taskids, returncodes) if code]
+    if failed and "SLURM_ARRAY_JOB_ID" in os.environ:
+        job_id = (f"{os.environ['SLURM_ARRAY_JOB_ID']}_"
+                  f"{os.environ['SLURM_ARRAY_TASK_ID']}")
+        os.makedirs(os.path.join(output, "failed_tasks"), exist_ok=True)
+        with open(os.path.join(output, "failed_tasks", job_id), "w") as f:
+            f.write("\n".join([str(taskid) for taskid in failed]))
+
+    return max(returncodes + [0])
 
-    # Get the actual function so we can evaluate it
-    func = getattr(sys.modules[f"seisflows_{args.classname}"], args.funcname)
 
-    # Evaluate the function with given keyword arguments
-    func(**kwargs)
+if __name__ == '__main__':
+    """ 
+    Runs task within a currently executing workflow 
+    """
+    args = parse_args()
 
+    if args.environment:
+        export(args.environment)
 
+    # Job array indices are translated into task ids, as tasks may be packed
+    # or reordered. Packed array jobs fan out into one process per task,
+    # which are recognized by the task id that is set for them
+    if "SLURM_ARRAY_TASK_ID" in os.environ and \
+            not os.environ.get("SEISFLOWS_TASKID"):
+        taskids = array_taskids(int(os.environ["SLURM_ARRAY_TASK_ID"]))
+        if len(taskids) > 1:
+            sys.exit(run_packed(taskids, args.output))
+        os.environ["SEISFLOWS_TASKID"] = str(taskids[0])
+
+    # Hand the task to a persistent task worker on this node if requested,
+    # fall back to running the task in this process if none can be reached
+    if os.environ.get(worker.ENV_VAR):
+        returncode = worker.submit(output=args.output,
+                                   classname=args.classname,
+                                   method=args.funcname, start=START)
+        if returncode is not None:
+            sys.exit(returncode)
+
+    # Load the working state and evaluate the function in this process
+    worker.run_task(output=args.output, classname=args.classname,
+                    method=args.funcname, start=START)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Only required when PAR.TASK_WORKER is True
+
+This script starts a persistent task worker on the current node, which keeps
+SeisFlows3 imported and the working state loaded, and runs tasks handed to it
+by 'scripts/run'. See seisflows3.tools.worker for details.
+
+.. note::
+    Not to be called by the user, this script is started by the first task
+    that is run on a node, and exits once it has been idle for `timeout` s
+
+.. rubric::
+    >> python run_worker.py --output ./OUTPUT
+"""
+import argparse
+
+from seisflows3.tools import worker
+
+
+def parse_args():
+    """
+    Get command line arguments
+    """
+    parser = argparse.ArgumentParser("Run arguments for a task worker")
+    parser.add_argument("-o", "--output", type=str, nargs="?", required=True,
+                        help="the SeisFlows3 output directory used to load the "
+                             "active working state from inside the compute node"
+                        )
+    parser.add_argument("-t", "--timeout", type=float, nargs="?",
+                        default=worker.IDLE_TIMEOUT,
+                        help="seconds to wait for new tasks before shutting "
+                             "down the worker")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    """
+    Serve tasks for a currently executing workflow
+    """
+    args = parse_args()
+    worker.serve(output=args.output, idle_timeout=args.timeout)
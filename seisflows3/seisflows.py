@@ -13,6 +13,9 @@ facilitates interface with the underlying SeisFlows3 package.
     - Add a new subparser with optional arguments to sfparser()
     - Add subparser to subparser dict at the end of sfparser()
 """
+import time
+_IMPORT_START = time.perf_counter()  # Used to benchmark import times
+
 import os
 import sys
 import pickle
@@ -24,7 +27,6 @@ import traceback
 import subprocess
 from glob import glob
 from copy import copy
-from IPython import embed
 
 from seisflows3 import logger
 from seisflows3.tools import unix, msg
@@ -33,7 +35,10 @@ from seisflows3.tools.specfem import (getpar, setpar, getpar_vel_model,
 from seisflows3.tools.wrappers import loadyaml
 from seisflows3.config import (init_seisflows, format_paths, config_logger,
                                Dict, custom_import, SeisFlowsPathsParameters,
-                               NAMES, PACKAGES, ROOT_DIR, CFGPATHS)
+                               NAMES, PACKAGES, ROOT_DIR, CFGPATHS,
+                               return_modules, import_times)
+
+_IMPORT_TIME = time.perf_counter() - _IMPORT_START
 
 
 def sfparser():
@@ -82,6 +87,9 @@ def sfparser():
                         help=f"Parameters file, default: '{CFGPATHS.PAR_FILE}'")
     parser.add_argument("--path_file", nargs="?", default="paths.py",
                         help="Legacy path file, default: 'paths.py'")
+    parser.add_argument("--time_imports", action="store_true",
+                        help="Report the time spent importing SeisFlows3 "
+                             "modules and dependencies when the command exits")
 
     # Initiate a sub parser to provide nested help functions and sub commands
     subparser = parser.add_subparsers(
@@ -375,7 +383,7 @@ class SeisFlows:
         else:
             # This is the main command-line functionality of the class
             # Print out the help statement if no command is given
-            if len(sys.argv) == 1:
+            if len(sys.argv) == 1 or self._args.command is None:
                 self._parser.print_help()
                 sys.exit(0)
 
@@ -795,6 +803,7 @@ class SeisFlows:
                       "you explicitely run: 'workflow.checkpoint()'",
                       header="debug", border="="))
 
+        from IPython import embed
         embed(colors="Neutral")
 
     def sempar(self, parameter, value=None, skip_print=False,
@@ -1224,6 +1233,7 @@ class SeisFlows:
         
         current_step = optimize.line_search.step_count
         optimize.line_search.reset()
+        optimize.clear_search_state()
         new_step = optimize.line_search.step_count
     
         print(msg.cli(f"Step Count: {current_step} -> {new_step}"))
@@ -1257,6 +1267,25 @@ class SeisFlows:
         print(msg.cli("'+': package, '-': module, '*': class", items=items,
                       header="seisflows3 modules"))
 
+    def _print_import_times(self, **kwargs):
+        """
+        Print out the time taken to import the command line tool, the time
+        spent importing SeisFlows3 modules, and which of the heavier external
+        dependencies were loaded by the executed command
+
+        .. rubric::
+            $ seisflows --time_imports {command}
+        """
+        items = [f"{'seisflows3.seisflows':<40}{_IMPORT_TIME:8.3f}s"]
+        for name, elapsed in import_times().items():
+            items.append(f"{name:<40}{elapsed:8.3f}s")
+        loaded = [name for name in ["numpy", "scipy", "obspy", "matplotlib",
+                                    "pyatoa", "IPython"]
+                  if name in sys.modules]
+        items.append(f"dependencies loaded: {', '.join(loaded) or 'none'}")
+        items.append(f"total time: {time.perf_counter() - _IMPORT_START:.3f}s")
+        print(msg.cli(items=items, header="import times"))
+
     def _print_flow(self, **kwargs):
         """
         Simply print out the seisflows3.workflow.main() flow variable which
@@ -1390,39 +1419,16 @@ class SeisFlows:
                 print(msg.cli(f"idx out of range: {len(solver.source_names)}"))
 
 
-def return_modules():
-    """
-    Search for the names of available modules in SeisFlows name space.
-    This simple function checks for files with a '.py' extension inside
-    each of the sub-directories, ignoring private files like __init__.py.
-
-    :rtype: dict of dict of lists
-    :return: a dict with keys matching names and values as dicts for each
-        package. nested list contains all the avaialble modules
-    """
-    REPO_DIR = os.path.abspath(os.path.join(ROOT_DIR, ".."))
-
-    module_dict = {}
-    for NAME in NAMES:
-        module_dict[NAME] = {}
-        for PACKAGE in PACKAGES:
-            module_dict[NAME][PACKAGE] = []
-            mod_dir = os.path.join(REPO_DIR, PACKAGE, NAME)
-            for pyfile in sorted(glob(os.path.join(mod_dir, "*.py"))):
-                stripped_pyfile = os.path.basename(pyfile)
-                stripped_pyfile = os.path.splitext(stripped_pyfile)[0]
-                if not stripped_pyfile.startswith("_"):
-                    module_dict[NAME][PACKAGE].append(stripped_pyfile)
-
-    return module_dict
-
-
 def main():
     """
     Main entry point into the SeisFlows3 package is via the SeisFlows3 class
     """
     sf = SeisFlows()
-    sf()
+    try:
+        sf()
+    finally:
+        if sf._args.time_imports:
+            sf._print_import_times()
 
 
 if __name__ == "__main__":
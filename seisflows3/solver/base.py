@@ -11,9 +11,10 @@ import logging
 import numpy as np
 from glob import glob
 from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 from seisflows3.plugins import solver_io
-from seisflows3.tools import msg, unix
+from seisflows3.tools import msg, unix, transfer, profiler
 from seisflows3.tools.specfem import Container, call_solver
 from seisflows3.tools.wrappers import Struct, diff, exists
 from seisflows3.config import SeisFlowsPathsParameters
@@ -39,7 +40,7 @@ class Base:
 
     Function descriptors:
 
-    eval_func, eval_grad, apply_hess
+    eval_func, eval_trials, eval_grad, apply_hess
 
         These methods deal with evaluation of the misfit function or its
         derivatives.  Together, they provide the primary interface through which
@@ -142,6 +143,27 @@ class Base:
                docstr="The format external solver files. Available: "
                       "['fortran_binary', 'adios']")
 
+        sf.par("SOLVERIO_MMAP", required=False, default=False, par_type=bool,
+               docstr="Only for SOLVERIO=='fortran_binary'. If True, model "
+                      "and kernel slices are memory mapped when read and "
+                      "written in place when saved, rather than being fully "
+                      "read into memory. Useful for large 3D meshes")
+
+        sf.par("SOLVERIO_WORKERS", required=False, default=1, par_type=int,
+               docstr="Number of threads used to concurrently read and write "
+                      "model and kernel slices. Values > 1 can speed up "
+                      "solver I/O on parallel filesystems for large NPROC")
+
+        sf.par("SOLVER_PROVISION", required=False, default="copy",
+               par_type=str,
+               docstr="How solver directories are provisioned. Available: "
+                      "['copy': copy executables and databases into each "
+                      "solver directory, 'link': symlink executables and "
+                      "share database files with the main solver through "
+                      "reflinks or hardlinks, which are replaced by private "
+                      "copies before they are modified. Falls back to "
+                      "copying on filesystems without link support]")
+
         sf.path("SOLVER", required=False,
                 default=os.path.join(PATH.SCRATCH, "solver"),
                 docstr="scratch path to hold solver working directories")
@@ -208,6 +230,14 @@ class Base:
             "IO method has no attribute 'read_slice'"
         assert hasattr(self.io, "write_slice"), \
             "IO method has no attribute 'write_slice'"
+        if PAR.SOLVERIO_MMAP:
+            assert(PAR.SOLVERIO == "fortran_binary"), \
+                "SOLVERIO_MMAP is only available for SOLVERIO=='fortran_binary'"
+        assert(PAR.SOLVERIO_WORKERS >= 1), "SOLVERIO_WORKERS must be >= 1"
+
+        acceptable_provisions = ["COPY", "LINK"]
+        assert(PAR.SOLVER_PROVISION.upper() in acceptable_provisions), \
+            f"SOLVER_PROVISION must be in {acceptable_provisions}"
 
     def setup(self):
         """ 
@@ -291,17 +321,39 @@ class Base:
             self.logger.info("running forward simulations")
 
         unix.cd(self.cwd)
-        self.import_model(path)
-        self.forward()
+        with profiler.phase("import_model"):
+            self.import_model(path)
+        with profiler.phase("forward"):
+            self.forward()
 
         if write_residuals:
             if self.taskid == 0:
                 self.logger.debug("calling preprocess.prepare_eval_grad()")
-            preprocess.prepare_eval_grad(cwd=self.cwd, taskid=self.taskid,
-                                         source_name=self.source_name,
-                                         filenames=self.data_filenames
-                                         )
-            self.export_residuals(path)
+            with profiler.phase("preprocess"):
+                preprocess.prepare_eval_grad(cwd=self.cwd, taskid=self.taskid,
+                                             source_name=self.source_name,
+                                             filenames=self.data_filenames
+                                             )
+            with profiler.phase("export"):
+                self.export_residuals(path)
+
+    def eval_trials(self, paths):
+        """
+        High level solver interface
+
+        Evaluates the misfit function for a number of trial models within a
+        single task, used by a parallel line search to evaluate all of its
+        trial step lengths in one call of system.run(). Trial models are
+        evaluated one after another as they share the same working directory,
+        so the task time limit should be scaled by the number of trials (see
+        the `tasktime_scale` argument of system.run()).
+
+        :type paths: list of str
+        :param paths: one directory per trial model, from which the model is
+            imported and where residuals will be exported
+        """
+        for path in paths:
+            self.eval_func(path=path)
 
     def eval_grad(self, path, export_traces=False):
         """
@@ -329,14 +381,16 @@ class Base:
                   )
             sys.exit(-1)
 
-        self.adjoint()
-        self.export_kernels(path)
+        with profiler.phase("adjoint"):
+            self.adjoint()
+        with profiler.phase("export"):
+            self.export_kernels(path)
 
-        if export_traces:
-            self.export_traces(path=os.path.join(path, "traces", "syn"),
-                               prefix="traces/syn")
-            self.export_traces(path=os.path.join(path, "traces", "adj"),
-                               prefix="traces/adj")
+            if export_traces:
+                self.export_traces(path=os.path.join(path, "traces", "syn"),
+                                   prefix="traces/syn")
+                self.export_traces(path=os.path.join(path, "traces", "adj"),
+                                   prefix="traces/adj")
 
     def apply_hess(self, path):
         """
@@ -388,6 +442,21 @@ class Base:
         """
         return getattr(solver_io, PAR.SOLVERIO)
 
+    @property
+    def _io_kwargs(self):
+        """
+        Optional keyword arguments passed to the IO module's read_slice() and
+        write_slice() functions, only set when requested by the User so that
+        IO modules without these options are not affected
+
+        :rtype: dict
+        :return: keyword arguments for read_slice() and write_slice()
+        """
+        if PAR.SOLVERIO_MMAP:
+            return {"mmap": True}
+        else:
+            return {}
+
     def load(self, path, prefix="", suffix="", parameters=None,):
         """ 
         Solver I/O: Loads SPECFEM2D/3D models or kernels
@@ -408,12 +477,43 @@ class Base:
         if parameters is None:
             parameters = self.parameters
 
+        # Memory mapped slices are copied straight into one preallocated
+        # vector and their maps are dropped right away, so that no more than
+        # SOLVERIO_WORKERS files are open at once and the returned model is
+        # writeable. Slices are views into that vector, see split()
+        if self._io_kwargs.get("mmap"):
+            load_dict = self.split(
+                np.empty(len(parameters) * self._offsets[-1], dtype="float32"),
+                parameters=parameters
+            )
+
+            def read_proc(iproc):
+                """Copy all parameters of a single processor slice"""
+                for key in parameters:
+                    val, = self.io.read_slice(
+                        path=path, parameters=f"{prefix}{key}{suffix}",
+                        iproc=iproc, mmap=True
+                    )
+                    load_dict[key][iproc][:] = val
+                    del val
+
+            self._map_slices(read_proc)
+
+            return load_dict
+
+        def read_proc(iproc):
+            """Read all parameters for a single processor slice"""
+            return [self.io.read_slice(path=path,
+                                       parameters=f"{prefix}{key}{suffix}",
+                                       iproc=iproc, **self._io_kwargs)
+                    for key in parameters]
+
+        # Results are returned in processor order regardless of which worker
+        # finishes first, so the Container is built deterministically
         load_dict = Container()
-        for iproc in range(self.mesh_properties.nproc):
-            for key in parameters:
-                load_dict[key] += self.io.read_slice(
-                    path=path, parameters=f"{prefix}{key}{suffix}", iproc=iproc
-                )
+        for vals in self._map_slices(read_proc):
+            for key, val in zip(parameters, vals):
+                load_dict[key] += val
 
         return load_dict
 
@@ -439,19 +539,42 @@ class Base:
 
         # Fill in any missing parameters
         missing_keys = diff(parameters, save_dict.keys())
-        for iproc in range(self.mesh_properties.nproc):
+        if missing_keys:
+            missing_dict = self.load(path=PATH.MODEL_INIT, prefix=prefix,
+                                     suffix=suffix, parameters=missing_keys)
             for key in missing_keys:
-                save_dict[key] += self.io.read_slice(
-                    path=PATH.MODEL_INIT, parameters=f"{prefix}{key}{suffix}",
-                    iproc=iproc
-                )
+                save_dict[key] += missing_dict[key]
 
-        # Write slices to disk
-        for iproc in range(self.mesh_properties.nproc):
+        def write_proc(iproc):
+            """Write all parameters for a single processor slice"""
             for key in parameters:
                 self.io.write_slice(data=save_dict[key][iproc], path=path,
                                     parameters=f"{prefix}{key}{suffix}",
-                                    iproc=iproc)
+                                    iproc=iproc, **self._io_kwargs)
+
+        # Write slices to disk
+        self._map_slices(write_proc)
+
+    def _map_slices(self, func):
+        """
+        Apply a slice I/O function to each processor slice. Slices are fanned
+        out over a pool of SOLVERIO_WORKERS threads, which is sufficient as
+        file reads and writes release the GIL. Results are always returned in
+        processor order
+
+        :type func: function
+        :param func: function which takes a processor number as its only arg
+        :rtype: list
+        :return: return values of `func` for iproc in range(nproc)
+        """
+        iprocs = range(self.mesh_properties.nproc)
+        nworkers = min(PAR.SOLVERIO_WORKERS, len(iprocs))
+
+        if nworkers <= 1:
+            return [func(iproc) for iproc in iprocs]
+
+        with ThreadPoolExecutor(max_workers=nworkers) as executor:
+            return list(executor.map(func, iprocs))
 
     def merge(self, model, parameters=None):
         """
@@ -468,10 +591,17 @@ class Base:
         if parameters is None:
             parameters = self.parameters
 
-        m = np.array([])
-        for key in parameters:
+        # Write each slice directly into a single preallocated vector laid out
+        # as [param0_proc0, param0_proc1, ..., param1_proc0, ...]
+        offsets = self._offsets
+        ngll_total = offsets[-1]
+
+        m = np.empty(len(parameters) * ngll_total)
+        for idim, key in enumerate(parameters):
             for iproc in range(self.mesh_properties.nproc):
-                m = np.append(m, model[key][iproc])
+                imin = ngll_total * idim + offsets[iproc]
+                imax = ngll_total * idim + offsets[iproc + 1]
+                m[imin:imax] = model[key][iproc]
 
         return m
 
@@ -479,26 +609,32 @@ class Base:
         """
         Converts vector representation `m` to dictionary representation `model`
 
+        .. note::
+            Slices of the returned model are views into `m`, not copies.
+            Writing to a slice modifies `m` and vice versa, so copy slices
+            that are modified while `m` is still in use
+
         :type m: np.ndarray
         :param m: model to be converted
         :type parameters: list
         :param parameters: optional list of parameters,
             defaults to `self.parameters`
         :rtype: dict
-        :return: model as a dictionary
+        :return: model as a dictionary, whose slices are views into `m`
         """
         if parameters is None:
             parameters = self.parameters
 
         nproc = self.mesh_properties.nproc
-        ngll = self.mesh_properties.ngll
+        offsets = self._offsets
+        ngll_total = offsets[-1]
         model = Container()
 
         for idim, key in enumerate(parameters):
             model[key] = []
             for iproc in range(nproc):
-                imin = sum(ngll) * idim + sum(ngll[:iproc])
-                imax = sum(ngll) * idim + sum(ngll[:iproc + 1])
+                imin = ngll_total * idim + offsets[iproc]
+                imax = ngll_total * idim + offsets[iproc + 1]
                 model[key] += [m[imin:imax]]
 
         return model
@@ -628,7 +764,7 @@ class Base:
         """
         src = glob(os.path.join(path, 'traces', self.source_name, '*'))
         dst = os.path.join(self.cwd, 'traces', 'obs')
-        unix.cp(src, dst)
+        transfer.copy(src, dst)
 
     def export_model(self, path, parameters=None):
         """
@@ -646,9 +782,12 @@ class Base:
 
         if self.taskid == 0:
             unix.mkdir(path)
+            files = []
             for key in parameters:
-                files = glob(os.path.join(self.model_databases, f"*{key}.bin"))
-                unix.cp(files, path)
+                files += glob(os.path.join(self.model_databases,
+                                           f"*{key}.bin"))
+            stats = transfer.copy(files, path)
+            self.logger.debug(f"exported model: {stats}")
 
     def export_kernels(self, path):
         """
@@ -668,7 +807,10 @@ class Base:
         src = glob("*_kernel.bin")
         dst = os.path.join(path, "kernels", self.source_name)
         unix.mkdir(dst)
-        unix.mv(src, dst)
+        stats = transfer.move(src, dst)
+
+        if self.taskid == 0:
+            self.logger.debug(f"exported kernels: {stats}")
 
     def export_residuals(self, path):
         """
@@ -694,7 +836,7 @@ class Base:
             sys.exit(-1)
 
         dst = os.path.join(path, "residuals", self.source_name)
-        unix.mv(src, dst)
+        transfer.move(src, dst)
 
     def export_traces(self, path, prefix="traces/obs"):
         """
@@ -706,13 +848,16 @@ class Base:
         :param prefix: location of traces w.r.t self.cwd
         """
         if self.taskid == 0:
-            self.logger.debug("exporting traces to {path} {prefix}")
+            self.logger.debug(f"exporting traces to {path} {prefix}")
 
         unix.mkdir(os.path.join(path))
 
         src = os.path.join(self.cwd, prefix)
         dst = os.path.join(path, self.source_name)
-        unix.cp(src, dst)
+        stats = transfer.copy(src, dst)
+
+        if self.taskid == 0:
+            self.logger.debug(f"exported traces: {stats}")
 
     def rename_kernels(self):
         """
@@ -761,10 +906,8 @@ class Base:
                         self.model_databases, self.kernel_databases]:
             unix.mkdir(cwd_dir)
 
-        # Copy exectuables into the bin/ directory
-        src = glob(os.path.join(PATH.SPECFEM_BIN, "*"))
-        dst = os.path.join("bin", "")
-        unix.cp(src, dst)
+        # Copy or symlink exectuables into the bin/ directory
+        self.provision_executables(dst="bin")
 
         # Copy all input files except source files
         src = glob(os.path.join(PATH.SPECFEM_DATA, "*"))
@@ -789,13 +932,64 @@ class Base:
         else:
             # Copy the initial model from mainsolver into current directory
             # Avoids the need to run multiple instances of xgenerate_databases
-            src = os.path.join(PATH.SOLVER, "mainsolver", "OUTPUT_FILES", 
-                               "DATABASES_MPI")
-            dst = os.path.join(self.cwd, "OUTPUT_FILES", "DATABASES_MPI")
-            unix.cp(src, dst)
+            src = glob(os.path.join(PATH.SOLVER, "mainsolver", "OUTPUT_FILES",
+                                    "DATABASES_MPI", "*"))
+            dst = os.path.join(self.cwd, "OUTPUT_FILES", "DATABASES_MPI", "")
+            self.provision_databases(src, dst)
 
         self.check_solver_parameter_files()
 
+    def provision_executables(self, dst):
+        """
+        Provides the SPECFEM executables to a solver directory. Executables are
+        never modified, so with PAR.SOLVER_PROVISION=='link' they are
+        symlinked rather than copied
+
+        :type dst: str
+        :param dst: directory to place executables in, e.g., 'bin'
+        """
+        src = glob(os.path.join(PATH.SPECFEM_BIN, "*"))
+        if PAR.SOLVER_PROVISION.upper() == "LINK":
+            for src_ in src:
+                unix.ln(src_, os.path.join(dst, ""))
+        else:
+            unix.cp(src, os.path.join(dst, ""))
+
+    def provision_databases(self, src, dst):
+        """
+        Provides database files from the main solver to a solver directory.
+        With PAR.SOLVER_PROVISION=='link' files are reflinked (copy-on-write)
+        or hardlinked where the filesystem supports it, falling back to
+        copies otherwise. Hardlinks are broken by `unshare_databases` before
+        any SPECFEM executable writes to the databases
+
+        :type src: list
+        :param src: database files or directories to provide
+        :type dst: str
+        :param dst: directory to place database files in
+        """
+        if PAR.SOLVER_PROVISION.upper() == "LINK":
+            method = unix.clone(src, dst)
+            self.logger.debug(f"databases provisioned to {dst} with {method}")
+        else:
+            unix.cp(src, dst)
+
+    def unshare_databases(self):
+        """
+        Replaces database files that are hardlinked to other solver
+        directories with private copies. Must be called before any SPECFEM
+        executable writes to the databases: xgenerate_databases rewrites the
+        model and mesh files, and xspecfem3D writes event-specific files
+        (e.g., saved forward arrays) in place, which would otherwise modify
+        the databases of every linked directory. Only files that are still
+        shared are copied, so subsequent calls are cheap
+        """
+        if PAR.SOLVER_PROVISION.upper() == "LINK":
+            path = os.path.join(self.cwd, "OUTPUT_FILES", "DATABASES_MPI")
+            ncopied = unix.break_links(path)
+            if ncopied:
+                self.logger.debug(f"unshared {ncopied} database files")
+
     def initialize_adjoint_traces(self):
         """
         Setup utility: Creates the "adjoint traces" expected by SPECFEM.
@@ -841,13 +1035,14 @@ class Base:
                           items=[path], header="solver error", border="="))
             sys.exit(-1)
 
-        # Count slices and grid points
+        # Count slices and grid points. Memory mapped slices only need their
+        # file headers to be read to determine the number of grid points
         key = self.parameters[0]
         iproc = 0
         ngll = []
         while True:
             dummy = self.io.read_slice(path=path, parameters=key, 
-                                       iproc=iproc)[0]
+                                       iproc=iproc, **self._io_kwargs)[0]
             ngll += [len(dummy)]
             iproc += 1
             if not exists(os.path.join(path,
@@ -862,9 +1057,11 @@ class Base:
         for key in ['x', 'y', 'z']:
             coords[key] = partial(self.io.read_slice, self, path, key)
 
-        # Define internal mesh properties
+        # Define internal mesh properties, offsets point to the start of each
+        # slice within a single-parameter model vector
         self._mesh_properties = Struct([["nproc", nproc],
                                         ["ngll", ngll],
+                                        ["offsets", np.cumsum([0] + ngll)],
                                         ["path", path],
                                         ["coords", coords]]
                                        )
@@ -959,6 +1156,22 @@ class Base:
 
         return self._mesh_properties
 
+    @property
+    def _offsets(self):
+        """
+        Returns the offset table of processor slices within a single-parameter
+        model vector, i.e. slice `iproc` spans offsets[iproc]:offsets[iproc+1].
+        Mesh properties saved by older versions are updated in place
+
+        :rtype: np.ndarray
+        :return: cumulative sum of grid points per slice, starting at 0
+        """
+        if "offsets" not in self.mesh_properties:
+            self.mesh_properties.offsets = \
+                np.cumsum([0] + list(self.mesh_properties.ngll))
+
+        return self.mesh_properties.offsets
+
     @property
     def data_filenames(self):
         """
@@ -13,7 +13,7 @@ from glob import glob
 from seisflows3.tools import unix, msg
 from seisflows3.tools.wrappers import exists
 from seisflows3.config import custom_import, SeisFlowsPathsParameters
-from seisflows3.tools.specfem import call_solver, getpar, setpar
+from seisflows3.tools.specfem import call_solver, getpar, setpar, ParFile
 
 
 PAR = sys.modules['seisflows_parameters']
@@ -149,8 +149,8 @@ class Specfem2D(custom_import("solver", "base")):
         self.generate_mesh(**model_kwargs)
 
         unix.cd(self.cwd)
-        setpar(key="SIMULATION_TYPE", val="1", file="DATA/Par_file")
-        setpar(key="SAVE_FORWARD", val=".true.", file="DATA/Par_file")
+        with ParFile("DATA/Par_file") as par_file:
+            par_file.update({"SIMULATION_TYPE": "1", "SAVE_FORWARD": ".true."})
 
         call_solver(PAR.MPIEXEC, "bin/xmeshfem2D", output="mesher.log")
         call_solver(PAR.MPIEXEC, "bin/xspecfem2D", output="solver.log")
@@ -254,9 +254,10 @@ class Specfem2D(custom_import("solver", "base")):
         :type path: str
         :param path: path to export traces to after completion of simulation
         """
-        setpar(key="SIMULATION_TYPE", val="1", file="DATA/Par_file")
-        setpar(key="SAVE_FORWARD", val=".true.", file="DATA/Par_file")
+        with ParFile("DATA/Par_file") as par_file:
+            par_file.update({"SIMULATION_TYPE": "1", "SAVE_FORWARD": ".true."})
 
+        self.unshare_databases()
         call_solver(mpiexec=PAR.MPIEXEC, executable="bin/xmeshfem2D")
         call_solver(mpiexec=PAR.MPIEXEC, executable="bin/xspecfem2D")
 
@@ -274,8 +275,9 @@ class Specfem2D(custom_import("solver", "base")):
         Calls SPECFEM2D adjoint solver, creates the `SEM` folder with adjoint
         traces which is required by the adjoint solver
         """
-        setpar(key="SIMULATION_TYPE", val="3", file="DATA/Par_file")
-        setpar(key="SAVE_FORWARD", val=".false.", file="DATA/Par_file")
+        with ParFile("DATA/Par_file") as par_file:
+            par_file.update({"SIMULATION_TYPE": "3",
+                             "SAVE_FORWARD": ".false."})
 
         unix.rm("SEM")
         unix.ln("traces/adj", "SEM")
@@ -286,6 +288,7 @@ class Specfem2D(custom_import("solver", "base")):
             unix.rename(old=".su", new=".su.adj",
                         names=glob(os.path.join("traces", "adj", "*.su")))
 
+        self.unshare_databases()
         call_solver(mpiexec=PAR.MPIEXEC, executable="bin/xmeshfem2D")
         call_solver(mpiexec=PAR.MPIEXEC, executable="bin/xspecfem2D")
 
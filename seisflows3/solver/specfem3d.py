@@ -14,7 +14,7 @@ import seisflows3.plugins.solver.specfem3d as solvertools
 from seisflows3.tools import unix, msg
 from seisflows3.tools.wrappers import exists
 from seisflows3.config import custom_import, SeisFlowsPathsParameters
-from seisflows3.tools.specfem import call_solver, getpar, setpar
+from seisflows3.tools.specfem import call_solver, getpar, setpar, ParFile
 
 
 # Seisflows configuration
@@ -94,12 +94,7 @@ class Specfem3D(custom_import("solver", "base")):
 
         # Run the Forward simulation
         unix.cd(self.cwd)
-        setpar(key="SIMULATION_TYPE", val="1", file="DATA/Par_file")
-        setpar(key="SAVE_FORWARD", val=".true.", file="DATA/Par_file")
-        if PAR.ATTENUATION:
-            setpar(key="ATTENUATION", val=".true.", file="DATA/Par_file")
-        else:
-            setpar(key="ATTENUATION", val=".false.", file="DATA/Par_file")
+        self.set_forward_parameters()
 
         call_solver(mpiexec=PAR.MPIEXEC, executable="bin/xspecfem3D")
 
@@ -136,6 +131,7 @@ class Specfem3D(custom_import("solver", "base")):
         if model_type == "gll":
             self.check_mesh_properties(model_path)
 
+            self.unshare_databases()
             src = glob(os.path.join(model_path, "*"))
             dst = self.model_databases
             unix.cp(src, dst)
@@ -165,13 +161,10 @@ class Specfem3D(custom_import("solver", "base")):
         :param path: path to export traces to after completion of simulation
         """
         # Set parameters and run forward simulation
-        setpar(key="SIMULATION_TYPE", val="1", file="DATA/Par_file")
-        setpar(key="SAVE_FORWARD", val=".true.", file="DATA/Par_file")
-        if PAR.ATTENUATION:
-            setpar(key="ATTENUATION", val=".true.", file="DATA/Par_file")
-        else:
-            setpar(key="ATTENUATION", val=".false`.", file="DATA/Par_file")
+        self.set_forward_parameters()
 
+        # xgenerate_databases overwrites the databases in place
+        self.unshare_databases()
         call_solver(mpiexec=PAR.MPIEXEC,
                     executable="bin/xgenerate_databases")
         call_solver(mpiexec=PAR.MPIEXEC, executable="bin/xspecfem3D")
@@ -180,18 +173,32 @@ class Specfem3D(custom_import("solver", "base")):
         unix.mv(src=glob(os.path.join("OUTPUT_FILES", self.data_wildcard)),
                 dst=path)
 
+    def set_forward_parameters(self):
+        """
+        Sets the Par_file parameters for a forward simulation, in a single
+        update of the Par_file. Attenuation is set by PAR.ATTENUATION
+        """
+        with ParFile("DATA/Par_file") as par_file:
+            par_file.update({
+                "SIMULATION_TYPE": "1",
+                "SAVE_FORWARD": ".true.",
+                "ATTENUATION": ".true." if PAR.ATTENUATION else ".false."
+            })
+
     def adjoint(self):
         """
         Calls SPECFEM3D adjoint solver, creates the `SEM` folder with adjoint
         traces which is required by the adjoint solver
         """
-        setpar(key="SIMULATION_TYPE", val="3", file="DATA/Par_file")
-        setpar(key="SAVE_FORWARD", val=".false.", file="DATA/Par_file")
-        setpar(key="ATTENUATION", val=".false.", file="DATA/Par_file")
+        with ParFile("DATA/Par_file") as par_file:
+            par_file.update({"SIMULATION_TYPE": "3",
+                             "SAVE_FORWARD": ".false.",
+                             "ATTENUATION": ".false."})
 
         unix.rm("SEM")
         unix.ln("traces/adj", "SEM")
 
+        self.unshare_databases()
         call_solver(mpiexec=PAR.MPIEXEC, executable="bin/xspecfem3D")
 
     def check_solver_parameter_files(self):
@@ -6,10 +6,12 @@ compute system types (cluster vs. workstation) and even specific HPCs.
 """
 import os
 import sys
+import json
 import pickle
 import logging
+from glob import glob
 
-from seisflows3.tools import unix, msg
+from seisflows3.tools import unix, msg, profiler
 from seisflows3.tools.wrappers import number_fid
 from seisflows3.config import save, SeisFlowsPathsParameters, CFGPATHS
 
@@ -18,6 +20,9 @@ from seisflows3.config import save, SeisFlowsPathsParameters, CFGPATHS
 PAR = sys.modules["seisflows_parameters"]
 PATH = sys.modules["seisflows_paths"]
 
+# Number of past runtimes kept per event in the task history
+HISTORY_LENGTH = 5
+
 
 class Base:
     """
@@ -65,6 +70,23 @@ class Base:
                       "they are being called from. Useful for debugging but "
                       "also very noisy.")
 
+        sf.par("TASK_WORKER", required=False, default=False, par_type=bool,
+               docstr="Only for systems which run each task as a separate "
+                      "process (e.g., multicore, clusters). If True, tasks "
+                      "are handed to a persistent worker process on each "
+                      "node, one per job allocation, which keeps SeisFlows3 "
+                      "imported and only reloads the working state when it "
+                      "changes, removing per-task startup costs. Workers are "
+                      "only reused by tasks of the same allocation, e.g., "
+                      "with multicore or PACK_TASKS")
+
+        sf.par("LPT_ORDER", required=False, default=True, par_type=bool,
+               docstr="Only for systems which run tasks concurrently (e.g., "
+                      "multicore, slurm). If True, tasks are started in order "
+                      "of their runtime in previous iterations, longest first "
+                      "(Longest Processing Time scheduling), which shortens "
+                      "the time spent waiting on the slowest events")
+
         # Define the Paths required by this module
         # note: PATH.WORKDIR has been set by the entry point seisflows.setup()
         sf.path("SCRATCH", required=False,
@@ -153,7 +175,8 @@ class Base:
         """
         raise NotImplementedError("Must be implemented by subclass")
 
-    def run(self, classname, method, single=False, **kwargs):
+    def run(self, classname, method, single=False, tasktime_scale=1.,
+            **kwargs):
         """
         Runs a task multiple times in am embarassingly parallel fashion
 
@@ -173,6 +196,11 @@ class Base:
             This will change how the job array and the number of tasks is
             defined, such that the job is submitted as a single-core job to
             the system.
+        :type tasktime_scale: float
+        :param tasktime_scale: factor to scale the time limit of each task by,
+            for tasks that do the work of multiple tasks, e.g., evaluating
+            several trial models. Runtimes are recorded in the runtime
+            history divided by this factor, i.e., per unit of work
         :rtype: None
         :return: This function is not expected to return anything
         """
@@ -212,3 +240,187 @@ class Base:
             pickle.dump(kwargs, f)
         save()
 
+        # Remove task profiles left over from the previous call of this task
+        unix.rm(self.profile_path(classname, method))
+
+    def profile_path(self, classname, method):
+        """
+        The directory that each task of classname.method writes its timing
+        and resource record to, see seisflows3.tools.profiler
+
+        :type classname: str
+        :param classname: the class that is run
+        :type method: str
+        :param method: the method from the given `classname` that is run
+        :rtype: str
+        :return: path to the task records
+        """
+        return os.path.join(PATH.SYSTEM, "profiles", f"{classname}_{method}")
+
+    def summarize_profiles(self, classname, method, tasktime_scale=1.):
+        """
+        Aggregates the records written by all tasks of a single call of run()
+        into a table in the stats directory, numbered by call, e.g.,
+        stats/tasks/0003_solver_eval_func.csv, and logs a short summary that
+        can be used to find stragglers and tune task limits
+
+        :type classname: str
+        :param classname: the class that was run
+        :type method: str
+        :param method: the method from the given `classname` that was run
+        :type tasktime_scale: float
+        :param tasktime_scale: the factor that run() scaled the time limit of
+            each task by, see update_history()
+        """
+        records = profiler.read_records(self.profile_path(classname, method))
+        if not records:
+            return
+
+        path = os.path.join(PATH.WORKDIR, CFGPATHS.STATSDIR, "tasks")
+        if not os.path.exists(path):
+            unix.mkdir(path)
+        ncall = len(glob(os.path.join(path, "*.csv"))) + 1
+        fid = os.path.join(path, f"{ncall:0>4}_{classname}_{method}.csv")
+        profiler.write_summary(records, fid)
+
+        self.logger.info(f"{classname}.{method}: {profiler.describe(records)}")
+        self.update_history(classname, method, records, tasktime_scale)
+
+    @property
+    def history_file(self):
+        """
+        :rtype: str
+        :return: file that stores the runtimes of each event, which persists
+            across iterations
+        """
+        return os.path.join(PATH.OUTPUT, "task_history.json")
+
+    def load_history(self, classname, method):
+        """
+        Load the runtime history of a task, i.e., the most recent wall times
+        of classname.method for each event
+
+        :type classname: str
+        :param classname: the class that was run
+        :type method: str
+        :param method: the method from the given `classname` that was run
+        :rtype: dict
+        :return: {source name: [wall times in s per unit of work, oldest
+            first]}
+        """
+        if not os.path.exists(self.history_file):
+            return {}
+        with open(self.history_file) as f:
+            return json.load(f).get(f"{classname}.{method}", {})
+
+    def update_history(self, classname, method, records, tasktime_scale=1.):
+        """
+        Add the wall times of successfully completed tasks to the runtime
+        history. Task ids are matched to events with solver.source_names.
+        Wall times are divided by `tasktime_scale`, so that calls doing
+        different amounts of work per task, e.g., evaluating a different
+        number of trial models, share a single history
+
+        :type classname: str
+        :param classname: the class that was run
+        :type method: str
+        :param method: the method from the given `classname` that was run
+        :type records: list of dict
+        :param records: task records, see seisflows3.tools.profiler
+        :type tasktime_scale: float
+        :param tasktime_scale: amount of work done by each task, in units of
+            a single task
+        """
+        source_names = self._source_names()
+        if not source_names:
+            return
+
+        history = {}
+        if os.path.exists(self.history_file):
+            with open(self.history_file) as f:
+                history = json.load(f)
+
+        task = history.setdefault(f"{classname}.{method}", {})
+        for record in records:
+            if record["status"] != "completed" or \
+                    record["taskid"] >= len(source_names):
+                continue
+            walls = task.setdefault(source_names[record["taskid"]], [])
+            walls.append(round(record["wall"] / tasktime_scale, 3))
+            del walls[:-HISTORY_LENGTH]
+
+        with open(f"{self.history_file}.tmp", "w") as f:
+            json.dump(history, f, indent=4, sort_keys=True)
+        os.replace(f"{self.history_file}.tmp", self.history_file)
+
+    def task_order(self, classname, method, ntask):
+        """
+        Order in which tasks should be started, longest expected runtime
+        first (LPT scheduling). Events without a runtime history are started
+        first, as their cost is unknown, and ties keep the task id order
+
+        :type classname: str
+        :param classname: the class to run
+        :type method: str
+        :param method: the method from the given `classname` to run
+        :type ntask: int
+        :param ntask: number of tasks to run
+        :rtype: list of int
+        :return: task ids in the order they should be started
+        """
+        taskids = list(range(ntask))
+        if not PAR.LPT_ORDER or ntask == 1:
+            return taskids
+
+        history = self.load_history(classname, method)
+        source_names = self._source_names()
+
+        def cost(taskid):
+            try:
+                walls = history[source_names[taskid]][-3:]
+            except (KeyError, IndexError):
+                return float("inf")
+            return sorted(walls)[len(walls) // 2]
+
+        return sorted(taskids, key=lambda taskid: -cost(taskid))
+
+    def predict_runtime(self, classname, method, ntask):
+        """
+        Predict the runtime of the slowest of `ntask` tasks from the runtime
+        history, taking the longest of the recent runtimes of each event
+
+        :type classname: str
+        :param classname: the class to run
+        :type method: str
+        :param method: the method from the given `classname` to run
+        :type ntask: int
+        :param ntask: number of tasks to run
+        :rtype: float or None
+        :return: predicted runtime in s per unit of work, see
+            update_history(), None if any event has no history
+        """
+        history = self.load_history(classname, method)
+        source_names = self._source_names()
+        if len(source_names) < ntask:
+            return None
+
+        runtimes = []
+        for source_name in source_names[:ntask]:
+            if source_name not in history:
+                return None
+            runtimes.append(max(history[source_name][-3:]))
+
+        return max(runtimes)
+
+    def _source_names(self):
+        """
+        Source names of the solver, which map task ids to events
+
+        :rtype: list
+        :return: solver.source_names, or an empty list if not available
+        """
+        try:
+            return list(sys.modules["seisflows_solver"].source_names)
+        except Exception:
+            return []
+
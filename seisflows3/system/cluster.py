@@ -5,10 +5,12 @@ which must be overloaded by subclasses for specific workload managers, or
 specific clusters.
 """
 import sys
+import math
+import time
 import logging
 import subprocess
 
-from seisflows3.tools import msg
+from seisflows3.tools import msg, worker
 from seisflows3.config import custom_import, save, SeisFlowsPathsParameters
 
 
@@ -51,6 +53,24 @@ class Cluster(custom_import("system", "base")):
                       "following format VAR1=var1,VAR2=var2... Will be set"
                       "using os.environs")
 
+        sf.par("NRESUBMIT", required=False, default=0, par_type=int,
+               docstr="Number of times that array tasks which failed for "
+                      "transient reasons (e.g., time limit, node failure, out "
+                      "of memory) are resubmitted on their own before the "
+                      "workflow is stopped. Completed and cancelled tasks "
+                      "are never resubmitted. 0 disables resubmission")
+
+        sf.par("AUTO_TASKTIME", required=False, default=0., par_type=float,
+               docstr="If > 0, the time limit of each task is set to this "
+                      "factor times the longest runtime of the task in "
+                      "previous iterations, rather than TASKTIME. TASKTIME "
+                      "is used until every event has a runtime history")
+
+        sf.par("TIMEOUT_SCALE", required=False, default=1., par_type=float,
+               docstr="Factor by which the task time limit is multiplied each "
+                      "time a task that exceeded its time limit is "
+                      "resubmitted. 1 keeps the original time limit")
+
         return sf
 
     def check(self, validate=True):
@@ -62,6 +82,26 @@ class Cluster(custom_import("system", "base")):
 
         super().check(validate=False)
 
+        assert(PAR.NRESUBMIT >= 0), "NRESUBMIT must be >= 0"
+        assert(PAR.AUTO_TASKTIME == 0 or PAR.AUTO_TASKTIME >= 1), \
+            "AUTO_TASKTIME must be 0 (off) or >= 1"
+        assert(PAR.TIMEOUT_SCALE >= 1), "TIMEOUT_SCALE must be >= 1"
+
+    @property
+    def environs(self):
+        """
+        Environment variables passed to each task, i.e., PAR.ENVIRONS and any
+        variables required by internal options
+
+        :rtype: str
+        :return: environment variables formatted as VAR1=var1,VAR2=var2...
+        """
+        environs = [_ for _ in (PAR.ENVIRONS or "").split(",") if _]
+        if PAR.TASK_WORKER:
+            environs.append(f"{worker.ENV_VAR}=1")
+
+        return ",".join(environs)
+
     def submit(self, submit_call):
         """
         Main insertion point of SeisFlows3 onto the compute system.
@@ -88,7 +128,7 @@ class Cluster(custom_import("system", "base")):
         # check==True: subprocess will wait for workflow.main() to finish
         subprocess.run(submit_call, shell=True, check=True)
 
-    def run(self, classname, method, **kwargs):
+    def run(self, classname, method, tasktime_scale=1., **kwargs):
         """
         Runs a task multiple times in parallel
 
@@ -103,6 +143,233 @@ class Cluster(custom_import("system", "base")):
         """
         raise NotImplementedError('Must be implemented by subclass.')
 
+    def monitor_job_array(self, job_ids, query, complete_states, fail_states,
+                          stop_on_fail=True, min_wait=5, max_wait=60,
+                          backoff=1.5):
+        """
+        Polls the workload manager until all jobs in an array have finished.
+        Each poll queries the state of ALL jobs with a single call to the
+        workload manager (provided by `query`), rather than one call per job.
+
+        The wait between polls grows geometrically by `backoff` (up to
+        `max_wait`) while job states remain unchanged, and resets to
+        `min_wait` whenever any state changes, so that short tasks are picked
+        up quickly while long tasks do not hammer the scheduler.
+
+        :type job_ids: list of str
+        :param job_ids: job ids to monitor, e.g. ['441636_0', '441636_1']
+        :type query: function
+        :param query: function which takes `job_ids` and returns a dictionary
+            of {job_id: state} using a single workload manager call. Jobs
+            missing from the dictionary are assigned the state 'UNDEFINED'
+        :type complete_states: list of str
+        :param complete_states: states that define a successfully finished job
+        :type fail_states: list of str
+        :param fail_states: states that define a failed job. Partial matches
+            are allowed as states may be returned as e.g., 'CANCELLED+'
+        :type stop_on_fail: bool
+        :param stop_on_fail: return as soon as any job has failed, rather than
+            waiting for all jobs to reach a complete or failed state
+        :type min_wait: float
+        :param min_wait: minimum wait time between queries in seconds
+        :type max_wait: float
+        :param max_wait: maximum wait time between queries in seconds
+        :type backoff: float
+        :param backoff: multiplicative increase of wait time between queries
+            for which no job states changed
+        :rtype: dict
+        :return: {job_id: state} for all `job_ids` at the time of return
+        """
+        wait = min_wait
+        prev_states = None
+        count = 0
+        while True:
+            time.sleep(wait)
+            returned = query(job_ids)
+            states = {job_id: returned.get(job_id, "UNDEFINED").upper()
+                      for job_id in job_ids}
+
+            failed = [job_id for job_id, state in states.items()
+                      if any([check in state for check in fail_states])]
+            finished = [job_id for job_id, state in states.items()
+                        if state in complete_states]
+
+            if len(finished) == len(job_ids):
+                return states
+            elif failed and (stop_on_fail or
+                             len(failed) + len(finished) == len(job_ids)):
+                return states
+
+            # If the query is not working, we'll get stuck in a loop
+            if "UNDEFINED" in states.values():
+                count += 1
+                # Every 10 counts, warn the user this is unexpected behavior
+                if not count % 10:
+                    job_id = [j for j, s in states.items()
+                              if s == "UNDEFINED"][0]
+                    self.logger.warning(f"job state query for {job_id} has "
+                                        f"returned unexpected response {count} "
+                                        f"times. This job may have failed "
+                                        f"unexpectedly. Consider checking "
+                                        f"manually")
+
+            # Adaptive backoff, reset the wait time if anything has changed
+            if states == prev_states:
+                wait = min(wait * backoff, max_wait)
+            else:
+                wait = min_wait
+            prev_states = states
+
+    def tasktime(self, classname, method, ntask, tasktime_scale=1.):
+        """
+        The time limit for each of `ntask` tasks of classname.method. If
+        `AUTO_TASKTIME` is set, this is derived from the runtime history
+
+        :type classname: str
+        :param classname: the class to run
+        :type method: str
+        :param method: the method from the given `classname` to run
+        :type ntask: int
+        :param ntask: number of tasks to run
+        :type tasktime_scale: float
+        :param tasktime_scale: amount of work done by each task, in units of
+            a single task, which the predicted runtime is multiplied by
+        :rtype: int or None
+        :return: time limit in minutes, or None to keep the default limit
+        """
+        if not PAR.AUTO_TASKTIME:
+            return None
+        runtime = self.predict_runtime(classname, method, ntask)
+        if runtime is None:
+            return None
+
+        return max(1, math.ceil(runtime * tasktime_scale *
+                                PAR.AUTO_TASKTIME / 60))
+
+    def schedule_array(self, submit, query, indices, task, complete_states,
+                       fail_states, timeout_states=None, retry_states=None,
+                       retry=None, **kwargs):
+        """
+        Submits a job array and monitors it until all array tasks have
+        completed, following the retry policy set by the parameters:
+
+        - array tasks that failed in one of the `retry_states` are
+          resubmitted on their own as soon as their failure is noticed, while
+          the remaining tasks continue to run. Any other failure stops the
+          workflow,
+        - each task is attempted at most `NRESUBMIT` + 1 times before the
+          workflow is stopped,
+        - tasks that failed in one of the `timeout_states` are resubmitted
+          with their time limit scaled by `TIMEOUT_SCALE`,
+        - completed tasks are never resubmitted.
+
+        Every failed attempt is recorded and logged once the array finishes.
+
+        :type submit: function
+        :param submit: function which takes a list of array indices and a
+            time limit scale factor, submits those indices as a job array and
+            returns {job_id: array index} of the submitted jobs
+        :type query: function
+        :param query: function which takes job ids and returns their states,
+            see monitor_job_array()
+        :type indices: list of int
+        :param indices: array indices to run
+        :type task: str
+        :param task: name of the task being run, used for log messages
+        :type complete_states: list of str
+        :param complete_states: states that define a successfully finished job
+        :type fail_states: list of str
+        :param fail_states: states that define a failed job, partial matches
+            are allowed as states may be returned as e.g., 'CANCELLED+'
+        :type timeout_states: list of str
+        :param timeout_states: failed states that signify a job exceeded its
+            time limit
+        :type retry_states: list of str
+        :param retry_states: failed states of transient failures, after which
+            a job is resubmitted. Defaults to all `fail_states`
+        :type retry: function
+        :param retry: function which takes the job id and array index of a
+            failed job and returns the array indices to resubmit in its place,
+            e.g., only the failed tasks of a job running multiple tasks.
+            Replacements take over the failed attempts of the index they
+            replace. By default the failed index itself is resubmitted
+        :rtype: dict
+        :return: {array index: [failed attempts]} where each failed attempt
+            is a string of the job id and its final state
+        """
+        timeout_states = timeout_states or []
+        retry_states = fail_states if retry_states is None else retry_states
+        retry = retry or (lambda job_id, index: [index])
+        attempts = {index: [] for index in indices}
+        scales = {index: 1. for index in indices}
+
+        jobs = submit(indices, 1.)
+        while jobs:
+            # Returns as soon as any job fails, so it can be resubmitted while
+            # the rest of the array continues to run
+            states = self.monitor_job_array(job_ids=list(jobs), query=query,
+                                            complete_states=complete_states,
+                                            fail_states=fail_states, **kwargs)
+            resubmit = {}
+            for job_id, state in states.items():
+                if state in complete_states:
+                    jobs.pop(job_id)
+                    continue
+                elif not any([check in state for check in fail_states]):
+                    continue
+
+                index = jobs.pop(job_id)
+                attempts[index].append(f"{job_id} {state}")
+                if len(attempts[index]) > PAR.NRESUBMIT or \
+                        not any([check in state for check in retry_states]):
+                    self._log_attempts(task, attempts)
+                    print(msg.cli((f"Stopping workflow for {state} job after "
+                                   f"{len(attempts[index])} attempts. Please "
+                                   f"check log file for details."),
+                                  items=[f"TASK:     {task}",
+                                         f"TASK ID:  {job_id}",
+                                         f"ATTEMPTS: "
+                                         f"{', '.join(attempts[index])}"],
+                                  header="run error", border="="))
+                    sys.exit(-1)
+
+                if any([check in state for check in timeout_states]):
+                    scales[index] *= PAR.TIMEOUT_SCALE
+                indices_ = retry(job_id, index)
+                if indices_ != [index]:
+                    failed, scale = attempts.pop(index), scales.pop(index)
+                    for index_ in indices_:
+                        attempts[index_], scales[index_] = list(failed), scale
+                for index_ in indices_:
+                    resubmit.setdefault(scales[index_], []).append(index_)
+                    self.logger.warning(
+                        f"{task} job {job_id} returned {state}, resubmitting "
+                        f"array index {index_} (attempt "
+                        f"{len(attempts[index_]) + 1}, time limit "
+                        f"x{scales[index_]:.2f})")
+
+            # Tasks with the same time limit are resubmitted as one array
+            for scale, indices_ in resubmit.items():
+                jobs.update(submit(indices_, scale))
+
+        self._log_attempts(task, attempts)
+
+        return {index: failed for index, failed in attempts.items() if failed}
+
+    def _log_attempts(self, task, attempts):
+        """
+        Log a record of all failed attempts of a job array
+
+        :type task: str
+        :param task: name of the task being run
+        :type attempts: dict
+        :param attempts: {array index: [failed attempts]}
+        """
+        for index, failed in attempts.items():
+            if failed:
+                self.logger.info(f"{task} array index {index} failed "
+                                 f"{len(failed)} time(s): {', '.join(failed)}")
+
     def taskid(self):
         """
         Provides a unique identifier for each running task. This is
@@ -113,3 +380,27 @@ class Cluster(custom_import("system", "base")):
             identifier.
         """
         raise NotImplementedError('Must be implemented by subclass.')
+
+
+def array_spec(indices, offset=0):
+    """
+    Formats array indices as a compact job array specification, e.g.,
+    [0, 1, 2, 5, 7, 8] -> '0-2,5,7-8'
+
+    :type indices: list of int
+    :param indices: array indices
+    :type offset: int
+    :param offset: offset added to each index, e.g., 1 for 1-based arrays
+    :rtype: str
+    :return: array specification without a concurrent task throttle
+    """
+    ranges = []
+    for index in sorted(indices):
+        index += offset
+        if ranges and index == ranges[-1][1] + 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+
+    return ",".join([f"{first}" if first == last else f"{first}-{last}"
+                     for first, last in ranges])
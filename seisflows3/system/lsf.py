@@ -7,13 +7,15 @@ using the Platform Load Sharing Facility (LSF) workload management platform.
 """
 import os
 import sys
+import math
 import time
 import logging
 import subprocess
 
-from seisflows3.tools import msg, unix
+from seisflows3.tools import unix
 from seisflows3.tools.wrappers import findpath
-from seisflows3.config import custom_import, SeisFlowsPathsParameters
+from seisflows3.config import ROOT_DIR, custom_import, SeisFlowsPathsParameters
+from seisflows3.system.cluster import array_spec
 
 
 PAR = sys.modules['seisflows_parameters']
@@ -71,6 +73,8 @@ class Lsf(custom_import("system", "cluster")):
                docstr="Any optional, additional LSG arguments that will be "
                       "passed to the LSF submit scripts")
 
+        return sf
+
     def submit(self, workflow):
         """
         Submits workflow
@@ -91,149 +95,140 @@ class Lsf(custom_import("system", "cluster")):
 
         super().submit(workflow, submit_call)
 
-    def run(self, classname, method, *args, **kwargs):
+    def run(self, classname, method, single=False, tasktime_scale=1.,
+            **kwargs):
         """
         Runs task multiple times in embarrassingly parallel fasion on the
         maui cluster
 
         Executes classname.method(*args, **kwargs) NTASK times,
-        each time on NPROC CPU cores
+        each time on NPROC CPU cores. Failed array tasks are resubmitted
+        following the retry policy defined in Cluster.schedule_array()
+
+        .. note::
+            LSF reports all failed jobs with the state EXIT, so time limits
+            are not scaled by TIMEOUT_SCALE on resubmission, and with
+            NRESUBMIT > 0 every failed job, including jobs killed by the
+            user, is resubmitted
 
         :type classname: str
         :param classname: the class to run
         :type method: str
         :param method: the method from the given `classname` to run
+        :type single: bool
+        :param single: run a single-process, non-parallel task
+        :type tasktime_scale: float
+        :param tasktime_scale: factor to scale the TASKTIME limit by, for tasks
+            that do the work of multiple tasks
         """
         # Checkpoint this individual method before proceeding
-        self.checkpoint(PATH.OUTPUT, classname, method, args, kwargs)
-
-        # Submit job array
-        run_call = " ".join([
-            f"bsub",
-            f"{PAR.LSFARGS}",
-            f"-J {PAR.TITLE}",
-            f"-n {PAR.NPROC}",
-            f'-R "span[ptile={PAR.NODESIZE}"',
-            f"-W {PAR.TASKTIME:d}:00",
-            f"-o {os.path.join(PATH.WORKDIR, 'output.logs', '%J_%I')}",
-            f"[1-{PAR.NTASK}] % {PAR.NTASKMAX}",
-            f"{os.path.join(findpath('seisflows.system'), 'wrappers', 'run')}",
-            f"{PATH.OUTPUT}",
-            f"{classname}",
-            f"{method}",
-            f"{PAR.ENVIRONS}"
-        ])
-
-        stdout = subprocess.check_output(run_call, shell=True)
-
-        # keep track of job ids
-        jobs = self.job_id_list(stdout, PAR.NTASK)
+        self.checkpoint(PATH.OUTPUT, classname, method, kwargs)
 
-        while True:
-            # Wait seconds before checking status again
-            time.sleep(30)
-            self.timestamp()
-            isdone, jobs = self.job_status(classname, method, jobs)
-            if isdone:
-                return
-
-    def run_single(self, classname, method, *args, **kwargs):
-        """ Runs task multiple times in embarrassingly parallel fasion
-
-          Executes classname.method(*args, **kwargs) NTASK times, each time on
-          NPROC cpu cores
-        """
-        # Checkpoint this individual method before proceeding
-        self.checkpoint(PATH.OUTPUT, classname, method, args, kwargs)
+        ntask = 1 if single else PAR.NTASK
+        environs = self.environs
+        if single:
+            environs = ",".join([_ for _ in [environs, "SEISFLOWS_TASKID=0"]
+                                 if _])
 
-        # Submit job array
+        # The job array specification is filled in for each submission
         run_call = " ".join([
             f"bsub",
             f"{PAR.LSFARGS}",
-            f"-J {PAR.TITLE}",
+            f'-J "{PAR.TITLE}[{{array}}]%{{throttle}}"',
             f"-n {PAR.NPROC}",
-            f'-R "span[ptile={PAR.NODESIZE}"',
-            f"-W {PAR.TASKTIME:d}:00",
-            f"-o {os.path.join(PATH.WORKDIR, 'output.logs', '%J')}",
-            f"[1-1]",
-            f"{os.path.join(findpath('seisflows.system'), 'wrappers', 'run')}",
-            f"{PATH.OUTPUT}",
-            f"{classname}",
-            f"{method}",
-            f"{PAR.ENVIRONS}"
+            f'-R "span[ptile={PAR.NODESIZE}]"',
+            f"-W {math.ceil(PAR.TASKTIME * tasktime_scale):.0f}",
+            f"-o {os.path.join(PATH.WORKDIR, 'logs', '%J_%I')}",
+            f"{os.path.join(ROOT_DIR, 'scripts', 'run')}",
+            f"--output {PATH.OUTPUT}",
+            f"--classname {classname}",
+            f"--funcname {method}",
+            f"--environment {environs}"
         ])
 
-        stdout = check_output(run_call, shell=True)
-
-        # keep track of job ids
-        jobs = self.job_id_list(stdout, ntask=1)
+        try:
+            self.schedule_array(
+                submit=lambda indices, scale: self._submit_array(run_call,
+                                                                 indices),
+                query=self._query, indices=list(range(ntask)),
+                task=f"{classname}.{method}", complete_states=["DONE"],
+                fail_states=["EXIT"], min_wait=30, max_wait=300
+            )
+        finally:
+            self.summarize_profiles(classname, method, tasktime_scale)
+        self.timestamp()
 
-        while True:
-            # Wait seconds before checking status again
-            time.sleep(30)
-            self.timestamp()
-            isdone, jobs = self.job_status(classname, method, jobs)
-            if isdone:
-                return
-
-    def job_id_list(self, stdout, ntask):
+    def run_single(self, classname, method, *args, **kwargs):
         """
-        Parses job id list from sbatch standard output
+        Runs task a single time
 
-        :type stdout: str
-        :param stdout: the output of subprocess.check_output()
-        :type ntask: int
-        :param ntask: number of tasks currently running
+        Executes classname.method(*args, **kwargs) a single time on NPROC
+        cpu cores
         """
-        job = stdout.split()[1].strip()[1:-1]
-        if ntask == 1:
-            return [job]
-        else:
-            number_jobs = range(1, PAR.NSRC + 1)
-            return ["{job}[{}]".format(_) for _ in number_jobs]
+        self.run(classname, method, single=True, **kwargs)
 
-    def job_status(self, classname, method, jobs):
+    def _submit_array(self, run_call, indices):
         """
-        Queries completion status of a single job
-
-        :type job: str
-        :param job: job id to query
+        Submits the given array indices of a job array, of which at most
+        `NTASKMAX` tasks run concurrently. LSF job arrays are 1-based
+
+        :type run_call: str
+        :param run_call: bsub command line call with '{array}' and
+            '{throttle}' fields
+        :type indices: list of int
+        :param indices: 0-based array indices to submit
+        :rtype: dict
+        :return: {job_id: array index} of the submitted array tasks
         """
-        job_finished = []
-        for job in jobs:
-            state = self._query(job)
-            if state == "DONE":
-                job_finished.append(True)
-            else:
-                job_finished.append(False)
+        throttle = max(1, min(PAR.NTASKMAX, len(indices)))
+        run_call = run_call.format(array=array_spec(indices, offset=1),
+                                   throttle=throttle)
+        self.logger.debug(run_call)
 
-            if state == "EXIT":
-                print(msg.cli(f"LSF job {job} failed to execute "
-                              f"{classname}.{method}.", header="error",
-                              border="="))
-                sys.exit(-1)
+        stdout = subprocess.run(run_call, stdout=subprocess.PIPE, text=True,
+                                shell=True).stdout
 
-        isdone = all(job_finished)
-
-        return isdone, jobs
+        # e.g., 'Job <1234> is submitted to queue <normal>.'
+        job = stdout.split()[1].strip()[1:-1]
+        return {f"{job}[{index + 1}]": index for index in indices}
 
-    def _query(self, jobid):
+    def _query(self, jobs):
         """
-        Retrives job state from LSF database
+        Retrives the states of all jobs from the LSF database with a single
+        call to bjobs, e.g. for job arrays:
 
-        :type jobid: str
-        :param jobid: job id to query LSF system about
-        """
-        # Write the job status output to a temporary file
-        with open(os.path.join(PATH.SYSTEM, "job_status", "w")) as f:
-            call('bjobs -a -d "{jobid}"', stdout=f)
+            $ bjobs -a -noheader -o "jobid jobindex stat" 1234
+            1234 1 DONE
+            1234 2 RUN
 
-        # Read the job status back from the text file
-        with open(os.path.join(PATH.SYSTEM, "job_status", "r")) as f:
-            lines = f.readlines()
-            state = lines[1].split()[2].strip()
+        :type jobs: list of str
+        :param jobs: job ids to query LSF system about
+        :rtype: dict
+        :return: {job_id: state} for all jobs returned by bjobs
+        """
+        parents = []
+        for job in jobs:
+            parent = job.split("[")[0]
+            if parent not in parents:
+                parents.append(parent)
+
+        stdout = subprocess.run(
+            f'bjobs -a -noheader -o "jobid jobindex stat" {" ".join(parents)}',
+            stdout=subprocess.PIPE, text=True, shell=True).stdout
+
+        states = {}
+        for line in stdout.strip().split("\n"):
+            try:
+                jobid, jobindex, state = line.split()
+            except ValueError:
+                continue
+            # Non-array jobs have a job index of 0
+            if int(jobindex) == 0:
+                states[jobid] = state
+            else:
+                states[f"{jobid}[{jobindex}]"] = state
 
-        return state
+        return states
 
     def taskid(self):
         """
@@ -245,7 +240,7 @@ class Lsf(custom_import("system", "cluster")):
         """
         Timestamp the current running job
         """
-        with open(os.path.join(PATH.SYSTEM, "timestamps", "a")) as f:
+        with open(os.path.join(PATH.SYSTEM, "timestamps"), "a") as f:
             f.write(time.strftime("%H:%M:%S"))
             f.write("\n")
 
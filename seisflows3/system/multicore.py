@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+This is a subclass seisflows.system.multicore
+Provides utilities for running tasks concurrently on a single machine with
+multiple cores, e.g., a large workstation or an interactive compute node
+"""
+import os
+import sys
+import logging
+import subprocess
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from seisflows3.tools import msg, unix, worker
+from seisflows3.tools.wrappers import nproc
+from seisflows3.config import (ROOT_DIR, CFGPATHS, custom_import,
+                               SeisFlowsPathsParameters)
+
+PAR = sys.modules["seisflows_parameters"]
+PATH = sys.modules["seisflows_paths"]
+
+
+class Multicore(custom_import("system", "workstation")):
+    """
+    Run tasks in parallel on a single local machine.
+
+    Each task is run as its own Python process through the same 'scripts/run'
+    entry point used by cluster systems, which loads the checkpointed working
+    state and evaluates the requested function. Up to NPROCMAX // NPROC
+    tasks are run at any given time. With PAR.TASK_WORKER, tasks are handed
+    to a persistent worker process which keeps the working state loaded.
+    """
+    logger = logging.getLogger(__name__).getChild(__qualname__)
+
+    @property
+    def required(self):
+        """
+        A hard definition of paths and parameters required by this class,
+        alongside their necessity for the class and their string explanations.
+        """
+        sf = SeisFlowsPathsParameters(super().required)
+
+        sf.par("NPROCMAX", required=False, default=None, par_type=int,
+               docstr="Maximum number of cores available to run tasks. Up to "
+                      "NPROCMAX // NPROC tasks will be run concurrently. If "
+                      "left blank, defaults to all available cores")
+
+        return sf
+
+    def check(self, validate=True):
+        """
+        Checks parameters and paths
+        """
+        super().check(validate=validate)
+
+        assert(self.nprocmax >= PAR.NPROC), \
+            f"NPROCMAX ({self.nprocmax}) must be >= NPROC ({PAR.NPROC})"
+
+    @property
+    def nprocmax(self):
+        """
+        The number of cores available to run tasks
+
+        :rtype: int
+        :return: PAR.NPROCMAX, or all available cores if not set
+        """
+        return PAR.NPROCMAX or nproc()
+
+    def run(self, classname, method, single=False, tasktime_scale=1.,
+            **kwargs):
+        """
+        Executes task multiple times in parallel, each task as a separate
+        process with its own SEISFLOWS_TASKID.
+
+        .. note::
+            kwargs will be passed to the underlying `method` that is called
+
+        :type classname: str
+        :param classname: the class to run
+        :type method: str
+        :param method: the method from the given `classname` to run
+        :type single: bool
+        :param single: run a single-process, non-parallel task, such as
+            smoothing the gradient, which only needs to be run by once.
+        :type tasktime_scale: float
+        :param tasktime_scale: tasks are not time limited, only used to
+            record runtimes per unit of work in the runtime history
+        """
+        self.checkpoint(PATH.OUTPUT, classname, method, kwargs)
+
+        if single:
+            ntasks = 1
+        else:
+            ntasks = PAR.NTASK
+
+        unix.mkdir(os.path.join(PATH.WORKDIR, CFGPATHS.LOGDIR))
+        nworkers = max(1, min(ntasks, self.nprocmax // PAR.NPROC))
+        self.logger.info(f"running task {classname}_{method} {ntasks} times, "
+                         f"{nworkers} at a time")
+
+        # Threads only wait on the task subprocesses, which do the actual work.
+        # Tasks are started longest first if a runtime history is available
+        taskids = self.task_order(classname, method, ntasks)
+        run_task = partial(self._run_task, classname, method)
+        with ThreadPoolExecutor(max_workers=nworkers) as executor:
+            returncodes = list(executor.map(run_task, taskids))
+        self.summarize_profiles(classname, method, tasktime_scale)
+
+        # EXIT CONDITION: if any of the tasks returned a non-zero exit code
+        failed = sorted([taskid for taskid, code in zip(taskids, returncodes)
+                         if code])
+        if failed:
+            log = self._task_log(classname, method, failed[0])
+            print(msg.cli(f"Stopping workflow for {len(failed)} failed "
+                          f"task(s). Please check log files for details.",
+                          items=[f"TASK:     {classname}.{method}",
+                                 f"TASK IDS: {failed}",
+                                 f"LOG:      {log}"],
+                          header="multicore run error", border="="))
+            sys.exit(-1)
+
+        self.logger.info(f"Task {classname}.{method} finished successfully")
+
+    def _run_task(self, classname, method, taskid):
+        """
+        Runs a single task as a subprocess, with stdout and stderr directed to
+        a task-specific log file
+
+        :type classname: str
+        :param classname: the class to run
+        :type method: str
+        :param method: the method from the given `classname` to run
+        :type taskid: int
+        :param taskid: the task id given to the process
+        :rtype: int
+        :return: exit code of the task process
+        """
+        run_call = [sys.executable, os.path.join(ROOT_DIR, "scripts", "run"),
+                    "--output", PATH.OUTPUT, "--classname", classname,
+                    "--funcname", method]
+
+        # os environment variables can only be strings, these need to be
+        # converted back to integers by system.taskid()
+        env = dict(os.environ, SEISFLOWS_TASKID=str(taskid))
+        if PAR.TASK_WORKER:
+            env[worker.ENV_VAR] = "1"
+
+        with open(self._task_log(classname, method, taskid), "w") as f:
+            process = subprocess.run(run_call, env=env, stdout=f,
+                                     stderr=subprocess.STDOUT)
+
+        return process.returncode
+
+    def _task_log(self, classname, method, taskid):
+        """
+        Returns the log file for a given task
+
+        :rtype: str
+        :return: path to the task-specific log file
+        """
+        return os.path.join(PATH.WORKDIR, CFGPATHS.LOGDIR,
+                            f"{classname}_{method}_{taskid:0>2}.log")
@@ -16,16 +16,21 @@ Useful commands for figuring out system-specific required parameters
 import os
 import sys
 import math
-import time
 import logging
 import subprocess
 
 from seisflows3.tools import msg
 from seisflows3.config import ROOT_DIR, custom_import, SeisFlowsPathsParameters
+from seisflows3.system.cluster import array_spec
 
 PAR = sys.modules["seisflows_parameters"]
 PATH = sys.modules["seisflows_paths"]
 
+# SLURM job states which signify that a job has failed and will not complete
+BAD_STATES = ["TIMEOUT", "FAILED", "NODE_FAIL", "OUT_OF_MEMORY", "CANCELLED"]
+# Failed states of transient failures, which are worth resubmitting
+RETRY_STATES = ["TIMEOUT", "NODE_FAIL", "OUT_OF_MEMORY"]
+
 
 class Slurm(custom_import("system", "cluster")):
     """
@@ -59,6 +64,11 @@ class Slurm(custom_import("system", "cluster")):
         sf.par("NTASKMAX", required=False, default=100, par_type=int,
                docstr="Limit on the number of concurrent tasks in array")
 
+        sf.par("PACK_TASKS", required=False, default=False, par_type=bool,
+               docstr="Run multiple tasks concurrently inside each array job "
+                      "when NPROC is smaller than NODESIZE, packing up to "
+                      "NODESIZE // NPROC tasks onto a single node")
+
         sf.par("NODESIZE", required=True, par_type=int,
                docstr="The number of cores per node defined by the system")
 
@@ -96,12 +106,32 @@ class Slurm(custom_import("system", "cluster")):
 
         super().submit(submit_call)
 
-    def run(self, classname, method, single=False, run_call=None, **kwargs):
+    @property
+    def npack(self):
+        """
+        The number of tasks packed into each array job, which is larger than 1
+        only if PAR.PACK_TASKS is set and multiple tasks fit on one node
+
+        :rtype: int
+        :return: number of tasks run concurrently by each array job
+        """
+        if not PAR.PACK_TASKS:
+            return 1
+        return max(1, min(PAR.NODESIZE // PAR.NPROC, PAR.NTASK))
+
+    def run(self, classname, method, single=False, run_call=None,
+            tasktime_scale=1., **kwargs):
         """
         Runs task multiple times in embarrassingly parallel fasion on a SLURM
         cluster. Executes classname.method(*args, **kwargs) `NTASK` times,
         each time on `NPROC` CPU cores
 
+        Tasks are submitted as a job array, of which at most `NTASKMAX` tasks
+        run concurrently. Array tasks that fail are resubmitted on their own
+        as soon as their failure is noticed, up to `NRESUBMIT` times, while
+        the remaining tasks continue to run. Of packed array jobs, only the
+        failed tasks are resubmitted, one task per array job.
+
         .. note::
             The actual CLI call structure looks something like this
             $ sbatch --args scripts/run OUTPUT class method environs
@@ -120,6 +150,13 @@ class Slurm(custom_import("system", "cluster")):
         :param run_call: subclasses (e.g., specific SLURM cluster subclasses)
             can overload the sbatch command line input by setting
             run_call. If set to None, default run_call will be set here.
+            The '--array' argument is set for each submission of the array
+        :type tasktime_scale: float
+        :param tasktime_scale: factor to scale the '--time' limit of the run
+            call by, for tasks that do the work of multiple tasks, e.g.,
+            evaluating several trial models one after another. Time limits
+            derived from the runtime history are scaled by the same factor,
+            as runtimes are recorded per unit of work
         """
         self.checkpoint(PATH.OUTPUT, classname, method, kwargs)
 
@@ -135,76 +172,216 @@ class Slurm(custom_import("system", "cluster")):
                 f"--ntasks={PAR.NPROC:d}",
                 f"--time={PAR.TASKTIME:d}",
                 f"--output={os.path.join(PATH.WORKDIR, 'logs', '%A_%a')}",
-                f"--array=0-{PAR.NTASK-1 % PAR.NTASKMAX}",
+                f"--array=0-{PAR.NTASK - 1}%{PAR.NTASKMAX}",
                 f"{os.path.join(ROOT_DIR, 'scripts', 'run')}",
                 f"--output {PATH.OUTPUT}",
                 f"--classname {classname}",
                 f"--funcname {method}",
-                f"--environment {PAR.ENVIRONS or ''}"
+                f"--environment {self.environs}"
             ])
-            self.logger.debug(run_call)
 
-        # Single-process jobs simply need to replace a few sbatch arguments.
-        # Do it AFTER `run_call` has been defined so that subclasses submitting
-        # custom run calls can still benefit from this
+        # Single-process jobs and packed tasks simply need to replace a few
+        # sbatch arguments. Do it AFTER `run_call` has been defined so that
+        # subclasses submitting custom run calls can still benefit from this
         if single:
             self.logger.info("replacing parts of sbatch run call for single "
                              "process job")
-            for part in run_call.split(" "):
-                if "--array" in part:
-                    run_call.replace(part, "--array=0-0")
-                elif "--ntasks" in part:
-                    run_call.replace(part, "--ntasks=1")
-            # Append taskid to environment variable, deal with the case where
-            # PAR.ENVIRONS is an empty string
-            task_id_str = "SEISFLOWS_TASKID=0"
-            if not run_call.strip().endswith("--environment"):
-                task_id_str = f",{task_id_str}"  # appending to the list of vars
-            run_call += task_id_str
-            self.logger.debug(run_call)
+            njobs = 1
+            run_call = set_sbatch_args(run_call, ntasks=1)
+            run_call = append_environs(run_call, "SEISFLOWS_TASKID=0")
+        elif self.npack > 1:
+            self.logger.info(f"packing {self.npack} tasks into each array job")
+            njobs = math.ceil(PAR.NTASK / self.npack)
+            run_call = set_sbatch_args(run_call, nodes=1,
+                                       ntasks=self.npack * PAR.NPROC)
+            run_call = append_environs(
+                run_call, f"SEISFLOWS_NPACK={self.npack},"
+                          f"SEISFLOWS_NTASK={PAR.NTASK}")
+        else:
+            njobs = PAR.NTASK
+
+        # Array indices are mapped to task ids by scripts/run, so that the
+        # longest running tasks are started first
+        packs = None
+        if not single:
+            order = self.task_order(classname, method, PAR.NTASK)
+            if order != sorted(order):
+                self.logger.debug(f"task order: {order}")
+                run_call = append_environs(
+                    run_call,
+                    f"SEISFLOWS_TASKORDER={':'.join(map(str, order))}")
+            if self.npack > 1:
+                packs = {index: order[index * self.npack:
+                                      (index + 1) * self.npack]
+                         for index in range(njobs)}
+
+            tasktime = self.tasktime(classname, method, PAR.NTASK,
+                                     tasktime_scale)
+            if tasktime is not None:
+                self.logger.info(f"setting time limit of {classname}.{method} "
+                                 f"to {tasktime} min. from runtime history")
+                run_call = set_sbatch_args(run_call, time=tasktime)
+            elif tasktime_scale != 1:
+                self.logger.info(f"scaling time limit of {classname}.{method} "
+                                 f"by {tasktime_scale}")
+                run_call = self._scale_time(run_call, tasktime_scale)
+
+        try:
+            self.run_array(run_call, indices=list(range(njobs)),
+                           task=f"{classname}.{method}", packs=packs)
+        finally:
+            self.summarize_profiles(classname, method, tasktime_scale)
+
+        self.logger.info(f"Task {classname}.{method} finished successfully")
+
+    def run_array(self, run_call, indices, task, packs=None):
+        """
+        Submits a job array and monitors it until all array tasks have
+        completed, resubmitting failed array tasks following the retry policy
+        defined in Cluster.schedule_array(). Tasks that were stopped by SLURM
+        for exceeding their time limit are resubmitted with a longer limit if
+        `TIMEOUT_SCALE` is set
+
+        Failed array jobs of packed tasks are not resubmitted as a whole.
+        Instead, each of their failed tasks is resubmitted as an array job of
+        a single task, whose array index is the task id. The failed tasks are
+        recorded by scripts/run, if no record exists (e.g., the job timed
+        out) all of the tasks of the array job are resubmitted
+
+        :type run_call: str
+        :param run_call: sbatch command line call, whose '--array' argument
+            is replaced for each submission
+        :type indices: list of int
+        :param indices: array indices to run
+        :type task: str
+        :param task: name of the task being run, used for log messages
+        :type packs: dict
+        :param packs: {array index: task ids} if `run_call` packs multiple
+            tasks into each array job
+        :rtype: dict
+        :return: {array index: [failed attempts]}, where array indices are
+            given as (number of packed tasks, array index) if `packs` is set
+        """
+        self.logger.debug(run_call)
+        if not packs:
+            return self.schedule_array(
+                submit=lambda indices_, scale: self._submit_array(
+                    run_call, indices_, scale),
+                query=query_job_states, indices=indices, task=task,
+                complete_states=["COMPLETED"], fail_states=BAD_STATES,
+                timeout_states=["TIMEOUT"], retry_states=RETRY_STATES
+            )
+
+        # Unpacked array jobs run the task id given by their array index
+        single_call = append_environs(
+            set_sbatch_args(run_call, ntasks=PAR.NPROC),
+            "SEISFLOWS_NPACK=1,SEISFLOWS_TASKORDER="
+        )
+
+        def submit(indices_, scale):
+            jobs = {}
+            for npack, call in [(self.npack, run_call), (1, single_call)]:
+                submitted = [index for n, index in indices_ if n == npack]
+                if submitted:
+                    jobs.update({
+                        job_id: (npack, index) for job_id, index in
+                        self._submit_array(call, submitted, scale,
+                                           npack=npack).items()
+                    })
+            return jobs
+
+        def retry(job_id, index):
+            npack, index = index
+            if npack == 1:
+                return [(npack, index)]
+            return [(1, taskid) for taskid in
+                    self._failed_taskids(job_id, packs[index])]
+
+        return self.schedule_array(
+            submit=submit, query=query_job_states,
+            indices=[(self.npack, index) for index in indices], task=task,
+            complete_states=["COMPLETED"], fail_states=BAD_STATES,
+            timeout_states=["TIMEOUT"], retry_states=RETRY_STATES,
+            retry=retry
+        )
+
+    def _failed_taskids(self, job_id, taskids):
+        """
+        Returns the failed tasks of a failed array job of packed tasks, as
+        recorded by scripts/run in 'failed_tasks/<job id>' of the output
+        directory
+
+        :type job_id: str
+        :param job_id: id of the failed array job, e.g., '441636_2'
+        :type taskids: list of int
+        :param taskids: task ids packed into the array job
+        :rtype: list of int
+        :return: task ids that failed, all `taskids` if none were recorded
+        """
+        fid = os.path.join(PATH.OUTPUT, "failed_tasks", job_id)
+        if not os.path.exists(fid):
+            return taskids
+        with open(fid, "r") as f:
+            failed = [int(taskid) for taskid in f.read().split()]
+
+        return [taskid for taskid in taskids if taskid in failed] or taskids
+
+    def _submit_array(self, run_call, indices, scale=1., npack=None):
+        """
+        Submits the given array indices of a job array, of which at most
+        `NTASKMAX` tasks run concurrently
+
+        :type run_call: str
+        :param run_call: sbatch command line call
+        :type indices: list of int
+        :param indices: array indices to submit
+        :type scale: float
+        :param scale: factor to scale the '--time' limit of the run call by
+        :type npack: int
+        :param npack: number of tasks packed into each array job, defaults to
+            `npack`
+        :rtype: dict
+        :return: {job_id: array index} of the submitted array tasks
+        """
+        npack = npack or self.npack
+        throttle = max(1, min(PAR.NTASKMAX // npack, len(indices)))
+        run_call = set_sbatch_args(
+            run_call, array=f"{array_spec(indices)}%{throttle}")
+
+        if scale != 1:
+            run_call = self._scale_time(run_call, scale)
+        self.logger.debug(run_call)
 
         # The standard response from SLURM when submitting jobs
         # is something like 'Submitted batch job 441636', we want job number
         stdout = subprocess.run(run_call, stdout=subprocess.PIPE,
                                 text=True, shell=True).stdout
-        job_ids = job_id_list(stdout, single)
-
-        # Contiously check for job completion on ALL running array jobs
-        is_done = False
-        count = 0
-        bad_states = ["TIMEOUT", "FAILED", "NODE_FAIL", "OUT_OF_MEMORY",
-                      "CANCELLED"]
-        while not is_done:
-            # Wait a bit to avoid rapidly querying sacct
-            time.sleep(5)
-            is_done, states = job_array_status(job_ids)
-            # EXIT CONDITION: if any of the jobs provide job failure codes
-            if not is_done:
-                for i, state in enumerate(states):
-                    # Sometimes states can be something like 'CANCELLED+', so
-                    # we can't do exact string matching, check partial matches
-                    if any([check in state for check in bad_states]):
-                        print(msg.cli((f"Stopping workflow for {state} job. "
-                                       f"Please check log file for details."),
-                                      items=[f"TASK:    {classname}.{method}",
-                                             f"TASK ID: {job_ids[i]}",
-                                             f"LOG:     logs/{job_ids[i]}",
-                                             f"SBATCH:  {run_call}"],
-                                      header="slurm run error", border="="))
-                        sys.exit(-1)    
-            # WAIT CONDITION: if sacct is not working, we'll get stuck in a loop
-            if "UNDEFINED" in states:
-                count += 1
-                # Every 10 counts, warn the user this is unexpected behavior
-                if not count % 10:
-                    job_id = job_ids[states.index("UNDEFINED")]
-                    self.logger.warning(f"SLURM command 'sacct {job_id}' has "
-                                        f"returned unexpected response {count} "
-                                        f"times. This job may have failed "
-                                        f"unexpectedly. Consider checking "
-                                        f"manually")
+        job_id = parse_job_id(stdout)
 
-        self.logger.info(f"Task {classname}.{method} finished successfully")
+        return {f"{job_id}_{index}": index for index in indices}
+
+    def _scale_time(self, run_call, scale):
+        """
+        Scales the '--time' limit of a run call, which must be given in
+        minutes
+
+        :type run_call: str
+        :param run_call: sbatch command line call
+        :type scale: float
+        :param scale: factor to scale the time limit by
+        :rtype: str
+        :return: run call with the scaled time limit
+        """
+        for part in run_call.split(" "):
+            if part.startswith("--time="):
+                try:
+                    tasktime = float(part.split("=")[1]) * scale
+                    run_call = set_sbatch_args(run_call,
+                                               time=math.ceil(tasktime))
+                except ValueError:
+                    self.logger.warning(f"cannot scale time limit '{part}', "
+                                        f"must be in minutes")
+        return run_call
 
     def taskid(self):
         """
@@ -260,15 +437,74 @@ def job_id_list(stdout, single):
     else:
         ntask = PAR.NTASK
 
+    job_id = parse_job_id(stdout)
+    return [f"{job_id}_{i}" for i in range(ntask)]
+
+
+def parse_job_id(stdout):
+    """
+    Parses the job id from sbatch standard output, e.g.,
+    'Submitted batch job 441636' or
+    'Submitted batch job 441636 on cluster Maui'
+
+    :type stdout: str
+    :param stdout: the text response from running 'sbatch' on SLURM
+    :rtype: int
+    :return: job id of the submitted job
+    """
     # Splitting e.g.,: 'Submitted batch job 441636\n'
     for part in stdout.strip().split():
         try:
             # The int will keep throwing ValueError until we find the num
-            job_id = int(part)
-            break
+            return int(part)
         except ValueError:
             continue
-    return [f"{job_id}_{i}" for i in range(ntask)]
+
+
+def set_sbatch_args(run_call, **kwargs):
+    """
+    Replaces the values of '--key=value' sbatch arguments in a run call, or
+    adds them directly after 'sbatch' if they are not present. Underscores in
+    keys are converted to dashes, e.g., ntasks_per_node -> --ntasks-per-node
+
+    :type run_call: str
+    :param run_call: sbatch command line call
+    :rtype: str
+    :return: run call with the given sbatch arguments set
+    """
+    parts = run_call.split(" ")
+    for key, val in kwargs.items():
+        arg = f"--{key.replace('_', '-')}"
+        for i, part in enumerate(parts):
+            if "=" in part and part.split("=")[0] == arg:
+                parts[i] = f"{arg}={val}"
+                break
+        else:
+            parts.insert(1, f"{arg}={val}")
+
+    return " ".join(parts)
+
+
+def append_environs(run_call, environs):
+    """
+    Appends environment variables to the '--environment' argument of the
+    run script, which is expected at the end of the run call. Deals with the
+    case where PAR.ENVIRONS is an empty string
+
+    :type run_call: str
+    :param run_call: sbatch command line call
+    :type environs: str
+    :param environs: variables formatted as VAR1=var1,VAR2=var2...
+    :rtype: str
+    :return: run call with appended environment variables
+    """
+    run_call = run_call.rstrip()
+    if not run_call.endswith("--environment"):
+        environs = f",{environs}"  # appending to the list of vars
+    else:
+        environs = f" {environs}"
+
+    return run_call + environs
 
 
 def job_array_status(job_ids):
@@ -283,27 +519,38 @@ def job_array_status(job_ids):
     :rtype states: list
     :return states: list of states returned from sacct
     """
-    states = []
-    for job_id in job_ids:
-        state = check_job_state(job_id)
-        states.append(state.upper())
+    job_states = query_job_states(job_ids)
+    states = [job_states.get(job_id, "UNDEFINED").upper()
+              for job_id in job_ids]
 
     # All array jobs must be completed to return is_done == True
-    is_done = all([state.upper() == "COMPLETED" for state in states])
+    is_done = all([state == "COMPLETED" for state in states])
 
     return is_done, states
 
 
 def check_job_state(job_id):
     """
-    Queries completion status of a single job by running:
-        $ sacct -nL -o jobid,state -j {job_id}
+    Queries completion status of a single job
+
+    :type job: str
+    :param job: job id to query
+    :rtype: str
+    :return: job state, or 'UNDEFINED' if sacct does not know the job
+    """
+    return query_job_states([job_id]).get(job_id, "UNDEFINED")
+
+
+def query_job_states(job_ids):
+    """
+    Queries completion status of all given jobs with a single call:
+        $ sacct -nLXP -o jobid,state -j {job_id}[,{job_id}...]
 
         # Example outputs from this sacct command
-        # JOB_ID    STATUS
-        441630_0  PENDING  # array job will have the array number
-        441630    COMPLETED  # if --array=0-0, jobs will not have suffix
-        441628.batch    COMPLETED  # we don't want to check these
+        # JOB_ID|STATUS
+        441630_0|PENDING  # array job will have the array number
+        441630_[2-4%2]|PENDING  # pending array tasks may be grouped
+        441630|COMPLETED  # if --array=0-0, jobs will not have suffix
 
     Available job states: https://slurm.schedmd.com/sacct.html
 
@@ -311,30 +558,70 @@ def check_job_state(job_id):
         -L flag in sacct queries all available clusters, not just the
         cluster that ran the `sacct` call
         -X supress the .batch and .extern jobname
-
-    :type job: str
-    :param job: job id to query
+        -P returns parsable, '|' delimited output so long job ids are not
+        truncated
+
+    :type job_ids: list of str
+    :param job_ids: job ids to query, array jobs sharing the same parent job
+        id are queried together
+    :rtype: dict
+    :return: {job_id: state} for all jobs returned by sacct
     """
-    cmd = f"sacct -nLX -o jobid,state -j {job_id}"
+    parents = []
+    for job_id in job_ids:
+        parent = job_id.split("_")[0]
+        if parent not in parents:
+            parents.append(parent)
+
+    cmd = f"sacct -nLXP -o jobid,state -j {','.join(parents)}"
     stdout = subprocess.run(cmd, stdout=subprocess.PIPE,
                             text=True, shell=True).stdout
 
-    # Undefined status will be retured if we cannot match the job id with
-    # the sacct output
-    # TODO should undefined state throw an error?
-    state = "UNDEFINED"
-    lines = stdout.strip().split("\n")
-    for line in lines:
-        # expecting e.g., 441628  COMPLETED
-        try:
-            job_id_check, state = line.split()
-        # str.split() will throw ValueError on non-matching strings
-        except ValueError:
-            continue
-        # Use in to allow for array jobs to match job ids
-        if job_id in job_id_check:
-            break
+    states = parse_sacct(stdout)
 
-    return state
+    # Single jobs submitted with --array=0-0 may be returned without a suffix
+    for job_id in job_ids:
+        parent = job_id.split("_")[0]
+        if job_id not in states and parent in states:
+            states[job_id] = states[parent]
 
+    return states
 
+
+def parse_sacct(stdout):
+    """
+    Parses the parsable (-P) output of 'sacct -o jobid,state' into individual
+    job states, expanding grouped array tasks, e.g., '441630_[2-4%2]'
+
+    :type stdout: str
+    :param stdout: standard output of the sacct call
+    :rtype: dict
+    :return: {job_id: state}
+    """
+    states = {}
+    for line in stdout.strip().split("\n"):
+        # expecting e.g., 441628_0|COMPLETED or 441628_1|CANCELLED by 1234
+        try:
+            job_id, state = line.strip().split("|")[:2]
+        # Skip any non-matching strings
+        except ValueError:
+            continue
+        if not state.strip():
+            continue
+        state = state.split()[0].upper()
+
+        if "[" in job_id:
+            parent, tasks = job_id.split("_[")
+            # Strip off the concurrent task throttle, e.g., '%2'
+            tasks = tasks.rstrip("]").split("%")[0]
+            for task in tasks.split(","):
+                if "-" in task:
+                    first, last = task.split("-")
+                    for i in range(int(first), int(last) + 1):
+                        states[f"{parent}_{i}"] = state
+                else:
+                    states[f"{parent}_{task}"] = state
+        else:
+            states[job_id] = state
+
+    return states
@@ -7,7 +7,7 @@ import os
 import sys
 import logging
 
-from seisflows3.tools import unix, msg
+from seisflows3.tools import unix, msg, profiler
 from seisflows3.config import custom_import, SeisFlowsPathsParameters
 
 PAR = sys.modules["seisflows_parameters"]
@@ -60,7 +60,8 @@ class Workstation(custom_import("system", "base")):
         workflow.checkpoint()
         workflow.main()
 
-    def run(self, classname, method, single=False, **kwargs):
+    def run(self, classname, method, single=False, tasktime_scale=1.,
+            **kwargs):
         """
         Executes task multiple times in serial.
 
@@ -77,6 +78,9 @@ class Workstation(custom_import("system", "base")):
             This will change how the job array and the number of tasks is
             defined, such that the job is submitted as a single-core job to
             the system.
+        :type tasktime_scale: float
+        :param tasktime_scale: tasks are not time limited, only used to
+            record runtimes per unit of work in the runtime history
         """
         self.checkpoint(PATH.OUTPUT, classname, method, kwargs)
 
@@ -90,14 +94,18 @@ class Workstation(custom_import("system", "base")):
         else:
             ntasks = PAR.NTASK
 
-        for taskid in range(ntasks):
-            # os environment variables can only be strings, these need to be
-            # converted back to integers by system.taskid()
-            os.environ["SEISFLOWS_TASKID"] = str(taskid)
-            if taskid == 0:
-                self.logger.info(f"running task {classname}_{method} "
-                                 f"{PAR.NTASK} times")
-            function(**kwargs)
+        try:
+            for taskid in range(ntasks):
+                # os environment variables can only be strings, these need to
+                # be converted back to integers by system.taskid()
+                os.environ["SEISFLOWS_TASKID"] = str(taskid)
+                if taskid == 0:
+                    self.logger.info(f"running task {classname}_{method} "
+                                     f"{PAR.NTASK} times")
+                profiler.run(function, kwargs, classname, method, taskid,
+                             path=self.profile_path(classname, method))
+        finally:
+            self.summarize_profiles(classname, method, tasktime_scale)
 
     def taskid(self):
         """
@@ -98,6 +98,43 @@ def test_save_and_load(sfinit):
         assert(f"seisflows_{name}" in sys.modules)
 
 
+def test_save_incremental(tmpdir, monkeypatch):
+    """
+    Test that saving only rewrites the files of modules whose state changed
+    """
+    monkeypatch.setitem(sys.modules, config.PAR, config.Dict({"A": 1}))
+    monkeypatch.setitem(sys.modules, config.PATH,
+                        config.Dict({"OUTPUT": str(tmpdir)}))
+    for name in config.NAMES:
+        monkeypatch.setitem(sys.modules, f"seisflows_{name}", {"name": name})
+
+    config.save()
+    stats = {fid: os.stat(os.path.join(tmpdir, fid)).st_mtime_ns
+             for fid in os.listdir(tmpdir)}
+    assert(len(stats) == len(config.NAMES) + 2)
+
+    # Push back modification times so that rewritten files can be detected
+    for fid in stats:
+        os.utime(os.path.join(tmpdir, fid), ns=(0, 0))
+
+    sys.modules["seisflows_optimize"]["name"] = "changed"
+    config.save()
+
+    rewritten = [fid for fid in os.listdir(tmpdir)
+                 if os.stat(os.path.join(tmpdir, fid)).st_mtime_ns != 0]
+    assert(rewritten == ["seisflows_optimize.p"])
+    assert(not any(fid.endswith(".tmp") for fid in os.listdir(tmpdir)))
+
+    # Digests are kept by absolute path, relative paths share them
+    os.chdir(tmpdir)
+    fid = "seisflows_optimize.p"
+    assert(os.path.join(tmpdir, fid) in config._WRITTEN)
+    with open(fid, "rb") as f:
+        assert(not config._write_if_changed(fid, f.read()))
+    config.clear_written()
+    assert(not config._WRITTEN)
+
+
 def test_seisflows_paths_parameters(sfinit):
     """
     Test the class that makes inputting and checking paths and parameters easier
@@ -143,3 +180,26 @@ def test_custom_import(sfinit):
     assert(module.__module__ == "seisflows3.optimize.base")
 
 
+def test_return_modules_cache(tmpdir, monkeypatch):
+    """
+    Test that the module registry is only rebuilt when a module directory
+    changes
+    """
+    mod_dir = os.path.join(tmpdir, "seisflows3", "workflow")
+    os.makedirs(mod_dir)
+    for fid in ["__init__.py", "inversion.py"]:
+        open(os.path.join(mod_dir, fid), "w").close()
+    monkeypatch.setattr(config, "ROOT_DIR", os.path.join(tmpdir, "seisflows3"))
+
+    modules = config.return_modules()
+    assert(modules["workflow"]["seisflows3"] == ["inversion"])
+    assert(modules["solver"]["seisflows3"] == [])
+
+    # Returned registry is a copy and can be modified by the caller
+    modules["workflow"]["seisflows3"].append("dummy")
+    assert(config.return_modules()["workflow"]["seisflows3"] == ["inversion"])
+
+    open(os.path.join(mod_dir, "migration.py"), "w").close()
+    os.utime(mod_dir, ns=(0, 0))
+    assert(config.return_modules()["workflow"]["seisflows3"] ==
+           ["inversion", "migration"])
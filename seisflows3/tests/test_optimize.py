@@ -0,0 +1,326 @@
+"""
+Test the optimization module and its line search plugins
+"""
+import os
+import sys
+import shutil
+import pytest
+import numpy as np
+from types import SimpleNamespace
+from unittest.mock import patch
+from seisflows3 import config
+from seisflows3.seisflows import SeisFlows
+from seisflows3.plugins import line_search
+
+
+TEST_DIR = os.path.join(config.ROOT_DIR, "tests")
+
+
+@pytest.fixture
+def sfregister(tmpdir, monkeypatch):
+    """
+    Register parameters and paths only, allowing the optimize module to be
+    imported without initiating the entire SeisFlows3 working environment
+    """
+    src = os.path.join(TEST_DIR, "test_data", "test_filled_parameters.yaml")
+    shutil.copy(src, os.path.join(tmpdir, "parameters.yaml"))
+    os.chdir(tmpdir)
+    with patch.object(sys, "argv", ["seisflows"]):
+        sf = SeisFlows()
+        sf._register(force=True)
+    monkeypatch.setitem(sys.modules, "seisflows_solver",
+                        SimpleNamespace(parameters=["vp", "vs"]))
+
+    return sf
+
+
+def test_line_search_trials(tmpdir):
+    """
+    Test that concurrently evaluated trial steps are spread around the
+    calculated step length and that the best of them is accepted
+    """
+    bracket = line_search.Bracket(step_count_max=10, step_len_max=10.,
+                                  log_file=os.path.join(tmpdir, "ls.txt"))
+    alpha, status = bracket.initialize(iter=1, step_len=0., func_val=1.,
+                                       gtg=1., gtp=-1.)
+    assert(status == 0)
+
+    steps = bracket.trial_steps(alpha, 4)
+    assert(len(steps) == 4)
+    assert(np.allclose(steps / alpha, [0.618034, 1., 1.618034, 2.618034]))
+
+    # Step length safeguard caps trial steps, which removes duplicates
+    assert(np.allclose(bracket.trial_steps(8., 3), [4.944272, 8., 10.]))
+    assert(np.allclose(bracket.trial_steps(20., 2), [10.]))
+
+    # Misfit parabola with its minimum at x=1.2, which is bracketed by the
+    # trial steps and close enough to one of them to be accepted
+    misfit = lambda x: 1. - 2. * x + x ** 2 / 1.2
+    bracket.step_count += len(steps)
+    alpha, status = bracket.update_trials(iter=1, step_lens=steps,
+                                          func_vals=misfit(steps))
+    assert(status == 1)
+    assert(alpha == steps[1])
+
+    x, f = bracket.search_history()[:2]
+    assert(len(x) == 5)
+    assert(f.min() == misfit(steps[1]))
+
+
+def test_backtrack_trials(tmpdir):
+    """
+    Test that backtracking trial steps only ever reduce the step length once
+    the line search has left the initial bracketing phase
+    """
+    backtrack = line_search.Backtrack(step_count_max=10, step_len_max=10.,
+                                      log_file=os.path.join(tmpdir, "ls.txt"))
+    backtrack.initialize(iter=1, step_len=0., func_val=1., gtg=1., gtp=-1.)
+    assert(len(backtrack.trial_steps(1., 3)) == 3)
+    assert(backtrack.trial_steps(1., 3).max() > 1.)
+
+    # Second line search, past the first model update
+    backtrack.step_count = 1
+    backtrack.update_trials(iter=1, step_lens=[1.], func_vals=[0.5])
+    backtrack.step_count = 0
+    alpha, status = backtrack.initialize(iter=2, step_len=0., func_val=0.5,
+                                         gtg=1., gtp=-1.)
+    assert(alpha == 1.)
+    assert(np.allclose(backtrack.trial_steps(alpha, 3),
+                       [0.381966, 0.618034, 1.]))
+
+
+def test_resume_search(sfregister, tmpdir):
+    """
+    Test that an interrupted line search is resumed from its state record,
+    rebuilding the line search history and the pending trial step on disk
+    """
+    from seisflows3.optimize import base
+
+    base.PATH.force_set("OPTIMIZE", str(tmpdir))
+    base.PAR.force_set("LINESEARCH_NTRIAL", 1)
+
+    def new_optimize():
+        optimize = base.Base()
+        optimize.line_search = line_search.Bracket(
+            step_count_max=10, step_len_max=10.,
+            log_file=os.path.join(tmpdir, "ls.txt"))
+        return optimize
+
+    # No record, a new line search is initialized
+    optimize = new_optimize()
+    assert(optimize.resume_search() == "initialize")
+
+    alpha, _ = optimize.line_search.initialize(iter=1, step_len=0.,
+                                               func_val=1., gtg=1., gtp=-1.)
+    optimize.savetxt(optimize.alpha, alpha)
+    optimize.write_search_state("evaluate")
+
+    # Interrupted before the trial step was evaluated
+    resumed = new_optimize()
+    assert(resumed.resume_search() == "evaluate")
+    assert(resumed.line_search.state == optimize.line_search.state)
+
+    optimize.line_search.step_count += 1
+    optimize.savetxt(optimize.f_try, 0.5)
+    optimize.write_search_state("update")
+
+    # Interrupted after the trial step was evaluated, which is not re-run
+    os.remove(os.path.join(tmpdir, optimize.f_try))
+    resumed = new_optimize()
+    assert(resumed.resume_search() == "update")
+    assert(resumed.line_search.step_count == 1)
+    assert(resumed.loadtxt(resumed.f_try) == 0.5)
+    assert(resumed.loadtxt(resumed.alpha) == alpha)
+
+    # Records of other iterations or finished line searches are not resumed
+    other = new_optimize()
+    other.iter = 2
+    assert(other.resume_search() == "initialize")
+
+    optimize.write_search_state("done")
+    assert(new_optimize().resume_search() == "initialize")
+
+
+def test_vector_store(tmpdir):
+    """
+    Test that the vector store serves repeated reads from memory, writes
+    through to disk and notices files that were changed behind its back
+    """
+    from seisflows3.tools.vectors import VectorStore
+
+    store = VectorStore(path=str(tmpdir), maxsize=2)
+    m = np.arange(10.)
+    store.save("m_new.npy", m)
+    assert(np.array_equal(np.load(os.path.join(tmpdir, "m_new.npy")), m))
+
+    # Cached vectors are shared read-only views, the saved array is not frozen
+    assert(np.shares_memory(store.load("m_new.npy"), m))
+    assert(store.load("m_new") is store.load("m_new.npy"))
+    assert(store.hits == 3 and store.misses == 0)
+    with pytest.raises(ValueError):
+        store.load("m_new")[0] = 1.
+    assert(m.flags.writeable)
+
+    # Files replaced on disk are read again
+    np.save(os.path.join(tmpdir, "m_new.npy"), 2 * m)
+    assert(np.array_equal(store.load("m_new.npy"), 2 * m))
+    assert(store.misses == 1)
+
+    # Moved vectors stay cached, least recently used vectors are evicted
+    store.move("m_new.npy", "m_old.npy")
+    assert(not os.path.exists(os.path.join(tmpdir, "m_new.npy")))
+    store.load("m_old.npy")
+    assert(store.misses == 1)
+    store.save("g_new.npy", m)
+    store.save("p_new.npy", m)
+    store.load("m_old.npy")
+    assert(store.misses == 2)
+
+    store.remove("m_old.npy")
+    assert(not os.path.exists(os.path.join(tmpdir, "m_old.npy")))
+
+    # Memory mapped and uncached stores always read from disk
+    mmap = VectorStore(path=str(tmpdir), maxsize=0, mmap=True)
+    assert(isinstance(mmap.load("p_new.npy"), np.memmap))
+    mmap.load("p_new.npy")
+    assert(mmap.misses == 2)
+
+
+def test_vector_stats():
+    """
+    Test that chunked, single-pass vector statistics match their direct
+    Numpy counterparts
+    """
+    from seisflows3.tools.math import angle, poissons_ratio
+    from seisflows3.tools.vectors import vector_stats
+
+    rng = np.random.default_rng(0)
+    vp, vs = rng.uniform(5., 6., 25), rng.uniform(2., 3., 25)
+    m = np.concatenate([vp, vs]).astype("float32")
+    g = rng.normal(size=50).astype("float32")
+    p = -g + rng.normal(scale=0.1, size=50).astype("float32")
+
+    stats = vector_stats(m=m, g=g, p=p, parameters=["vp", "vs"],
+                         chunk_size=7)
+    assert(np.isclose(stats["m_max"], np.abs(m).max()))
+    assert(np.allclose(stats["bounds"]["vs"], (m[25:].min(), m[25:].max())))
+    pr = poissons_ratio(vp=m[:25].astype("float64"), vs=m[25:])
+    assert(np.allclose(stats["pr"], (pr.min(), pr.max())))
+    assert(np.isclose(stats["gtg"], np.dot(g, g)))
+    assert(np.isclose(stats["gtp"], np.dot(g, p)))
+    assert(np.isclose(stats["g_norm1"], np.linalg.norm(g, 1)))
+    assert(np.isclose(stats["g_norm2"], np.linalg.norm(g, 2)))
+    assert(np.isclose(stats["p_max"], np.abs(p).max()))
+    assert(np.isclose(stats["theta"], angle(p, -g), atol=1E-6))
+
+    # Statistics are only given for the vectors that were passed in
+    assert(set(vector_stats(g=g)) == {"gtg", "g_norm1", "g_norm2"})
+    assert(vector_stats(g=g, p=-g)["theta"] == 0.)
+    with pytest.raises(ValueError):
+        vector_stats(m=m[:-1], parameters=["vp", "vs"])
+
+
+def test_vector_axpy(tmpdir):
+    """
+    Test that trial models are computed in chunks, and streamed to disk by
+    memory mapped vector stores
+    """
+    from seisflows3.tools.vectors import VectorStore, axpy
+
+    m = np.linspace(1., 2., 11, dtype="float32")
+    p = np.linspace(-1., 1., 11, dtype="float32")
+    assert(np.array_equal(axpy(0.5, p, m, chunk_size=3), m + 0.5 * p))
+    assert(np.array_equal(axpy(-1., p, chunk_size=4), -p))
+
+    for mmap in [False, True]:
+        store = VectorStore(path=str(tmpdir), mmap=mmap)
+        store.save("m_new.npy", m.copy())
+        store.save("p_new.npy", p.copy())
+        m_try = store.axpy("m_try.npy", 0.5, "p_new.npy", "m_new.npy")
+        assert(isinstance(m_try, np.memmap) == mmap)
+        assert(m_try.dtype == m.dtype)
+        assert(np.array_equal(m_try, m + 0.5 * p))
+        assert(np.array_equal(np.load(os.path.join(tmpdir, "m_try.npy")),
+                              m + 0.5 * p))
+        assert(not os.path.exists(os.path.join(tmpdir, "m_try.npy.tmp")))
+
+
+def _two_loop(q, s, y):
+    """
+    Dense L-BFGS two-loop recursion with scaling M3 of Liu and Nocedal 1989,
+    memory `s` and `y` ordered from newest to oldest
+    """
+    q = np.array(q, dtype="float64")
+    s = [np.array(_, dtype="float64") for _ in s]
+    y = [np.array(_, dtype="float64") for _ in y]
+    al = []
+    for s_, y_ in zip(s, y):
+        al.append(np.dot(s_, q) / np.dot(y_, s_))
+        q -= al[-1] * y_
+    r = q * np.dot(y[0], s[0]) / np.dot(y[0], y[0])
+    for s_, y_, al_ in reversed(list(zip(s, y, al))):
+        r += s_ * (al_ - np.dot(y_, r) / np.dot(y_, s_))
+    return r
+
+
+def test_lbfgs_apply(sfregister, tmpdir):
+    """
+    Test that the chunked L-BFGS ring buffer matches a dense two-loop
+    recursion, including once the memory wraps around, and that memory
+    written in the column layout of older versions is converted
+    """
+    from seisflows3.optimize import base, LBFGS
+
+    # Modules imported by earlier tests may hold other parameter objects
+    for module in [base, LBFGS]:
+        module.PATH.force_set("OPTIMIZE", str(tmpdir))
+        module.PAR.force_set("LBFGSMEM", 3)
+        module.PAR.force_set("OPTIMIZE_CACHE", 0)
+        module.PAR.force_set("OPTIMIZE_MMAP", False)
+    os.mkdir(os.path.join(tmpdir, "LBFGS"))
+
+    rng = np.random.default_rng(0)
+    nvec = 50
+
+    def step(optimize):
+        """Store a new model and gradient difference, returns (s, y)"""
+        s = rng.normal(size=nvec).astype("float32")
+        y = (s + rng.normal(scale=0.5, size=nvec)).astype("float32")
+        optimize.save(optimize.m_old, np.zeros(nvec, dtype="float32"))
+        optimize.save(optimize.m_new, s)
+        optimize.save(optimize.g_old, np.zeros(nvec, dtype="float32"))
+        optimize.save(optimize.g_new, y)
+        optimize.update()
+        return s, y
+
+    optimize = LBFGS.LBFGS()
+    optimize.chunk_size = 7
+    memory = []
+    q = rng.normal(size=nvec)
+    for i in range(5):
+        memory.insert(0, step(optimize))
+        memory = memory[:3]
+        assert(optimize.memory_used == min(i + 1, 3))
+        assert(optimize.memory_head == i % 3)
+        s, y = zip(*memory)
+        assert(np.allclose(optimize.apply(q), _two_loop(q, s, y)))
+
+    # Older versions stored memory as columns, newest first
+    s_old = rng.normal(size=(nvec, 3)).astype("float32")
+    y_old = (s_old + rng.normal(scale=0.5, size=(nvec, 3))).astype("float32")
+    s_old[:, 2] = y_old[:, 2] = 0
+    for fid, arr in [(optimize.s_file, s_old), (optimize.y_file, y_old)]:
+        arr.tofile(os.path.join(tmpdir, fid))
+
+    state = {key: val for key, val in optimize.__dict__.items()
+             if key not in ["memory_head", "rh", "yty", "chunk_size"]}
+    state["memory_used"] = 2
+    old = LBFGS.LBFGS.__new__(LBFGS.LBFGS)
+    old.__setstate__(state)
+    assert(old.rh is None and old.chunk_size == 2 ** 20)
+
+    old.chunk_size = 7
+    s, y = step(old)
+    assert(old.memory_used == 3)
+    assert(np.allclose(old.apply(q), _two_loop(q, [s, s_old[:, 0], s_old[:, 1]],
+                                               [y, y_old[:, 0], y_old[:, 1]])))
@@ -6,9 +6,11 @@ import os
 import sys
 import shutil
 import pytest
+import numpy as np
 from unittest.mock import patch
 from seisflows3 import config
 from seisflows3.seisflows import SeisFlows, return_modules
+from seisflows3.plugins.preprocess import adjoint, batched, misfit
 
 
 # The module that we're testing, allows for copy-pasting these test suites
@@ -64,6 +66,21 @@ def sfinit(tmpdir, copy_par_file):
     return sf
 
 
+@pytest.fixture
+def sfregister(tmpdir, copy_par_file):
+    """
+    Register parameters and paths only, allowing preprocess modules to be
+    imported without initiating the entire SeisFlows3 working environment
+    """
+    copy_par_file
+    os.chdir(tmpdir)
+    with patch.object(sys, "argv", ["seisflows"]):
+        sf = SeisFlows()
+        sf._register(force=True)
+
+    return sf
+
+
 def test_default_check(sfinit):
     """
     Test seisflows3.preprocess.default.check()
@@ -151,3 +168,136 @@ def test_default_setup(sfinit):
 #     filenames = []
 #     preprocess.prepare_eval_grad(cwd=cwd, taskid=taskid, filenames=filenames)
 #     pytest.set_trace()
+
+
+def test_batched_misfit_matches_per_trace():
+    """
+    Ensure that the batched misfit and adjoint source functions match the
+    per-trace functions for every trace in a stream
+    """
+    nt, dt = 500, 0.01
+    t = np.arange(nt) * dt
+    syn = np.array([np.sin(2 * np.pi * f * t) * np.exp(-(t - 2.) ** 2)
+                    for f in [1., 1.5, 2.]])
+    obs = np.array([np.sin(2 * np.pi * f * (t - .1)) * np.exp(-(t - 2.1) ** 2)
+                    for f in [1., 1.5, 2.]])
+
+    for name in ["waveform", "envelope", "instantaneous_phase", "traveltime",
+                 "traveltime_inexact"]:
+        residuals, adjoints = getattr(batched, name)(syn, obs, nt, dt)
+        for i in range(len(syn)):
+            assert(np.isclose(residuals[i],
+                              getattr(misfit, name)(syn[i], obs[i], nt, dt)))
+            assert(np.allclose(adjoints[i],
+                               getattr(adjoint, name)(syn[i], obs[i], nt, dt)))
+
+
+def test_analytic_signal_cache():
+    """
+    Ensure that the analytic signal cache reuses transforms within a session
+    and gives identical results to the uncached per-trace functions
+    """
+    from seisflows3.tools.math import analytic_signal
+
+    nt, dt = 200, 0.01
+    t = np.arange(nt) * dt
+    syn = np.sin(2 * np.pi * t) * np.exp(-(t - 1.) ** 2)
+    obs = np.sin(2 * np.pi * (t - .1)) * np.exp(-(t - 1.1) ** 2)
+
+    uncached = adjoint.envelope(syn, obs, nt, dt)
+    assert(analytic_signal.computed == 0)
+    with analytic_signal:
+        misfit.envelope(syn, obs, nt, dt)
+        cached = adjoint.envelope(syn, obs, nt, dt)
+
+    assert(np.allclose(uncached, cached))
+    # syn and obs transformed once by the misfit, then reused by the adjoint
+    # which also needs the transform of syn twice
+    assert(analytic_signal.computed == 3)
+    assert(analytic_signal.avoided == 3)
+
+
+def test_residuals_binary_and_text(tmpdir, sfregister):
+    """
+    Ensure that binary residual files are summed correctly, and that text
+    residual files written by older versions can still be read
+    """
+    preprocess = config.custom_import("preprocess", "base")()
+
+    preprocess._write_residuals(path=tmpdir, residuals=[1., 2.])
+    legacy = os.path.join(tmpdir, "legacy")
+    np.savetxt(legacy, [3.])
+
+    files = [os.path.join(tmpdir, "residuals"), legacy]
+    assert(np.allclose(preprocess.read_residuals(files[0]), [1., 2.]))
+    assert(preprocess.sum_residuals(files) == 14.)
+
+
+def test_cached_obs(tmpdir, sfregister):
+    """
+    Ensure that processed observations are served from the cache only when
+    the observed data and the order and length of the traces are unchanged
+    """
+    from obspy import Stream, Trace
+
+    from seisflows3.preprocess import base
+
+    PAR = base.PAR
+    PAR.force_set("CACHE_OBS", True)
+    preprocess = base.Base()
+
+    cwd = str(tmpdir)
+    os.makedirs(os.path.join(cwd, "traces", "obs"))
+    os.makedirs(os.path.join(cwd, "traces", "obs_cache"))
+    fid = os.path.join(cwd, "traces", "obs", "AA.S01.BXZ.semd")
+    with open(fid, "w") as f:
+        f.write("data")
+
+    def stream(stations, npts=10):
+        return Stream([Trace(data=np.arange(npts, dtype="float32") + i,
+                             header={"network": "AA", "station": sta,
+                                     "channel": "BXZ"})
+                       for i, sta in enumerate(stations)])
+
+    obs = stream(["S01", "S02"])
+    kwargs = {"source_name": "001"}
+
+    # Miss: nothing has been cached yet
+    assert(preprocess._read_cached_obs(cwd, "AA.S01.BXZ.semd",
+                                       template=stream(["S01", "S02"]),
+                                       **kwargs) is None)
+
+    # Hit: headers are taken from the template, data from the cache
+    preprocess._write_cached_obs(cwd, "AA.S01.BXZ.semd", obs, **kwargs)
+    cached = preprocess._read_cached_obs(cwd, "AA.S01.BXZ.semd",
+                                         template=stream(["S01", "S02"]),
+                                         **kwargs)
+    assert(cached is not None)
+    for tr, tr_obs in zip(cached, obs):
+        assert(tr.id == tr_obs.id)
+        assert(np.array_equal(tr.data, tr_obs.data))
+
+    # Template with different trace order or number of samples
+    for template in [stream(["S02", "S01"]), stream(["S01", "S02"], npts=11),
+                     stream(["S01"])]:
+        assert(preprocess._read_cached_obs(cwd, "AA.S01.BXZ.semd",
+                                           template=template,
+                                           **kwargs) is None)
+
+    # Invalidation: replaced data and other processing parameters
+    with open(fid, "w") as f:
+        f.write("new data")
+    assert(preprocess._read_cached_obs(cwd, "AA.S01.BXZ.semd",
+                                       template=stream(["S01", "S02"]),
+                                       **kwargs) is None)
+    preprocess._write_cached_obs(cwd, "AA.S01.BXZ.semd", obs, **kwargs)
+    PAR.force_set("MAX_FREQ", -1.)
+    assert(preprocess._read_cached_obs(cwd, "AA.S01.BXZ.semd",
+                                       template=stream(["S01", "S02"]),
+                                       **kwargs) is None)
+
+    # Disabled cache is never read
+    PAR.force_set("CACHE_OBS", False)
+    assert(preprocess._read_cached_obs(cwd, "AA.S01.BXZ.semd",
+                                       template=stream(["S01", "S02"]),
+                                       **kwargs) is None)
@@ -91,6 +91,20 @@ def test_call_seisflows(tmpdir, par_file_dict, copy_par_file):
             assert(stdout.strip() == f"{name.upper()}: {check_val}")
 
 
+def test_lazy_imports():
+    """
+    Importing the command line tool should not load heavy dependencies,
+    which are imported only by the code paths that need them
+    """
+    heavy = ["scipy", "obspy", "matplotlib", "IPython"]
+    loaded = subprocess.run(
+        [sys.executable, "-c",
+         "import sys; import seisflows3.seisflows; "
+         f"print(' '.join(m for m in {heavy} if m in sys.modules))"],
+        capture_output=True, text=True, check=True).stdout.split()
+    assert(loaded == [])
+
+
 def test_edited_parameter_file_name(tmpdir, par_file_dict, filled_par_file):
     """
     Similar test as call_seisflows but just make sure that arbitrary naming
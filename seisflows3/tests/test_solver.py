@@ -6,9 +6,15 @@ import os
 import sys
 import shutil
 import pytest
+import numpy as np
+from types import SimpleNamespace
 from unittest.mock import patch
 from seisflows3 import config
 from seisflows3.seisflows import SeisFlows, return_modules
+from seisflows3.tools import unix, transfer
+from seisflows3.tools.wrappers import Struct
+from seisflows3.tools.specfem import ParFile, getpar, setpar
+from seisflows3.plugins.solver_io import fortran_binary
 
 
 # The module that we're testing, allows for copy-pasting these test suites
@@ -61,6 +67,34 @@ def sfinit(tmpdir, copy_par_file):
     return sf
 
 
+@pytest.fixture
+def solver(tmpdir, copy_par_file, monkeypatch):
+    """
+    A solver Base instance with a small mesh of three processor slices, which
+    only registers parameters and paths rather than the entire SeisFlows3
+    working environment
+    """
+    copy_par_file
+    os.chdir(tmpdir)
+    with patch.object(sys, "argv", ["seisflows"]):
+        sf = SeisFlows()
+        sf._register(force=True)
+    for name in ["system", "preprocess"]:
+        monkeypatch.setitem(sys.modules, f"seisflows_{name}",
+                            SimpleNamespace())
+
+    from seisflows3.solver import base
+    base.PAR.force_set("SOLVERIO", "fortran_binary")
+    base.PAR.force_set("SOLVERIO_MMAP", False)
+    base.PAR.force_set("SOLVERIO_WORKERS", 1)
+
+    solver = base.Base()
+    solver.parameters = ["vp", "vs"]
+    solver._mesh_properties = Struct(nproc=3, ngll=[4, 5, 6])
+
+    return solver
+
+
 def test_import(sfinit, modules):
     """
     Test code by importing all available classes for this module.
@@ -130,3 +164,283 @@ def test_required_functions_exist(sfinit, modules):
 # MODULE AND FUNCTION SPECIFIC TESTS TO FOLLOW
 # ==============================================================================
 
+def test_fortran_binary_mmap(tmpdir):
+    """
+    Ensure that memory mapped reads and in-place writes of Fortran binary
+    slices are interchangeable with the standard read/write functions
+    """
+    data = np.linspace(0., 1., 101)
+    fortran_binary.write_slice(data, path=tmpdir, parameters="vp", iproc=0)
+
+    mapped = fortran_binary.read_slice(path=tmpdir, parameters="vp", iproc=0,
+                                       mmap=True)[0]
+    assert(isinstance(mapped, np.memmap))
+    assert(np.allclose(mapped, data))
+
+    # Overwrite in place and check that the standard reader agrees
+    fortran_binary.write_slice(data * 2, path=tmpdir, parameters="vp",
+                               iproc=0, mmap=True)
+    fortran_binary.write_slice(data, path=tmpdir, parameters="vs",
+                               iproc=0, mmap=True)
+    assert(np.allclose(fortran_binary.read_slice(tmpdir, "vp", 0)[0],
+                       data * 2))
+    assert(np.allclose(fortran_binary.read_slice(tmpdir, "vs", 0)[0], data))
+    assert(os.path.getsize(os.path.join(tmpdir, "proc000000_vs.bin")) ==
+           4 * len(data) + 8)
+
+
+def test_load_mmap(tmpdir, solver):
+    """
+    Ensure that memory mapped model loading returns the same, writeable model
+    as the standard reader, without holding on to the memory maps
+    """
+    from seisflows3.solver import base
+
+    for iproc, ngll in enumerate(solver.mesh_properties.ngll):
+        for i, par in enumerate(solver.parameters):
+            fortran_binary.write_slice(np.arange(ngll) + 10 * iproc + i,
+                                       path=tmpdir, parameters=par,
+                                       iproc=iproc)
+
+    model = solver.load(tmpdir)
+    base.PAR.force_set("SOLVERIO_MMAP", True)
+    mapped = solver.load(tmpdir)
+
+    for par in solver.parameters:
+        for val, mapped_val in zip(model[par], mapped[par]):
+            assert(not isinstance(mapped_val, np.memmap))
+            assert(np.array_equal(val, mapped_val))
+    assert(np.array_equal(solver.merge(model), solver.merge(mapped)))
+
+    mapped["vp"][0][:] = -1.
+    assert(fortran_binary.read_slice(tmpdir, "vp", 0)[0][0] == 0.)
+
+
+def test_merge_split(solver):
+    """
+    Ensure that merging and splitting models are inverse operations, that
+    split slices are views into the vector, and that cached slice offsets
+    follow changes of the parameters and the mesh
+    """
+    m = np.arange(30.)
+    model = solver.split(m)
+    assert(list(model.keys()) == ["vp", "vs"])
+    assert([len(_) for _ in model["vs"]] == [4, 5, 6])
+    assert(np.array_equal(model["vs"][0], m[15:19]))
+    assert(np.array_equal(solver.merge(model), m))
+
+    # Slices share memory with the merged vector
+    model["vp"][1][0] = -1.
+    assert(m[4] == -1.)
+    assert(np.shares_memory(model["vs"][2], m))
+
+    # Merged vectors are new arrays
+    merged = solver.merge(model)
+    merged[0] = -2.
+    assert(m[0] == 0.)
+
+    # Parameter subsets reuse the cached offsets
+    model = solver.split(m[:15], parameters=["vs"])
+    assert(np.array_equal(solver.merge(model, parameters=["vs"]), m[:15]))
+
+    # New mesh properties lead to new offsets
+    solver._mesh_properties = Struct(nproc=2, ngll=[3, 2])
+    model = solver.split(np.arange(10.))
+    assert([len(_) for _ in model["vp"]] == [3, 2])
+    assert(np.array_equal(model["vs"][1], [8., 9.]))
+    assert(np.array_equal(solver.merge(model), np.arange(10.)))
+
+
+def test_map_slices(solver):
+    """
+    Ensure that threaded slice I/O returns results in processor order and
+    propagates exceptions raised in worker threads
+    """
+    import time
+    import threading
+    from seisflows3.solver import base
+
+    base.PAR.force_set("SOLVERIO_WORKERS", 3)
+    solver._mesh_properties = Struct(nproc=6, ngll=[1] * 6)
+
+    threads = set()
+
+    def read(iproc):
+        # Later slices finish first
+        time.sleep(0.01 * (6 - iproc))
+        threads.add(threading.get_ident())
+        return iproc
+
+    assert(solver._map_slices(read) == list(range(6)))
+    assert(len(threads) > 1)
+
+    def fail(iproc):
+        if iproc == 4:
+            raise OSError(f"cannot read slice {iproc}")
+        return iproc
+
+    with pytest.raises(OSError, match="slice 4"):
+        solver._map_slices(fail)
+
+    # A single worker runs in the calling thread
+    base.PAR.force_set("SOLVERIO_WORKERS", 1)
+    threads.clear()
+    assert(solver._map_slices(read) == list(range(6)))
+    assert(threads == {threading.get_ident()})
+
+
+def test_clone_and_break_links(tmpdir):
+    """
+    Ensure that cloned database files share data with their source where
+    possible, and that writing to a clone never modifies the source
+    """
+    src = os.path.join(tmpdir, "src")
+    dst = os.path.join(tmpdir, "dst")
+    os.makedirs(os.path.join(src, "sub"))
+    os.makedirs(dst)
+
+    data = np.linspace(0., 1., 11)
+    for path in [src, os.path.join(src, "sub")]:
+        fortran_binary.write_slice(data, path=path, parameters=["vp", "vs"],
+                                   iproc=0)
+
+    # Force the hardlink fallback as reflinks are filesystem dependent
+    method = unix.clone([os.path.join(src, _) for _ in os.listdir(src)], dst,
+                        methods=["hardlink", "copy"])
+    assert(method in ["hardlink", "copy"])
+    assert(os.path.exists(os.path.join(dst, "sub", "proc000000_vs.bin")))
+
+    # Cloning again onto existing (possibly linked) files keeps the source
+    for _ in range(2):
+        unix.clone([os.path.join(src, _) for _ in os.listdir(src)], dst)
+    for path in [src, os.path.join(src, "sub"), dst]:
+        assert(np.allclose(fortran_binary.read_slice(path, "vp", 0)[0], data))
+
+    # Rewriting a shared slice must not modify the source
+    fortran_binary.write_slice(data * 2, path=dst, parameters="vp", iproc=0)
+    fortran_binary.write_slice(data * 2, path=dst, parameters="vs", iproc=0,
+                               mmap=True)
+    for par in ["vp", "vs"]:
+        assert(np.allclose(fortran_binary.read_slice(src, par, 0)[0], data))
+        assert(np.allclose(fortran_binary.read_slice(dst, par, 0)[0],
+                           data * 2))
+
+    # Remaining links are replaced by private copies with identical contents
+    unix.break_links(dst)
+    fid = os.path.join(dst, "sub", "proc000000_vp.bin")
+    assert(os.stat(fid).st_nlink == 1)
+    assert(np.allclose(fortran_binary.read_slice(os.path.dirname(fid), "vp",
+                                                 0)[0], data))
+
+    # Copying a slice onto a hardlink does not write through it either
+    os.remove(fid)
+    os.link(os.path.join(src, "proc000000_vp.bin"), fid)
+    fortran_binary.copy_slice(dst, os.path.dirname(fid), 0, "vp")
+    assert(np.allclose(fortran_binary.read_slice(src, "vp", 0)[0], data))
+    assert(np.allclose(fortran_binary.read_slice(os.path.dirname(fid), "vp",
+                                                 0)[0], data * 2))
+
+
+def test_unshare_databases(solver, tmpdir, monkeypatch):
+    """
+    Ensure that no database file of a solver directory stays shared with
+    the main solver, as SPECFEM rewrites them in place
+    """
+    from seisflows3.solver import base
+
+    base.PAR.force_set("SOLVER_PROVISION", "link")
+    monkeypatch.setattr(base.Base, "cwd", os.path.join(tmpdir, "001"))
+
+    src = os.path.join(tmpdir, "mainsolver")
+    dst = os.path.join(solver.cwd, "OUTPUT_FILES", "DATABASES_MPI")
+    os.makedirs(src)
+    os.makedirs(dst)
+    fids = ["proc000000_vp.bin", "proc000000_vs.bin", "proc000000_rho.bin",
+            "proc000000_external_mesh.bin"]
+    for fid in fids:
+        with open(os.path.join(src, fid), "w") as f:
+            f.write(fid)
+        os.link(os.path.join(src, fid), os.path.join(dst, fid))
+
+    solver.unshare_databases()
+    nlinks = {fid: os.stat(os.path.join(dst, fid)).st_nlink for fid in fids}
+    assert(nlinks == {fid: 1 for fid in fids})
+    for fid in fids:
+        assert(open(os.path.join(src, fid)).read() == fid)
+
+
+def test_transfer_copy_and_move(tmpdir):
+    """
+    Ensure that bulk transfers match the behavior of unix.cp and unix.mv,
+    e.g., when exporting traces from a solver directory
+    """
+    src = os.path.join(tmpdir, "traces", "obs")
+    os.makedirs(os.path.join(src, "sub"))
+    fids = ["AA.S001.BXZ.sem", "AA.S002.BXZ.sem", os.path.join("sub", "x")]
+    for fid in fids:
+        with open(os.path.join(src, fid), "w") as f:
+            f.write(fid)
+
+    # Copying to a non-existent path renames the directory
+    dst = os.path.join(tmpdir, "output", "001")
+    os.makedirs(os.path.dirname(dst))
+    stats = transfer.copy(src, dst, nworkers=4)
+    assert(stats.nfiles == 3)
+    assert(stats.nbytes == sum([len(_) for _ in fids]))
+    for fid in fids:
+        assert(open(os.path.join(dst, fid)).read() == fid)
+        assert(os.path.exists(os.path.join(src, fid)))
+
+    # Copies replace hardlinked files rather than writing through them
+    shared = os.path.join(tmpdir, "shared")
+    os.link(os.path.join(dst, fids[0]), shared)
+    transfer.copy(os.path.join(src, fids[1]), os.path.join(dst, fids[0]))
+    assert(open(os.path.join(dst, fids[0])).read() == fids[1])
+    assert(open(shared).read() == fids[0])
+
+    # Moving into an existing directory places `src` inside of it
+    stats = transfer.move(src, dst)
+    assert(stats.nrenamed == 1)
+    assert(not os.path.exists(src))
+    assert(os.path.exists(os.path.join(dst, "obs", "sub", "x")))
+
+    # Without renaming, files are copied and the source is removed
+    stats = transfer.move(os.path.join(dst, "obs"), src, rename=False)
+    assert(stats.nfiles == 3 and stats.nrenamed == 0)
+    assert(not os.path.exists(os.path.join(dst, "obs")))
+    assert(sorted(os.listdir(src)) == sorted(["sub"] + fids[:2]))
+
+
+def test_par_file(tmpdir):
+    """
+    Ensure that batched Par_file edits match the getpar/setpar wrappers and
+    that comments and formatting are retained
+    """
+    fid = os.path.join(tmpdir, "Par_file")
+    with open(fid, "w") as f:
+        f.write("# SIMULATION_TYPE = 9\n"
+                "SIMULATION_TYPE                 = 1\n"
+                "SAVE_FORWARD                    = .false.  # comment\n"
+                "DT                              = 1.1d-2\n"
+                "ATTENUATION                     =\n")
+
+    assert(getpar("simulation_type", fid) == ("SIMULATION_TYPE", "1", 1))
+    assert(np.isclose(float(getpar("DT", fid)[1]), 0.011))
+    assert(getpar("SAVE_FOR", fid, match_partial=True)[1] == ".false.")
+    with pytest.raises(KeyError):
+        getpar("SAVE_FOR", fid)
+
+    with ParFile(fid) as par_file:
+        par_file.update({"SIMULATION_TYPE": "3", "SAVE_FORWARD": ".true.",
+                         "ATTENUATION": ".false."})
+        # Nothing is written until the end of the block
+        assert(getpar("SIMULATION_TYPE", fid)[1] == "1")
+
+    assert(getpar("SIMULATION_TYPE", fid)[1] == "3")
+    assert(getpar("ATTENUATION", fid)[1] == ".false.")
+    setpar("DT", "0.05", fid)
+
+    lines = open(fid).readlines()
+    assert(lines[0] == "# SIMULATION_TYPE = 9\n")
+    assert(lines[2] == "SAVE_FORWARD                    = .true.  # comment\n")
+    assert(lines[3] == "DT                              = 0.05\n")
@@ -101,3 +101,367 @@ def test_run_system_workstation(sfinit):
     # We don't care what the function does, just that we can call it
     system.run(classname="system", method="taskid")
 
+
+# SYSTEM.SLURM
+@pytest.fixture
+def sfregister(tmpdir, copy_par_file):
+    """
+    Register parameters and paths only, allowing system modules to be
+    imported without initiating the entire SeisFlows3 working environment
+    """
+    copy_par_file
+    os.chdir(tmpdir)
+    with patch.object(sys, "argv", ["seisflows"]):
+        sf = SeisFlows()
+        sf._register(force=True)
+
+    return sf
+
+
+def test_parse_sacct(sfregister):
+    """
+    Ensure that a single sacct call returns states for the entire job array,
+    including grouped pending array tasks
+    """
+    from seisflows3.system.slurm import parse_sacct
+
+    stdout = ("441630_0|COMPLETED\n"
+              "441630_1|CANCELLED by 1234\n"
+              "441630_[2-4%2]|PENDING\n"
+              "441631|RUNNING\n")
+    states = parse_sacct(stdout)
+    assert(states["441630_0"] == "COMPLETED")
+    assert(states["441630_1"] == "CANCELLED")
+    assert(all([states[f"441630_{i}"] == "PENDING" for i in [2, 3, 4]]))
+    assert(states["441631"] == "RUNNING")
+
+
+def test_monitor_job_array(sfregister):
+    """
+    Ensure that the job array monitor polls until all jobs are finished, or
+    returns early when a job fails
+    """
+    system = config.custom_import("system", "slurm")()
+    job_ids = ["1_0", "1_1"]
+    responses = iter([{"1_0": "RUNNING"},
+                      {"1_0": "COMPLETED", "1_1": "RUNNING"},
+                      {"1_0": "COMPLETED", "1_1": "COMPLETED"}])
+    states = system.monitor_job_array(job_ids, lambda _: next(responses),
+                                      complete_states=["COMPLETED"],
+                                      fail_states=["FAILED"], min_wait=0)
+    assert(states == {"1_0": "COMPLETED", "1_1": "COMPLETED"})
+
+    states = system.monitor_job_array(job_ids,
+                                      lambda _: {"1_0": "FAILED"},
+                                      complete_states=["COMPLETED"],
+                                      fail_states=["FAILED"], min_wait=0)
+    assert(states == {"1_0": "FAILED", "1_1": "UNDEFINED"})
+
+
+def test_slurm_array_helpers(sfregister):
+    """
+    Ensure that sbatch run calls are rewritten for throttled and partial
+    job arrays
+    """
+    from seisflows3.system.slurm import (array_spec, set_sbatch_args,
+                                         append_environs)
+
+    assert(array_spec([0, 1, 2, 5, 7, 8]) == "0-2,5,7-8")
+    assert(array_spec([3]) == "3")
+
+    run_call = ("sbatch --ntasks-per-node=40 --ntasks=4 --array=0-9%2 run "
+                "--output ./output --environment ")
+    run_call = set_sbatch_args(run_call, ntasks=1, array="3,5%2", nodes=1)
+    assert(run_call == ("sbatch --nodes=1 --ntasks-per-node=40 --ntasks=1 "
+                        "--array=3,5%2 run --output ./output --environment "))
+    assert(append_environs(run_call, "A=1").endswith("--environment A=1"))
+    assert(append_environs(run_call + "B=2", "A=1").endswith("B=2,A=1"))
+
+
+def test_slurm_resubmit_failed(sfregister):
+    """
+    Ensure that only failed array tasks are resubmitted, that the workflow
+    is stopped once a task has used up its resubmissions, and that failed or
+    cancelled tasks are never resubmitted
+    """
+    from seisflows3.system import slurm
+
+    for key, val in {"NTASKMAX": 1, "PACK_TASKS": False, "NRESUBMIT": 1,
+                     "TIMEOUT_SCALE": 1.5}.items():
+        slurm.PAR.force_set(key, val)
+    system = slurm.Slurm()
+    submitted = []
+
+    def run(cmd, **kwargs):
+        submitted.append(" ".join(cmd.split()[1:3]))
+        return type("Proc", (), {"stdout": f"Submitted batch job "
+                                           f"{len(submitted)}"})
+
+    def query(job_ids):
+        states = {"1_0": "COMPLETED", "1_1": "NODE_FAIL", "1_2": "TIMEOUT",
+                  "2_1": "COMPLETED", "3_2": "COMPLETED"}
+        return {job_id: states[job_id] for job_id in job_ids}
+
+    with patch.object(slurm.subprocess, "run", run), \
+            patch.object(slurm, "query_job_states", query), \
+            patch("time.sleep"):
+        attempts = system.run_array("sbatch --time=10 --array=0-2%1 run",
+                                    indices=[0, 1, 2], task="solver.eval_func")
+        # Only the timed out task is given a longer time limit
+        assert(submitted == ["--time=10 --array=0-2%1",
+                             "--time=10 --array=1%1",
+                             "--time=15 --array=2%1"])
+        assert(attempts == {1: ["1_1 NODE_FAIL"], 2: ["1_2 TIMEOUT"]})
+
+        # A task that keeps failing stops the workflow
+        submitted.clear()
+        with patch.object(slurm, "query_job_states",
+                          lambda job_ids: {j: "NODE_FAIL" for j in job_ids}):
+            with pytest.raises(SystemExit):
+                system.run_array("sbatch --time=10 --array=0-0 run",
+                                 indices=[0], task="solver.eval_func")
+        assert(submitted == ["--time=10 --array=0%1",
+                             "--time=10 --array=0%1"])
+
+        # Deterministic failures and cancellations stop the workflow at once
+        for state in ["FAILED", "CANCELLED by 1234"]:
+            submitted.clear()
+            with patch.object(slurm, "query_job_states",
+                              lambda job_ids: {j: state for j in job_ids}):
+                with pytest.raises(SystemExit):
+                    system.run_array("sbatch --time=10 --array=0-0 run",
+                                     indices=[0], task="solver.eval_func")
+            assert(submitted == ["--time=10 --array=0%1"])
+
+
+def test_slurm_tasktime_scale(sfregister):
+    """
+    Ensure that tasks doing the work of multiple tasks, e.g., evaluating
+    several trial models, are given a proportionally longer time limit
+    """
+    from seisflows3.system import slurm
+
+    for key, val in {"PACK_TASKS": False, "AUTO_TASKTIME": 0.,
+                     "TASKTIME": 10, "NTASK": 2}.items():
+        slurm.PAR.force_set(key, val)
+    system = slurm.Slurm()
+    run_calls = []
+
+    with patch.object(slurm.Slurm, "checkpoint"), \
+            patch.object(slurm.Slurm, "summarize_profiles"), \
+            patch.object(slurm.Slurm, "task_order", return_value=[0, 1]), \
+            patch.object(slurm.Slurm, "run_array",
+                         lambda self, run_call, **kwargs:
+                         run_calls.append(run_call)):
+        for scale in [1, 3]:
+            system.run("solver", "eval_trials", tasktime_scale=scale,
+                       run_call="sbatch --time=10 --array=0-1 run")
+
+    assert(run_calls == ["sbatch --time=10 --array=0-1 run",
+                         "sbatch --time=30 --array=0-1 run"])
+
+    # Time limits from the runtime history, which is per unit of work, are
+    # scaled the same way
+    slurm.PAR.force_set("AUTO_TASKTIME", 1.5)
+    run_calls.clear()
+    with patch.object(slurm.Slurm, "checkpoint"), \
+            patch.object(slurm.Slurm, "summarize_profiles"), \
+            patch.object(slurm.Slurm, "task_order", return_value=[0, 1]), \
+            patch.object(slurm.Slurm, "predict_runtime", return_value=600.), \
+            patch.object(slurm.Slurm, "run_array",
+                         lambda self, run_call, **kwargs:
+                         run_calls.append(run_call)):
+        for scale in [1, 3]:
+            system.run("solver", "eval_trials", tasktime_scale=scale,
+                       run_call="sbatch --time=10 --array=0-1 run")
+
+    assert(run_calls == ["sbatch --time=15 --array=0-1 run",
+                         "sbatch --time=45 --array=0-1 run"])
+
+
+def test_slurm_resubmit_packed(sfregister, tmpdir):
+    """
+    Ensure that only the failed tasks of a packed array job are resubmitted,
+    each as an array job of a single task
+    """
+    from seisflows3.system import slurm
+
+    for key, val in {"NTASKMAX": 4, "PACK_TASKS": True, "NODESIZE": 4,
+                     "NPROC": 2, "NTASK": 4, "NRESUBMIT": 1,
+                     "TIMEOUT_SCALE": 1.5}.items():
+        slurm.PAR.force_set(key, val)
+    slurm.PATH.force_set("OUTPUT", str(tmpdir))
+    system = slurm.Slurm()
+    assert(system.npack == 2)
+    submitted = []
+
+    def run(cmd, **kwargs):
+        submitted.append(cmd)
+        return type("Proc", (), {"stdout": f"Submitted batch job "
+                                           f"{len(submitted)}"})
+
+    def query(job_ids):
+        states = {"1_0": "OUT_OF_MEMORY", "1_1": "TIMEOUT", "2_2": "COMPLETED",
+                  "3_0": "COMPLETED", "3_1": "COMPLETED"}
+        return {job_id: states[job_id] for job_id in job_ids}
+
+    # scripts/run recorded that only task 2 of array job 0 failed
+    os.makedirs(os.path.join(tmpdir, "failed_tasks"))
+    with open(os.path.join(tmpdir, "failed_tasks", "1_0"), "w") as f:
+        f.write("2")
+
+    run_call = ("sbatch --time=10 --ntasks=4 --array=0-1%2 run "
+                "--environment SEISFLOWS_NPACK=2,SEISFLOWS_TASKORDER=2:3:0:1")
+    with patch.object(slurm.subprocess, "run", run), \
+            patch.object(slurm, "query_job_states", query), \
+            patch("time.sleep"):
+        attempts = system.run_array(run_call, indices=[0, 1],
+                                    task="solver.eval_func",
+                                    packs={0: [2, 3], 1: [0, 1]})
+
+    # The timed out array job had no record, so both its tasks are rerun
+    assert(submitted[0] == run_call)
+    for cmd, args in zip(submitted[1:], [["--time=10", "--array=2%1"],
+                                         ["--time=15", "--array=0-1%2"]]):
+        assert(set(args + ["--ntasks=2"]) < set(cmd.split()))
+        assert(cmd.endswith("SEISFLOWS_NPACK=1,SEISFLOWS_TASKORDER="))
+    assert(attempts == {(1, 2): ["1_0 OUT_OF_MEMORY"],
+                        (1, 0): ["1_1 TIMEOUT"],
+                        (1, 1): ["1_1 TIMEOUT"]})
+
+
+# SYSTEM.MULTICORE
+def test_multicore_required(sfregister):
+    """
+    Ensure that the multicore system extends the workstation parameters with
+    a core budget
+    """
+    system = config.custom_import("system", "multicore")()
+    parameters = system.required.parameters
+    for par in ["NTASK", "NPROC", "NPROCMAX"]:
+        assert(par in parameters)
+
+
+def test_task_worker_messages(tmpdir):
+    """
+    Ensure that task descriptors and file descriptors survive the round trip
+    to a task worker, and that checkpoint changes are detected
+    """
+    import socket
+    from seisflows3.tools import worker
+
+    with open(os.path.join(tmpdir, "seisflows_solver.p"), "w") as f:
+        f.write("a")
+    stamp = worker.checkpoint_stamp(tmpdir)
+    assert(stamp == worker.checkpoint_stamp(tmpdir))
+
+    client, server = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client, server:
+        request = {"classname": "solver", "method": "eval_func",
+                   "environ": {"SEISFLOWS_TASKID": "3"}}
+        worker._send(client, request, fds=[sys.stdout.fileno()])
+        received, fds = worker._recv(server)
+        assert(received == request)
+        assert(len(fds) == 1)
+        os.close(fds[0])
+
+        # A closed connection is reported as an empty message
+        client.close()
+        assert(worker._recv(server) == (None, []))
+
+    with open(os.path.join(tmpdir, "seisflows_solver.p"), "w") as f:
+        f.write("ab")
+    assert(stamp != worker.checkpoint_stamp(tmpdir))
+    assert(worker.address(tmpdir) == worker.address(str(tmpdir) + "/"))
+
+    # Workers are never shared between job allocations, but packed tasks of
+    # one allocation share a worker regardless of their array index
+    job = {"SLURM_JOB_ID": "1", "SLURM_ARRAY_JOB_ID": "1",
+           "SLURM_ARRAY_TASK_ID": "0"}
+    assert(worker.address(tmpdir, job) == worker.address(
+        tmpdir, {**job, "SLURM_ARRAY_TASK_ID": "1"}))
+    assert(worker.address(tmpdir, job) != worker.address(tmpdir, {}))
+    assert(worker.address(tmpdir, job) != worker.address(
+        tmpdir, {**job, "SLURM_JOB_ID": "2", "SLURM_ARRAY_TASK_ID": "1"}))
+    assert(worker.address(tmpdir, {"LSB_JOBID": "1"}) !=
+           worker.address(tmpdir, {"LSB_JOBID": "2"}))
+
+
+def test_task_profiler(tmpdir):
+    """
+    Ensure that task records include phases and failures, and are aggregated
+    into a table with one row per task and one column per phase
+    """
+    import csv
+    from seisflows3.tools import profiler
+
+    def task(fail=False):
+        with profiler.phase("forward"):
+            sum(range(1000))
+        with profiler.phase("export"):
+            if fail:
+                sys.exit(-1)
+
+    profiler.run(task, {}, "solver", "eval_func", taskid=0, path=tmpdir)
+    with pytest.raises(SystemExit):
+        profiler.run(task, {"fail": True}, "solver", "eval_func", taskid=1,
+                     path=tmpdir)
+
+    records = profiler.read_records(tmpdir)
+    assert([r["status"] for r in records] == ["completed", "failed"])
+    assert([p["name"] for p in records[0]["phases"]] == ["forward", "export"])
+    assert(records[0]["wall"] >= records[0]["phases"][0]["elapsed"])
+
+    fid = os.path.join(tmpdir, "summary.csv")
+    profiler.write_summary(records, fid)
+    with open(fid) as f:
+        rows = list(csv.DictReader(f))
+    assert(len(rows) == 2)
+    assert(rows[1]["status"] == "failed")
+    assert("forward" in rows[0] and "maxrss_mb" in rows[0])
+
+    # Phases outside of a profiled task are ignored
+    with profiler.phase("forward"):
+        pass
+
+
+def test_task_history_lpt_order(sfregister, tmpdir, monkeypatch):
+    """
+    Ensure that event runtimes are recorded across calls and used to start
+    the longest running events first
+    """
+    from types import SimpleNamespace
+    from seisflows3.system import base
+
+    base.PATH.force_set("OUTPUT", str(tmpdir))
+    base.PAR.force_set("LPT_ORDER", True)
+    monkeypatch.setitem(sys.modules, "seisflows_solver",
+                        SimpleNamespace(source_names=["A", "B", "C"]))
+    system = base.Base()
+
+    # Without a history, tasks keep their order
+    assert(system.task_order("solver", "eval_func", 3) == [0, 1, 2])
+    assert(system.predict_runtime("solver", "eval_func", 3) is None)
+
+    for walls in [[10., 30., 20.], [12., 40., 20.]]:
+        records = [{"taskid": i, "status": "completed", "wall": wall}
+                   for i, wall in enumerate(walls)]
+        system.update_history("solver", "eval_func", records)
+
+    assert(system.load_history("solver", "eval_func")["B"] == [30., 40.])
+    assert(system.task_order("solver", "eval_func", 3) == [1, 2, 0])
+    assert(system.predict_runtime("solver", "eval_func", 3) == 40.)
+
+    # Events without a history are started first, failed tasks are ignored
+    system.update_history("solver", "eval_func",
+                          [{"taskid": 0, "status": "failed", "wall": 99.}])
+    assert(system.load_history("solver", "eval_func")["A"] == [10., 12.])
+
+    # Tasks doing the work of several tasks are recorded per unit of work
+    system.update_history("solver", "eval_trials",
+                          [{"taskid": 0, "status": "completed", "wall": 30.}],
+                          tasktime_scale=3)
+    assert(system.load_history("solver", "eval_trials")["A"] == [10.])
+    monkeypatch.setitem(sys.modules, "seisflows_solver",
+                        SimpleNamespace(source_names=["A", "B", "C", "D"]))
+    assert(system.task_order("solver", "eval_func", 4) == [3, 1, 2, 0])
@@ -5,8 +5,6 @@ Tools useful for array manipulation in Seisflows
 import os
 
 import numpy as np
-import scipy.signal as _signal
-import scipy.interpolate as _interp
 
 from seisflows3.tools.math import gaussian
 
@@ -109,6 +107,7 @@ def gridsmooth(Z, span):
     :return: smoothed array
     """
     import warnings
+    from scipy.signal import convolve2d
     warnings.filterwarnings('ignore')
 
     x = np.linspace(-2.*span, 2.*span, 2.*span + 1.)
@@ -121,8 +120,8 @@ def gridsmooth(Z, span):
     F = gaussian(X, Y, mu, sigma)
     F = F/np.sum(F)
     W = np.ones(Z.shape)
-    Z = _signal.convolve2d(Z, F, "same")
-    W = _signal.convolve2d(W, F, "same")
+    Z = convolve2d(Z, F, "same")
+    W = convolve2d(W, F, "same")
     Z = Z/W
 
     return Z
@@ -174,6 +173,8 @@ def mesh2grid(v, mesh):
     dx = lx/nx
     dz = lz/nz
 
+    from scipy.interpolate import griddata
+
     # Construct structured grid
     x = np.linspace(x.min(), x.max(), nx)
     z = np.linspace(z.min(), z.max(), nz)
@@ -181,11 +182,11 @@ def mesh2grid(v, mesh):
     grid = stack(X.flatten(), Z.flatten())
 
     # Interpolate to structured grid
-    V = _interp.griddata(mesh, v, grid, 'linear')
+    V = griddata(mesh, v, grid, 'linear')
 
     # Workaround edge issues
     if np.any(np.isnan(V)):
-        W = _interp.griddata(mesh, v, grid, 'nearest')
+        W = griddata(mesh, v, grid, 'nearest')
         for i in np.where(np.isnan(V)):
             V[i] = W[i]
 
@@ -198,5 +199,7 @@ def grid2mesh(V, grid, mesh):
     Interpolates from structured coordinates (grid) to unstructured
     coordinates (mesh)
     """
-    return _interp.griddata(grid, V.flatten(), mesh, 'linear')
+    from scipy.interpolate import griddata
+
+    return griddata(grid, V.flatten(), mesh, 'linear')
 
@@ -2,8 +2,98 @@
 """
 Mathematical tools for Seisflows
 """
+import hashlib
 import numpy as np
-from scipy.signal import hilbert as analytic
+
+
+def analytic(w, axis=-1):
+    """
+    Compute the analytic signal with scipy.signal.hilbert. SciPy is imported
+    on first use so that it is not loaded by modules that never need it
+
+    :type w: np.array
+    :param w: signal data, must be real
+    :type axis: int
+    :param axis: axis along which to transform
+    :rtype: np.array
+    :return: complex analytic signal
+    """
+    from scipy.signal import hilbert
+    return hilbert(w, axis=axis)
+
+
+class AnalyticSignalCache:
+    """
+    Analytic signal (via the FFT-based Hilbert transform) with an optional
+    cache, so that misfit and adjoint source functions operating on the same
+    traces can reuse each other's transforms.
+
+    The cache is only active within a `with` block, outside of which every
+    call computes a new transform. Cached signals are discarded when the block
+    exits, while the counters are kept until the next block is entered.
+
+    .. rubric::
+        >>> with analytic_signal:
+        >>>     env = abs(analytic_signal(syn))  # computed
+        >>>     phi = np.angle(analytic_signal(syn))  # reused
+        >>> analytic_signal.avoided
+        1
+    """
+    def __init__(self):
+        """
+        :type computed: int
+        :param computed: number of transforms computed in the last session
+        :type avoided: int
+        :param avoided: number of transforms avoided in the last session
+        """
+        self._signals = {}
+        self._active = False
+        self.computed = 0
+        self.avoided = 0
+
+    def __enter__(self):
+        """Start a caching session, reset the counters"""
+        self._signals = {}
+        self._active = True
+        self.computed = 0
+        self.avoided = 0
+        return self
+
+    def __exit__(self, *args):
+        """End the caching session and free the cached signals"""
+        self._signals = {}
+        self._active = False
+
+    def __call__(self, w, axis=-1):
+        """
+        Return the analytic signal of `w`, from the cache if possible
+
+        :type w: np.array
+        :param w: signal data, must be real
+        :type axis: int
+        :param axis: axis along which to transform
+        :rtype: np.array
+        :return: complex analytic signal, read-only if cached
+        """
+        if not self._active:
+            return analytic(w, axis=axis)
+
+        w = np.asarray(w)
+        key = (w.shape, w.dtype.str, axis,
+               hashlib.blake2b(w.tobytes(), digest_size=16).digest())
+        if key in self._signals:
+            self.avoided += 1
+        else:
+            signal = analytic(w, axis=axis)
+            signal.setflags(write=False)
+            self._signals[key] = signal
+            self.computed += 1
+
+        return self._signals[key]
+
+
+# Shared instance used by the misfit and adjoint source functions
+analytic_signal = AnalyticSignalCache()
 
 
 def angle(x, y):
@@ -49,7 +139,7 @@ def hilbert(w):
     :rtype: float
     :return: imaginary part of the analytic signal
     """
-    return np.imag(analytic(w))
+    return np.imag(analytic_signal(w))
 
 
 def poissons_ratio(vp, vs):
@@ -0,0 +1,268 @@
+"""
+Timing and resource instrumentation of the tasks run by system.run()
+
+Each task is evaluated inside a TaskProfile, which records its wall time, CPU
+time, peak memory and block I/O, as well as the duration of named phases
+within the task (e.g., 'forward', 'preprocess'). Phases are marked in the code
+with the module-level phase() context manager, which does nothing if no task
+is being profiled. Records are written as one JSON file per task and are
+aggregated by the master job into one CSV table per call of system.run().
+
+.. note::
+    Resource usage is taken from getrusage() for this process and all of its
+    finished child processes (e.g., mpiexec or srun), so processes that run
+    on other nodes, such as remote MPI ranks, are not accounted for. Block
+    I/O is counted in 512 byte blocks and may be zero on network filesystems
+
+Only imports the standard library, as it is used by the task worker.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import socket
+import resource
+from contextlib import contextmanager
+
+
+# The profile of the task currently being evaluated by this process
+_active = None
+
+# Columns of the summary table, followed by one column per phase
+COLUMNS = ["taskid", "status", "host", "wall", "cpu_user", "cpu_sys",
+           "maxrss_mb", "read_mb", "write_mb"]
+
+
+class TaskProfile:
+    """
+    Records the resource usage of a single task, used as a context manager
+    around the evaluation of the task
+
+    .. rubric::
+        with TaskProfile("solver", "eval_func", taskid=0) as profile:
+            with phase("forward"):
+                solver.forward()
+        profile.write(path)
+    """
+    def __init__(self, classname, method, taskid):
+        """
+        :type classname: str
+        :param classname: the class of the evaluated task
+        :type method: str
+        :param method: the method of the evaluated task
+        :type taskid: int
+        :param taskid: the task id of the evaluated task
+        """
+        self.classname = classname
+        self.method = method
+        self.taskid = taskid
+        self.host = socket.gethostname()
+        self.status = "running"
+        self.start = None
+        self.wall = 0.
+        self.usage = {}
+        self.phases = []
+
+        self._t0 = None
+        self._usage0 = None
+
+    def __enter__(self):
+        """Start recording, make this the active profile of the process"""
+        global _active
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self._usage0 = _usage()
+        _active = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop recording, the task failed if it raised or exited non-zero"""
+        global _active
+        self.wall = time.perf_counter() - self._t0
+        usage = _usage()
+        for key in ["cpu_user", "cpu_sys", "read_mb", "write_mb"]:
+            self.usage[key] = usage[key] - self._usage0[key]
+        self.usage["maxrss_mb"] = usage["maxrss_mb"]
+
+        if exc_type is None or (exc_type is SystemExit and
+                                exc_value.code in [None, 0]):
+            self.status = "completed"
+        else:
+            self.status = "failed"
+        _active = None
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Record the duration of a named phase of the task
+
+        :type name: str
+        :param name: name of the phase, e.g., 'forward'
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({"name": name,
+                                "start": start - self._t0,
+                                "elapsed": time.perf_counter() - start})
+
+    @property
+    def record(self):
+        """
+        :rtype: dict
+        :return: JSON serializable record of the task
+        """
+        return {"classname": self.classname, "method": self.method,
+                "taskid": self.taskid, "host": self.host, "pid": os.getpid(),
+                "status": self.status, "start": self.start, "wall": self.wall,
+                **self.usage, "phases": self.phases}
+
+    def write(self, path):
+        """
+        Write the record of this task to `path`/{taskid}.json
+
+        :type path: str
+        :param path: directory to write the record to
+        """
+        os.makedirs(path, exist_ok=True)
+        fid = os.path.join(path, f"{self.taskid:04d}.json")
+        with open(f"{fid}.tmp", "w") as f:
+            json.dump(self.record, f, indent=4)
+        os.replace(f"{fid}.tmp", fid)
+
+
+@contextmanager
+def phase(name):
+    """
+    Record the duration of a named phase in the profile of the task currently
+    evaluated by this process, if there is one
+
+    :type name: str
+    :param name: name of the phase, e.g., 'forward'
+    """
+    if _active is None:
+        yield
+    else:
+        with _active.phase(name):
+            yield
+
+
+def run(func, kwargs, classname, method, taskid, path):
+    """
+    Evaluate func(**kwargs) as a profiled task and write its record to
+    `path`, also if the task fails
+
+    :type func: function
+    :param func: the task to evaluate
+    :type kwargs: dict
+    :param kwargs: keyword arguments passed to `func`
+    :type classname: str
+    :param classname: the class of the evaluated task
+    :type method: str
+    :param method: the method of the evaluated task
+    :type taskid: int
+    :param taskid: the task id of the evaluated task
+    :type path: str
+    :param path: directory to write the record to
+    """
+    profile = TaskProfile(classname, method, taskid)
+    try:
+        with profile:
+            func(**kwargs)
+    finally:
+        try:
+            profile.write(path)
+        except OSError as e:
+            print(f"task profile could not be written: {e}", file=sys.stderr)
+
+
+def read_records(path):
+    """
+    Read all task records written to `path`
+
+    :type path: str
+    :param path: directory containing JSON task records
+    :rtype: list of dict
+    :return: task records sorted by task id
+    """
+    records = []
+    if not os.path.isdir(path):
+        return records
+    for fid in sorted(os.listdir(path)):
+        if fid.endswith(".json"):
+            with open(os.path.join(path, fid)) as f:
+                records.append(json.load(f))
+
+    return sorted(records, key=lambda r: r["taskid"])
+
+
+def write_summary(records, fid):
+    """
+    Write task records as a CSV table with one row per task. Phases are given
+    one column each with their total duration within the task
+
+    :type records: list of dict
+    :param records: task records, see TaskProfile.record
+    :type fid: str
+    :param fid: CSV file to write
+    """
+    phases = []
+    for record in records:
+        for phase_ in record["phases"]:
+            if phase_["name"] not in phases:
+                phases.append(phase_["name"])
+
+    with open(fid, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS + phases)
+        for record in records:
+            elapsed = dict.fromkeys(phases, 0.)
+            for phase_ in record["phases"]:
+                elapsed[phase_["name"]] += phase_["elapsed"]
+            row = [record.get(key, "") for key in COLUMNS]
+            row += [elapsed[name] for name in phases]
+            writer.writerow([f"{val:.3f}" if isinstance(val, float) else val
+                             for val in row])
+
+
+def describe(records):
+    """
+    Summarize task records in a single line, e.g., for log messages
+
+    :type records: list of dict
+    :param records: task records, see TaskProfile.record
+    :rtype: str
+    :return: description of the wall time and memory use of all tasks
+    """
+    if not records:
+        return "no task records"
+    walls = sorted([record["wall"] for record in records])
+    slowest = max(records, key=lambda r: r["wall"])
+    failed = len([r for r in records if r["status"] != "completed"])
+
+    return (f"{len(records)} tasks ({failed} failed), wall time "
+            f"min/median/max {walls[0]:.1f}/{walls[len(walls) // 2]:.1f}/"
+            f"{walls[-1]:.1f}s, slowest task {slowest['taskid']}, peak "
+            f"memory {max([r['maxrss_mb'] for r in records]):.1f} MB")
+
+
+def _usage():
+    """
+    Resource usage of this process and its finished child processes
+
+    :rtype: dict
+    :return: CPU time in s, peak resident memory, block reads and writes in MB
+    """
+    self_ = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    # ru_maxrss is given in kilobytes on Linux but in bytes on macOS
+    scale = 1 / 1024 ** 2 if sys.platform == "darwin" else 1 / 1024
+
+    return {"cpu_user": self_.ru_utime + children.ru_utime,
+            "cpu_sys": self_.ru_stime + children.ru_stime,
+            "maxrss_mb": max(self_.ru_maxrss, children.ru_maxrss) * scale,
+            "read_mb": (self_.ru_inblock + children.ru_inblock) * 512 / 1E6,
+            "write_mb": (self_.ru_oublock + children.ru_oublock) * 512 / 1E6}
@@ -40,6 +40,190 @@ class Container(defaultdict):
         self.minmax = Minmax()
 
 
+class ParFile:
+    """
+    A parsed SPECFEM or SeisFlows3 parameter file. The file is read once and
+    its keys are indexed, so that parameters can be retrieved without
+    searching the file. Edits are made in memory and written back to disk in
+    a single atomic write with `flush`, or on exiting a `with` block.
+
+    .. rubric::
+        >>> with ParFile("DATA/Par_file") as par_file:
+        >>>     par_file.update({"SIMULATION_TYPE": "1",
+        >>>                      "SAVE_FORWARD": ".true."})
+
+    :type file: str
+    :param file: path to the parameter file
+    :type delim: str
+    :param delim: delimiter between parameters and values within the file.
+    :type lines: list of str
+    :param lines: contents of the parameter file
+    """
+    # Parsed files shared by `ParFile.cached`, keyed by path and delimiter
+    _cache = {}
+
+    def __init__(self, file, delim="="):
+        self.file = file
+        self.delim = delim
+        self.lines = open(file, "r").readlines()
+        self.modified = False
+
+        # Index the first occurrence of each key by its upper case form,
+        # which is the first match found when searching top to bottom
+        self._index = {}
+        for i, line in enumerate(self.lines):
+            parts = line.strip().split(delim)
+            if len(parts) == 2:
+                self._index.setdefault(parts[0].strip().upper(), i)
+
+    @classmethod
+    def cached(cls, file, delim="="):
+        """
+        Return a previously parsed file if it has not been modified since,
+        otherwise parse the file and cache it. Returned objects are shared
+        so they should only be used for reading
+
+        :type file: str
+        :param file: path to the parameter file
+        :type delim: str
+        :param delim: delimiter between parameters and values within the file
+        :rtype: ParFile
+        :return: parsed parameter file
+        """
+        stat = os.stat(file)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        key = (os.path.realpath(file), delim)
+        if key not in cls._cache or cls._cache[key][0] != stamp:
+            cls._cache[key] = (stamp, cls(file, delim))
+        return cls._cache[key][1]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def __contains__(self, key):
+        return key.upper() in self._index
+
+    def find(self, key, match_partial=False):
+        """
+        Find the line number containing a given key
+
+        :type key: str
+        :param key: case-insensitive key to match
+        :type match_partial: bool
+        :param match_partial: allow partial key matches, e.g., allow key='tit'
+            to return value for 'title'
+        :rtype: int
+        :return: line number (indexed from 0) of the first matching key
+        :raises KeyError: if no matching key is found
+        """
+        key = key.strip().upper()
+        if key in self._index:
+            return self._index[key]
+        elif match_partial:
+            for key_, i in self._index.items():
+                if key_.startswith(key):
+                    return i
+        raise KeyError(f"Could not find matching key '{key}' in file: "
+                       f"{self.file}")
+
+    def get(self, key, match_partial=False):
+        """
+        Return a parameter from the file. Trailing comments are removed and
+        SPECFEM double precision values (e.g., 38.0d-2) are converted
+
+        :type key: str
+        :param key: case-insensitive key to match
+        :type match_partial: bool
+        :param match_partial: allow partial key matches
+        :rtype: tuple (str, str, int)
+        :return: a tuple of the key, value and line number (indexed from 0).
+            The key will match exactly how it looks in the file
+            The value will be returned as a string, regardless of its type
+        """
+        i = self.find(key, match_partial)
+        key_out, val = self.lines[i].strip().split(self.delim)
+
+        # Drop any trailing line comments and whitespace
+        val = val.split("#")[0].strip()
+
+        # Address the fact that SPECFEM Par_file sometimes lists values as
+        # formatted strings, e.g., 38.0d-2
+        try:
+            if len(val.split("d")) == 2:
+                num, exp = val.split("d")
+                val = str(float(num) * 10 ** int(exp))
+        except ValueError:
+            # This will break on anything other than than the above type str
+            pass
+
+        return key_out.strip(), val, i
+
+    def set(self, key, val, match_partial=False):
+        """
+        Overwrite the value of a parameter in memory, comments and formatting
+        of the line are retained
+
+        :type key: str
+        :param key: case-insensitive key to match
+        :type val: str
+        :param val: value to OVERWRITE to the given key
+        :type match_partial: bool
+        :param match_partial: allow partial key matches
+        """
+        i = self.find(key, match_partial)
+        head, tail = self.lines[i].split(self.delim, 1)
+        val_out = tail.split("#")[0].strip()
+
+        if val_out != "":
+            tail = tail.replace(val_out, str(val), 1)
+        else:
+            # Special case where the initial parameter is empty so we just
+            # append the value before the newline
+            tail = tail.rstrip("\n") + f" {val}\n"
+
+        new_line = f"{head}{self.delim}{tail}"
+        if new_line != self.lines[i]:
+            self.lines[i] = new_line
+            self.modified = True
+
+    def update(self, pars, match_partial=False):
+        """
+        Overwrite the values of multiple parameters in memory
+
+        :type pars: dict
+        :param pars: key value pairs to OVERWRITE
+        :type match_partial: bool
+        :param match_partial: allow partial key matches
+        """
+        for key, val in pars.items():
+            self.set(key, val, match_partial)
+
+    def flush(self):
+        """
+        Write any modifications back to disk. The file is written to a
+        temporary file which then replaces the original, so that the file is
+        never left partially written
+        """
+        if not self.modified:
+            return
+
+        # Resolve symlinks so that the link target is updated, not the link
+        path = os.path.realpath(self.file)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.writelines(self.lines)
+        os.replace(tmp, path)
+        self.modified = False
+
+        # Modification times may be too coarse to invalidate cached copies
+        for key in [_ for _ in self._cache if _[0] == path]:
+            del self._cache[key]
+
+
 def call_solver(mpiexec, executable, output="solver.log"):
     """
     Calls MPI solver executable to run solver binaries, used by individual
@@ -88,6 +272,10 @@ def getpar(key, file, delim="=", match_partial=False):
     # comment comment comment
     {key}      {delim} VAL
 
+    .. note::
+        Parsed files are cached, and only re-read if they have been modified,
+        so repeated calls on the same file do not re-parse it
+
     :type key: str
     :param key: case-insensitive key to match in par_file. must be EXACT match
     :type file: str
@@ -103,51 +291,15 @@ def getpar(key, file, delim="=", match_partial=False):
     :return: a tuple of the key, value and line number (indexed from 0).
         The key will match exactly how it looks in the Par_file
         The value will be returned as a string, regardless of its expected type
-        IF no matches found, returns (None, None, None)
+    :raises KeyError: if no matching key is found
     """
-    lines = open(file, "r").readlines()
-
-    for i, line in enumerate(lines):
-        # Find the first occurence, CASE-INSENSITIVE search, strip whitespace
-        # To allow for nested parameters
-        if line.strip().upper().startswith(key.upper()):
-            try:
-                key_out, val = line.strip().split(delim)
-            except ValueError as e:
-                raise ValueError(
-                    f"Could not split line with delimiter '{delim}'. Error "
-                    f"message: {e}"
-                )
-            # Strip white space now so we can match keys
-            key_out = key_out.strip()
-            # Unless explcitely authorized, don't allow partial matches,
-            # which str.find() will return on. Can have unintended consequences
-            # e.g., 'tit' will return 'title'
-            if (not match_partial) and (key_out.upper() != key.upper()):
-                continue
-            # Drop any trailing line comments
-            if "#" in val:
-                val = val.split("#")[0]
-            # One last strip to remove any whitespace
-            val = val.strip()
-            # Address the fact that SPECFEM Par_file sometimes lists values as
-            # formatted strings, e.g., 38.0d-2
-            try:
-                if len(val.split("d")) == 2:
-                    num, exp = val.split("d")
-                    val = str(float(num) * 10 ** int(exp))
-            except ValueError as e:
-                # This will break on anything other than than the above type str
-                pass
-            break
-    else:
-        raise KeyError(f"Could not find matching key '{key}' in file: {file}")
-    return key_out, val, i
+    return ParFile.cached(file, delim).get(key, match_partial)
 
 
 def setpar(key, val, file, delim="=", match_partial=False):
     """
-    Overwrites parameter value to a SPECFEM Par_file.
+    Overwrites parameter value to a SPECFEM Par_file. To set multiple
+    parameters at once, use a ParFile directly
 
     :type key: str
     :param key: case-insensitive key to match in par_file. must be EXACT match
@@ -163,21 +315,8 @@ def setpar(key, val, file, delim="=", match_partial=False):
         return value for 'title'. Defaults to False as this can have
         unintended consequences
     """
-    key_out, val_out, i = getpar(key, file, delim, match_partial)
-    if key_out is None:
-        return
-
-    lines = open(file, "r").readlines()
-
-    # Replace value in place
-    if val_out != "":
-        lines[i] = lines[i].replace(val_out, str(val))
-    else:
-        # Special case where the initial parameter is empty so we just replace
-        # the newline formatter at the end
-        lines[i] = lines[i].replace("\n", f" {val}\n")
-    with open(file, "w") as f:
-        f.writelines(lines)
+    with ParFile(file, delim) as par_file:
+        par_file.set(key, val, match_partial)
 
 
 def getpar_vel_model(file):
@@ -286,16 +425,35 @@ def check_poissons_ratio(vp, vs, min_val=-1., max_val=0.5):
     :return:
     """
     poissons = poissons_ratio(vp=vp, vs=vs)
-    if (poissons.min() < min_val) or (poissons.max() > max_val):
+    check_poissons_bounds(pmin=poissons.min(), pmax=poissons.max(),
+                          min_val=min_val, max_val=max_val)
+    return poissons
+
+
+def check_poissons_bounds(pmin, pmax, min_val=-1., max_val=0.5):
+    """
+    Exit SeisFlows3 if the bounds of Poisson's ratio of a model, e.g., as
+    computed by seisflows3.tools.vectors.vector_stats, are outside `min_val`
+    or `max_val`, which by default are set internally by SPECFEM
+
+    :type pmin: float
+    :param pmin: minimum Poisson's ratio of the model
+    :type pmax: float
+    :param pmax: maximum Poisson's ratio of the model
+    :type min_val: float
+    :param min_val: minimum model-wide acceptable value for poissons ratio
+    :type max_val: float
+    :param max_val: maximum model-wide acceptable value for poissons ratio
+    """
+    if (pmin < min_val) or (pmax > max_val):
         print(msg.cli(f"The Poisson's ratio of the given model is out of "
                       f"bounds with respect to the defined range "
                       f"({min_val}, {max_val}). "
                       f"The model bounds were found to be:",
-                      items=["{pmin:.2f} < PR < {pmax:.2f}"], border="=",
+                      items=[f"{pmin:.2f} < PR < {pmax:.2f}"], border="=",
                       header="Poisson's Ratio Error")
               )
         sys.exit(-1)
-    return poissons
 
 
 def _split(string, sep):
@@ -0,0 +1,258 @@
+"""
+Bulk file transfer utilities used to move large numbers of files, e.g.,
+traces, kernels and models, between the scratch and output directories.
+
+Directory trees are scanned once with os.scandir, and individual files are
+then copied or moved concurrently by a pool of threads, which hides the
+per-file latency of parallel filesystems. Moves on the same filesystem are
+performed with os.rename wherever possible so that no data are copied.
+
+The handling of `src` and `dst` matches that of seisflows3.tools.unix.cp and
+seisflows3.tools.unix.mv, with the exception that directories are always
+merged into existing destination directories.
+"""
+import os
+import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Default number of threads used to transfer files
+NWORKERS = 8
+
+
+class TransferStats:
+    """
+    Bookkeeping of a bulk file transfer
+
+    :type nfiles: int
+    :param nfiles: number of individual files copied or moved
+    :type nbytes: int
+    :param nbytes: total size of the individual files copied or moved
+    :type nrenamed: int
+    :param nrenamed: number of files or directories moved with a single
+        rename, whose contents are not included in `nfiles` and `nbytes`
+    :type elapsed: float
+    :param elapsed: wall time of the transfer in seconds
+    """
+    def __init__(self):
+        self.nfiles = 0
+        self.nbytes = 0
+        self.nrenamed = 0
+        self.elapsed = 0.
+
+    @property
+    def files_per_sec(self):
+        """
+        :rtype: float
+        :return: transfer rate in files per second
+        """
+        return self.nfiles / self.elapsed if self.elapsed else 0.
+
+    @property
+    def bytes_per_sec(self):
+        """
+        :rtype: float
+        :return: transfer rate in bytes per second
+        """
+        return self.nbytes / self.elapsed if self.elapsed else 0.
+
+    def __str__(self):
+        return (f"{self.nfiles} files ({self.nbytes / 1E6:.2f} MB) and "
+                f"{self.nrenamed} renames in {self.elapsed:.2f}s "
+                f"({self.files_per_sec:.1f} files/s, "
+                f"{self.bytes_per_sec / 1E6:.2f} MB/s)")
+
+
+def copy(src, dst, nworkers=NWORKERS):
+    """
+    Copy files and directories concurrently
+
+    :type src: str or list or tuple
+    :param src: file(s) or directories to copy
+    :type dst: str
+    :param dst: location to copy to, must be an existing directory if
+        multiple `src` are given
+    :type nworkers: int
+    :param nworkers: number of threads used to copy files
+    :rtype: TransferStats
+    :return: statistics of the transfer
+    """
+    start = time.time()
+    stats = TransferStats()
+
+    files, dirs = [], []
+    for src_ in _sources(src, dst):
+        _scan(src_, _target(src_, dst), files, dirs)
+
+    _transfer(_copy_file, files, dirs, nworkers, stats)
+    stats.elapsed = time.time() - start
+
+    return stats
+
+
+def move(src, dst, nworkers=NWORKERS, rename=True):
+    """
+    Move files and directories concurrently. If `rename` is True, whole files
+    or directories are first renamed, which is only possible on the same
+    filesystem. Anything that cannot be renamed is copied and then removed
+
+    :type src: str or list or tuple
+    :param src: file(s) or directories to move
+    :type dst: str
+    :param dst: location to move to, must be an existing directory if
+        multiple `src` are given
+    :type nworkers: int
+    :param nworkers: number of threads used to move files
+    :type rename: bool
+    :param rename: attempt to rename files and directories before copying
+    :rtype: TransferStats
+    :return: statistics of the transfer
+    """
+    start = time.time()
+    stats = TransferStats()
+
+    files, dirs, remove = [], [], []
+    for src_ in _sources(src, dst):
+        dst_ = _target(src_, dst)
+        if rename and not os.path.isdir(dst_):
+            try:
+                os.rename(src_, dst_)
+                stats.nrenamed += 1
+                continue
+            except OSError:
+                pass
+        _scan(src_, dst_, files, dirs)
+        if os.path.isdir(src_):
+            remove.append(src_)
+
+    move_file = _rename_or_copy if rename else _copy_and_remove
+    _transfer(move_file, files, dirs, nworkers, stats)
+
+    # Only empty directories remain once all files have been moved
+    for src_ in remove:
+        shutil.rmtree(src_)
+    stats.elapsed = time.time() - start
+
+    return stats
+
+
+def _sources(src, dst):
+    """
+    Check and return a list of sources to transfer
+
+    :type src: str or list or tuple
+    :param src: file(s) or directories to transfer
+    :type dst: str
+    :param dst: location to transfer to
+    :rtype: list
+    :return: list of sources
+    """
+    if isinstance(src, (list, tuple)):
+        if len(src) > 1:
+            assert os.path.isdir(dst), \
+                "'dst' must be a directory for multiple input `src`"
+        return list(src)
+    return [src]
+
+
+def _target(src, dst):
+    """
+    Sources are placed inside `dst` if it is an existing directory, or
+    otherwise renamed to `dst`
+
+    :rtype: str
+    :return: the destination path of `src`
+    """
+    if os.path.isdir(dst):
+        return os.path.join(dst, os.path.basename(os.path.normpath(src)))
+    return dst
+
+
+def _scan(src, dst, files, dirs):
+    """
+    Recursively collect the files to transfer from `src` and the directories
+    that need to exist for them, using a single os.scandir call per directory
+
+    :type src: str
+    :param src: file or directory to scan
+    :type dst: str
+    :param dst: destination path of `src`
+    :type files: list
+    :param files: list to append (src, dst, size) tuples of files to
+    :type dirs: list
+    :param dirs: list to append destination directories to
+    """
+    if not os.path.isdir(src):
+        files.append((src, dst, os.path.getsize(src)))
+        return
+
+    dirs.append(dst)
+    with os.scandir(src) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                _scan(entry.path, os.path.join(dst, entry.name), files, dirs)
+            else:
+                files.append((entry.path, os.path.join(dst, entry.name),
+                              entry.stat().st_size))
+
+
+def _transfer(func, files, dirs, nworkers, stats):
+    """
+    Create destination directories, then apply `func` to all files in a
+    thread pool
+
+    :type func: function
+    :param func: function called as func(src, dst) for each file
+    :type files: list
+    :param files: (src, dst, size) tuples of files to transfer
+    :type dirs: list
+    :param dirs: destination directories to create
+    :type nworkers: int
+    :param nworkers: number of threads used to transfer files
+    :type stats: TransferStats
+    :param stats: statistics of the transfer, updated in place
+    """
+    for dir_ in dirs:
+        os.makedirs(dir_, exist_ok=True)
+
+    if nworkers > 1 and len(files) > 1:
+        with ThreadPoolExecutor(max_workers=nworkers) as executor:
+            list(executor.map(lambda f: func(f[0], f[1]), files))
+    else:
+        for src, dst, _ in files:
+            func(src, dst)
+
+    stats.nfiles += len(files)
+    stats.nbytes += sum([size for _, _, size in files])
+
+
+def _rename_or_copy(src, dst):
+    """
+    Move a single file with a rename, falling back to a copy across
+    filesystems
+    """
+    try:
+        os.replace(src, dst)
+    except OSError:
+        _copy_and_remove(src, dst)
+
+
+def _copy_file(src, dst):
+    """
+    Copy a single file. As in unix.cp, a destination that is hardlinked to
+    other files is removed first, rather than written through, which would
+    modify the data seen through all of its other links
+    """
+    if os.path.isfile(dst) and not os.path.islink(dst) and \
+            os.stat(dst).st_nlink > 1:
+        os.remove(dst)
+    shutil.copyfile(src, dst)
+
+
+def _copy_and_remove(src, dst):
+    """
+    Move a single file by copying it and then removing the original
+    """
+    _copy_file(src, dst)
+    os.remove(src)
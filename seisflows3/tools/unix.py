@@ -12,6 +12,37 @@ import socket
 from seisflows3.tools.wrappers import iterable
 
 
+# Linux ioctl request code for FICLONE, which creates a copy-on-write clone
+FICLONE = 0x40049409
+
+
+def break_links(path):
+    """
+    Replace hardlinked files with private copies, so that they can be modified
+    in place without modifying the other links to the same data
+
+    :type path: str
+    :param path: file, or directory to search recursively for hardlinked files
+    :rtype: int
+    :return: number of files that were copied
+    """
+    if os.path.isdir(path):
+        fids = [os.path.join(root, fid) for root, _, files in os.walk(path)
+                for fid in files]
+    else:
+        fids = [path]
+
+    ncopied = 0
+    for fid in fids:
+        if not os.path.islink(fid) and os.stat(fid).st_nlink > 1:
+            tmp = f"{fid}.unshare"
+            shutil.copy2(fid, tmp)
+            os.replace(tmp, fid)
+            ncopied += 1
+
+    return ncopied
+
+
 def cat(src, dst=None):
     """
     Concatenate files and print to standard output or write to file
@@ -41,6 +72,87 @@ def cd(path):
     os.chdir(path)
 
 
+def clone(src, dst, methods=None):
+    """
+    Copy files or directories, sharing data with `src` where the filesystem
+    allows it. Each file is first reflinked (a copy-on-write clone, e.g., on
+    XFS or Btrfs), then hardlinked, and otherwise copied. A method that fails
+    is not attempted again for the remaining files.
+
+    .. warning::
+        Hardlinked files share data with `src`, they must be broken with
+        `break_links` before being modified in place
+
+    :type src: str or list or tuple
+    :param src: source to clone from
+    :type dst: str
+    :param dst: destination to clone to
+    :type methods: list
+    :param methods: methods to attempt in order, modified in place as methods
+        fail. Defaults to ['reflink', 'hardlink', 'copy']
+    :rtype: str
+    :return: the method used to clone the last file
+    """
+    if methods is None:
+        methods = ["reflink", "hardlink", "copy"]
+
+    if isinstance(src, (list, tuple)):
+        for sub in src:
+            clone(sub, dst, methods)
+        return methods[0]
+
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+
+    # Existing files are replaced, never written to, as they may be hardlinks
+    # to `src` (e.g., if provisioned before), which would truncate `src`
+    if not os.path.isdir(src) and os.path.lexists(dst) and \
+            not os.path.isdir(dst):
+        os.remove(dst)
+
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+    elif os.path.isdir(src):
+        os.makedirs(dst, exist_ok=True)
+        for sub in os.listdir(src):
+            clone(os.path.join(src, sub), dst, methods)
+    else:
+        while True:
+            try:
+                _clone_file(src, dst, methods[0])
+                break
+            except OSError:
+                if methods[0] == "copy":
+                    raise
+                if os.path.lexists(dst):
+                    os.remove(dst)
+                methods.pop(0)
+
+    return methods[0]
+
+
+def _clone_file(src, dst, method):
+    """
+    Clone a single file using a given method
+
+    :type src: str
+    :param src: file to clone
+    :type dst: str
+    :param dst: path of the new file
+    :type method: str
+    :param method: 'reflink', 'hardlink' or 'copy'
+    """
+    if method == "reflink":
+        import fcntl  # only available on Unix systems
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copymode(src, dst)
+    elif method == "hardlink":
+        os.link(src, dst)
+    else:
+        shutil.copy(src, dst)
+
+
 def cp(src='', dst=''):
     """
     Copy files
@@ -65,6 +177,10 @@ def cp(src='', dst=''):
             return
 
     if os.path.isfile(src):
+        # Do not write through a hardlink, which would modify all other links
+        if os.path.isfile(dst) and not os.path.islink(dst) and \
+                os.stat(dst).st_nlink > 1:
+            os.remove(dst)
         shutil.copy(src, dst)
 
     elif os.path.isdir(src):
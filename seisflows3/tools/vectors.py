@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Storage of the large model-sized vectors (models, gradients, search
+directions) used by the nonlinear optimization in the master job.
+
+Vectors are persisted as Numpy .npy files and kept in an in-process,
+least-recently-used cache, so that vectors which are read repeatedly within
+an iteration are only read from disk once. Writes go straight through to disk,
+so the files on disk always reflect the current state of the optimization and
+can be used to checkpoint and resume a workflow.
+
+Arithmetic and statistics of these vectors are computed in chunks, in a
+single pass over the vectors, which bounds the memory needed for temporary
+arrays and lets memory-mapped vectors be streamed from disk.
+"""
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from seisflows3.tools.math import poissons_ratio
+
+
+# Number of vector elements (per model parameter) processed at once
+CHUNK_SIZE = 2 ** 20
+
+
+class VectorStore:
+    """
+    Write-through, least-recently-used cache of .npy files in a directory
+
+    .. note::
+        Cached vectors are shared between callers and are therefore returned
+        read-only. Arrays passed to save() are cached as read-only views,
+        without copying them, so they must not be modified after they were
+        saved. The caller's array itself remains writeable
+
+    .. rubric::
+        store = VectorStore(path="scratch/optimize", maxsize=4)
+        store.save("m_new.npy", m)
+        m = store.load("m_new.npy")  # read from memory
+    """
+    def __init__(self, path, maxsize=4, mmap=False):
+        """
+        :type path: str
+        :param path: directory that the vectors are read from and written to
+        :type maxsize: int
+        :param maxsize: maximum number of vectors kept in memory, 0 disables
+            the cache
+        :type mmap: bool
+        :param mmap: memory map vectors when they are read from disk, rather
+            than reading them fully into memory
+        """
+        self.path = path
+        self.maxsize = maxsize
+        self.mmap = mmap
+        self.hits = 0
+        self.misses = 0
+
+        # Maps filenames to (stamp, array), least recently used first
+        self._cache = OrderedDict()
+
+    def fid(self, filename):
+        """
+        Full path of a vector. Works around Numpy's behavior of appending
+        '.npy' to files that it saves.
+
+        :type filename: str
+        :param filename: name of the vector file
+        :rtype: str
+        :return: full path to the vector file
+        """
+        fid = os.path.join(self.path, filename)
+        if not fid.endswith(".npy") and not os.path.exists(fid):
+            fid += ".npy"
+        return fid
+
+    def load(self, filename):
+        """
+        Read a vector, from memory if it is cached and the file on disk has
+        not changed since it was cached
+
+        :type filename: str
+        :param filename: name of the vector file
+        :rtype: np.array
+        :return: read-only vector
+        """
+        fid = self.fid(filename)
+        stamp = _stamp(fid)
+        if fid in self._cache and self._cache[fid][0] == stamp:
+            self._cache.move_to_end(fid)
+            self.hits += 1
+            return self._cache[fid][1]
+
+        self.misses += 1
+        array = np.load(fid, mmap_mode="r" if self.mmap else None)
+        array.setflags(write=False)
+        self._insert(fid, stamp, array)
+
+        return array
+
+    def save(self, filename, array):
+        """
+        Write a vector to disk and cache it. The file is replaced atomically
+        so that an interrupted write does not corrupt the previous vector
+
+        :type filename: str
+        :param filename: name of the vector file
+        :type array: np.array
+        :param array: vector to write, cached as a read-only view
+        """
+        fid = os.path.join(self.path, filename)
+        if not fid.endswith(".npy"):
+            fid += ".npy"
+
+        array = np.asanyarray(array)
+        with open(f"{fid}.tmp", "wb") as f:
+            np.save(f, array)
+        os.replace(f"{fid}.tmp", fid)
+
+        # Memory mapped stores read vectors back lazily rather than keeping
+        # a possibly large array in memory
+        if self.mmap:
+            self._cache.pop(fid, None)
+        else:
+            cached = array.view()
+            cached.setflags(write=False)
+            self._insert(fid, _stamp(fid), cached)
+
+    def axpy(self, filename, alpha, x, y=None):
+        """
+        Write `alpha` * `x` + `y` to a vector file, e.g., a trial model
+        m_try = m_new + alpha * p_new, computed in chunks. Memory mapped stores
+        stream the result straight to disk, so that the memory footprint does
+        not depend on the size of the vectors
+
+        :type filename: str
+        :param filename: name of the vector file to write
+        :type alpha: float
+        :param alpha: scale factor of `x`
+        :type x: str
+        :param x: name of the vector file to scale
+        :type y: str
+        :param y: name of the vector file to add, optional
+        :rtype: np.array
+        :return: read-only result
+        """
+        x = self.load(x)
+        if y is not None:
+            y = self.load(y)
+
+        if not self.mmap:
+            self.save(filename, axpy(alpha, x, y))
+            return self.load(filename)
+
+        fid = os.path.join(self.path, filename)
+        if not fid.endswith(".npy"):
+            fid += ".npy"
+
+        dtype = x.dtype if y is None else np.result_type(x, y)
+        out = np.lib.format.open_memmap(f"{fid}.tmp", mode="w+", dtype=dtype,
+                                        shape=x.shape)
+        axpy(alpha, x, y, out=out)
+        out.flush()
+        del out
+        os.replace(f"{fid}.tmp", fid)
+        self._cache.pop(fid, None)
+
+        return self.load(filename)
+
+    def move(self, src, dst):
+        """
+        Rename a file in the store, keeping a cached vector cached
+
+        :type src: str
+        :param src: name of the file to move
+        :type dst: str
+        :param dst: new name of the file
+        """
+        src = os.path.join(self.path, src)
+        dst = os.path.join(self.path, dst)
+        os.replace(src, dst)
+
+        self._cache.pop(dst, None)
+        if src in self._cache:
+            self._insert(dst, _stamp(dst), self._cache.pop(src)[1])
+
+    def remove(self, filename):
+        """
+        Remove a file from the store, if it exists
+
+        :type filename: str
+        :param filename: name of the file to remove
+        """
+        fid = os.path.join(self.path, filename)
+        self._cache.pop(fid, None)
+        if os.path.exists(fid):
+            os.remove(fid)
+
+    def clear(self):
+        """
+        Empty the cache, files on disk are not affected
+        """
+        self._cache.clear()
+
+    def _insert(self, fid, stamp, array):
+        """
+        Cache a vector and evict the least recently used vectors beyond
+        `maxsize`
+        """
+        if self.maxsize <= 0:
+            return
+        self._cache[fid] = (stamp, array)
+        self._cache.move_to_end(fid)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+
+def _stamp(fid):
+    """
+    Identifies the version of a file on disk. Files replaced by
+    VectorStore.save() always get a new inode
+
+    :type fid: str
+    :param fid: file to stamp
+    :rtype: tuple
+    :return: inode, modification time and size of the file
+    """
+    stat = os.stat(fid)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def axpy(alpha, x, y=None, out=None, chunk_size=CHUNK_SIZE):
+    """
+    Compute `alpha` * `x` + `y` in chunks, which only allocates the output,
+    rather than also a full-sized temporary array for `alpha` * `x`
+
+    :type alpha: float
+    :param alpha: scale factor of `x`
+    :type x: np.array
+    :param x: vector to scale
+    :type y: np.array
+    :param y: vector to add, optional
+    :type out: np.array
+    :param out: array to write the result to, e.g., a writeable memmap.
+        Allocated in memory if not given
+    :type chunk_size: int
+    :param chunk_size: number of elements processed at once
+    :rtype: np.array
+    :return: `out`
+    """
+    if out is None:
+        dtype = x.dtype if y is None else np.result_type(x, y)
+        out = np.empty(x.shape, dtype=dtype)
+
+    for start in range(0, len(x), chunk_size):
+        idx = slice(start, start + chunk_size)
+        if y is None:
+            out[idx] = alpha * x[idx]
+        else:
+            out[idx] = y[idx] + alpha * x[idx]
+
+    return out
+
+
+def vector_stats(m=None, g=None, p=None, parameters=None,
+                 chunk_size=CHUNK_SIZE):
+    """
+    Compute the norms, dot products and model bounds needed by the
+    optimization in one chunked pass over the given vectors
+
+    Returned statistics depend on the vectors given:
+        m: 'm_max' (max. absolute value), 'bounds' ({parameter: (min, max)}),
+            and 'pr' ((min, max) of Poisson's ratio) if the model contains
+            'vp' and 'vs'
+        g: 'gtg', 'g_norm1', 'g_norm2'
+        p: 'ptp', 'p_max' (max. absolute value)
+        g and p: 'gtp', 'theta' (angle between `p` and `-g` in radians)
+
+    :type m: np.array
+    :param m: model vector
+    :type g: np.array
+    :param g: gradient vector
+    :type p: np.array
+    :param p: search direction vector
+    :type parameters: list of str
+    :param parameters: names of the model parameters, e.g., solver.parameters.
+        Vectors are split evenly between these parameters, as in solver.split
+    :type chunk_size: int
+    :param chunk_size: number of elements per parameter processed at once
+    :rtype: dict
+    :return: statistics of the given vectors
+    """
+    vectors = [_ for _ in [m, g, p] if _ is not None]
+    parameters = parameters or ["all"]
+    npar = len(parameters)
+    n, remainder = divmod(len(vectors[0]), npar)
+    if remainder or any(len(_) != len(vectors[0]) for _ in vectors):
+        raise ValueError(f"vectors cannot be split into {npar} parameters of "
+                         f"equal length")
+
+    gtg = gtp = ptp = g_norm1 = 0.
+    m_max = p_max = 0.
+    bounds = {par: (np.inf, -np.inf) for par in parameters}
+    pr = (np.inf, -np.inf)
+    check_pr = m is not None and "vp" in parameters and "vs" in parameters
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        chunks = {}
+        for i, par in enumerate(parameters):
+            idx = slice(i * n + start, i * n + stop)
+            if m is not None:
+                mc = chunks[par] = np.asarray(m[idx], dtype="float64")
+                bounds[par] = (min(bounds[par][0], mc.min()),
+                               max(bounds[par][1], mc.max()))
+                m_max = max(m_max, np.abs(mc).max())
+            if g is not None:
+                gc = np.asarray(g[idx], dtype="float64")
+                gtg += np.dot(gc, gc)
+                g_norm1 += np.abs(gc).sum()
+            if p is not None:
+                pc = np.asarray(p[idx], dtype="float64")
+                ptp += np.dot(pc, pc)
+                p_max = max(p_max, np.abs(pc).max())
+            if g is not None and p is not None:
+                gtp += np.dot(gc, pc)
+        if check_pr:
+            prc = poissons_ratio(vp=chunks["vp"], vs=chunks["vs"])
+            pr = (min(pr[0], prc.min()), max(pr[1], prc.max()))
+
+    stats = {}
+    if m is not None:
+        stats.update(m_max=m_max, bounds=bounds)
+        if check_pr:
+            stats["pr"] = pr
+    if g is not None:
+        stats.update(gtg=gtg, g_norm1=g_norm1, g_norm2=gtg ** 0.5)
+    if p is not None:
+        stats.update(ptp=ptp, p_max=p_max)
+    if g is not None and p is not None:
+        cos = -gtp / (gtg * ptp) ** 0.5
+        stats.update(gtp=gtp, theta=np.arccos(np.clip(cos, -1., 1.)))
+
+    return stats
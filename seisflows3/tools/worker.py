@@ -0,0 +1,478 @@
+"""
+A persistent task worker which keeps a warm Python process on a compute node.
+
+Normally every task started by system.run() executes 'scripts/run', which
+imports SeisFlows3 and its dependencies and unpickles the entire working
+state before evaluating a single function. With a task worker, the first task
+of a job allocation on a node starts a long-lived worker process which does
+this once for all tasks of that allocation on that node. The worker
+listens on a node-local Unix socket for task descriptors (output directory,
+classname, method, and the environment, which carries the task id) and runs
+each task in a forked child process that inherits the warm interpreter. The
+working state is only reloaded when the checkpoint in the output directory
+changes.
+
+'scripts/run' hands tasks to a worker when the environment variable
+SEISFLOWS_WORKER is set (see PAR.TASK_WORKER). The caller passes its stdout
+and stderr to the worker, so task output ends up in the same log files, and
+waits for the task to finish so that its exit code reaches the job scheduler.
+
+.. note::
+    Workers are only reused by tasks that share a job allocation and node,
+    i.e., tasks run by multicore, or tasks packed into one array job by
+    system.slurm (PAR.PACK_TASKS). Every element of an unpacked job array is
+    a separate allocation, which starts its own worker for a single task
+
+.. note::
+    This module is imported by 'scripts/run' before any other SeisFlows3
+    module, so it must only import from the standard library at the top level
+    (seisflows3.tools.profiler also only imports the standard library)
+"""
+import os
+import sys
+import json
+import time
+import array
+import pickle
+import signal
+import socket
+import hashlib
+import logging
+import tempfile
+import traceback
+import subprocess
+
+from seisflows3.tools import profiler
+
+
+# Environment variable that requests tasks be run by a task worker
+ENV_VAR = "SEISFLOWS_WORKER"
+# Seconds that a worker waits for new tasks before shutting down
+IDLE_TIMEOUT = 3600
+# Seconds that a task waits for a newly started worker to accept connections
+START_TIMEOUT = 60
+# Environment variables that identify the job allocation a task runs in
+JOB_ENV_VARS = ["SLURM_JOB_ID", "LSB_JOBID", "PBS_JOBID"]
+
+logger = logging.getLogger(__name__)
+
+
+def address(output, environ=None):
+    """
+    The node-local socket address of the worker serving a given workflow.
+    Linux abstract sockets are used where available, as they do not leave
+    files behind and cannot be shared between nodes.
+
+    The address includes the id of the job allocation that the task runs in
+    and the node, so that workers are never shared between allocations. A
+    worker started by one job runs inside that job's allocation (e.g., its
+    cgroup), and tasks of other jobs on the same node must not run there.
+    The array index is not part of the address, so that tasks of one
+    allocation share a worker
+
+    :type output: str
+    :param output: the SeisFlows3 output directory of the workflow
+    :type environ: dict
+    :param environ: environment of the task, defaults to os.environ
+    :rtype: str
+    :return: socket address
+    """
+    environ = os.environ if environ is None else environ
+    job = ",".join([f"{var}={environ[var]}" for var in JOB_ENV_VARS
+                    if var in environ])
+    key = (f"{os.path.abspath(output)}:{os.getuid()}:{socket.gethostname()}:"
+           f"{job}").encode()
+    name = f"seisflows3_worker_{hashlib.md5(key).hexdigest()[:16]}"
+    if sys.platform.startswith("linux"):
+        return f"\0{name}"
+    else:
+        return os.path.join(tempfile.gettempdir(), f"{name}.sock")
+
+
+def checkpoint_stamp(output):
+    """
+    Summarize the checkpointed working state, so that the worker can tell
+    when it has been rewritten
+
+    :type output: str
+    :param output: the SeisFlows3 output directory of the workflow
+    :rtype: tuple
+    :return: names, modification times and sizes of the checkpoint files
+    """
+    stamp = []
+    with os.scandir(output) as entries:
+        for entry in entries:
+            if entry.name.endswith((".p", ".json")):
+                stat = entry.stat()
+                stamp.append((entry.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(stamp))
+
+
+def run_task(output, classname, method, start=None, load_state=True):
+    """
+    Evaluate a single task, i.e., classname.method(**kwargs) with the keyword
+    arguments checkpointed by system.run()
+
+    :type output: str
+    :param output: the SeisFlows3 output directory of the workflow
+    :type classname: str
+    :param classname: the SeisFlows3 class from within which the desired
+        function is defined
+    :type method: str
+    :param method: the function name from the chosen `classname`
+    :type start: float
+    :param start: time at which the task was started, used to log the startup
+        latency of the task
+    :type load_state: bool
+    :param load_state: load the working state from the checkpoint. Not
+        required if the state has already been loaded by a task worker
+    """
+    from seisflows3 import logger as sf_logger
+    from seisflows3.config import load, config_logger
+
+    # Load the last checkpointed working state from the 'seisflows_?.p` files
+    # Allowing access through sys.modules
+    if load_state:
+        load(output)
+
+    # Load keyword arguments required by this function
+    # Files will be something like: 'solver_eval_func.p'
+    kwargs_path = os.path.join(output, "kwargs", f"{classname}_{method}.p")
+    with open(kwargs_path, "rb") as f:
+        kwargs = pickle.load(f)
+
+    PAR = sys.modules["seisflows_parameters"]
+    PATH = sys.modules["seisflows_paths"]
+    system = sys.modules["seisflows_system"]
+
+    # Configure the CPU-dependent logger which will log to stdout only
+    # But mainsolver will log to the main log file as well
+    if system.taskid() == 0:
+        filename = PATH.LOGFILE
+    else:
+        filename = None
+    sf_logger.handlers.clear()
+    config_logger(level=PAR.LOG_LEVEL, verbose=PAR.VERBOSE, filename=filename)
+
+    # Get the actual function so we can evaluate it
+    func = getattr(sys.modules[f"seisflows_{classname}"], method)
+
+    if start is not None:
+        logger.debug(f"task startup latency: {time.time() - start:.3f}s")
+
+    # Evaluate the function with given keyword arguments, recording the time
+    # and resources used by the task
+    profiler.run(func, kwargs, classname, method, taskid=system.taskid(),
+                 path=system.profile_path(classname, method))
+
+
+def submit(output, classname, method, start=None):
+    """
+    Hand a task to the worker on this node, starting one if none is running,
+    and wait for the task to finish
+
+    :type output: str
+    :param output: the SeisFlows3 output directory of the workflow
+    :type classname: str
+    :param classname: the SeisFlows3 class to run
+    :type method: str
+    :param method: the function name from the chosen `classname`
+    :type start: float
+    :param start: time at which the task was started
+    :rtype: int or None
+    :return: exit code of the task, or None if no worker could be reached, in
+        which case the task should be run by the caller
+    """
+    output = os.path.abspath(output)
+
+    conn = _connect(output)
+    if conn is None:
+        _start_worker(output)
+        conn = _connect(output, timeout=START_TIMEOUT)
+        if conn is None:
+            return None
+
+    request = {"classname": classname, "method": method,
+               "start": start or time.time(), "cwd": os.getcwd(),
+               "environ": dict(os.environ)}
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with conn:
+        _send(conn, request, fds=[sys.stdout.fileno(), sys.stderr.fileno()])
+        response, _ = _recv(conn)
+
+    # The worker exited before the task could report back
+    if response is None:
+        print("task worker exited unexpectedly, see worker log in "
+              f"{_worker_log(output)}", file=sys.stderr)
+        return 1
+
+    return response["returncode"]
+
+
+def serve(output, idle_timeout=IDLE_TIMEOUT):
+    """
+    Run a task worker until it has been idle for `idle_timeout` seconds, or
+    until it receives a shutdown request. Returns immediately if another
+    worker is already serving this workflow on this node
+
+    :type output: str
+    :param output: the SeisFlows3 output directory of the workflow
+    :type idle_timeout: float
+    :param idle_timeout: seconds to wait for new tasks before shutting down
+    """
+    output = os.path.abspath(output)
+    addr = address(output)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(addr)
+    except OSError:
+        _log(f"a worker is already serving {output}")
+        return
+    server.listen(128)
+    server.settimeout(idle_timeout)
+
+    # Task processes are never waited on, let the kernel reap them
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    _log(f"serving {output} on pid {os.getpid()}")
+    stamp = None
+    while True:
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            _log(f"no tasks received in {idle_timeout}s, shutting down")
+            break
+
+        request, fds = _recv(conn)
+        if request is None or request.get("shutdown"):
+            conn.close()
+            _log("shutdown requested")
+            break
+
+        # Only reload the working state when the checkpoint has changed
+        new_stamp = checkpoint_stamp(output)
+        if new_stamp != stamp:
+            tstart = time.time()
+            _load_state(output)
+            stamp = new_stamp
+            _log(f"loaded working state in {time.time() - tstart:.3f}s")
+
+        _log(f"running task {request['classname']}.{request['method']}")
+        if os.fork() == 0:
+            server.close()
+            _run_child(conn, fds, output, request)
+
+        conn.close()
+        for fd in fds:
+            os.close(fd)
+
+    server.close()
+    if not addr.startswith("\0") and os.path.exists(addr):
+        os.remove(addr)
+
+
+def shutdown(output):
+    """
+    Ask the worker serving a workflow on this node to shut down
+
+    :type output: str
+    :param output: the SeisFlows3 output directory of the workflow
+    :rtype: bool
+    :return: True if a worker was running
+    """
+    conn = _connect(os.path.abspath(output))
+    if conn is None:
+        return False
+    with conn:
+        _send(conn, {"shutdown": True})
+    return True
+
+
+def _run_child(conn, fds, output, request):
+    """
+    Run a task inside a forked worker process, using the stdout, stderr,
+    working directory and environment of the process that submitted it.
+    Reports the exit code of the task back to the submitting process and
+    never returns
+
+    :type conn: socket.socket
+    :param conn: connection to the submitting process
+    :type fds: list of int
+    :param fds: stdout and stderr file descriptors of the submitting process
+    :type output: str
+    :param output: the SeisFlows3 output directory of the workflow
+    :type request: dict
+    :param request: task descriptor
+    """
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(fds[0], 1)
+    os.dup2(fds[1], 2)
+    os.environ.clear()
+    os.environ.update(request["environ"])
+    os.chdir(request["cwd"])
+
+    returncode = 0
+    try:
+        run_task(output, request["classname"], request["method"],
+                 start=request["start"], load_state=False)
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            returncode = e.code
+        else:
+            returncode = int(e.code is not None)
+    except BaseException:
+        traceback.print_exc()
+        returncode = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    try:
+        _send(conn, {"returncode": returncode})
+    finally:
+        os._exit(0)
+
+
+def _load_state(output):
+    """
+    Load the working state from the checkpoint. Modules imported by a
+    previous load hold references to the previous state in their globals
+    (e.g., PAR = sys.modules["seisflows_parameters"]), which are pointed to
+    the newly loaded objects
+
+    :type output: str
+    :param output: the SeisFlows3 output directory of the workflow
+    """
+    from types import ModuleType
+    from seisflows3.config import load, NAMES, PAR, PATH
+
+    names = [PAR, PATH] + [f"seisflows_{name}" for name in NAMES]
+    previous = {id(sys.modules[name]): name for name in names
+                if name in sys.modules}
+
+    load(output)
+
+    if not previous:
+        return
+    for module in list(sys.modules.values()):
+        if not isinstance(module, ModuleType) or \
+                not module.__name__.startswith("seisflows3"):
+            continue
+        for attr, val in list(vars(module).items()):
+            if id(val) in previous:
+                setattr(module, attr, sys.modules[previous[id(val)]])
+
+
+def _start_worker(output):
+    """
+    Start a detached task worker for a workflow on this node
+
+    :type output: str
+    :param output: the SeisFlows3 output directory of the workflow
+    """
+    from seisflows3.config import ROOT_DIR
+
+    log = _worker_log(output)
+    os.makedirs(os.path.dirname(log), exist_ok=True)
+    with open(log, "a") as f:
+        subprocess.Popen([sys.executable,
+                          os.path.join(ROOT_DIR, "scripts", "run_worker.py"),
+                          "--output", output],
+                         stdin=subprocess.DEVNULL, stdout=f,
+                         stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def _connect(output, timeout=0):
+    """
+    Connect to the worker serving a workflow on this node
+
+    :type output: str
+    :param output: the SeisFlows3 output directory of the workflow
+    :type timeout: float
+    :param timeout: seconds to keep retrying if no worker is listening yet
+    :rtype: socket.socket or None
+    :return: connection to the worker, None if no worker is listening
+    """
+    deadline = time.time() + timeout
+    while True:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(address(output))
+            return conn
+        except OSError:
+            conn.close()
+            if time.time() >= deadline:
+                return None
+            time.sleep(0.1)
+
+
+def _send(conn, obj, fds=None):
+    """
+    Send a JSON message, optionally passing file descriptors along with it
+
+    :type conn: socket.socket
+    :param conn: connection to send the message over
+    :type obj: dict
+    :param obj: message to send
+    :type fds: list of int
+    :param fds: file descriptors to pass to the receiving process
+    """
+    data = (json.dumps(obj) + "\n").encode()
+    if fds:
+        nsent = conn.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                                       array.array("i", fds))])
+        data = data[nsent:]
+    if data:
+        conn.sendall(data)
+
+
+def _recv(conn):
+    """
+    Receive a JSON message and any file descriptors passed along with it
+
+    :type conn: socket.socket
+    :param conn: connection to receive the message from
+    :rtype: tuple (dict or None, list of int)
+    :return: the message, None if the connection closed before a complete
+        message was received, and any file descriptors that were passed
+    """
+    data, fds = b"", []
+    fd_size = array.array("i").itemsize
+    while not data.endswith(b"\n"):
+        msg, ancdata, _, _ = conn.recvmsg(2 ** 16, socket.CMSG_SPACE(
+            2 * fd_size))
+        if not msg:
+            break
+        data += msg
+        for level, type_, cdata in ancdata:
+            if level == socket.SOL_SOCKET and type_ == socket.SCM_RIGHTS:
+                fds_ = array.array("i")
+                fds_.frombytes(cdata[:len(cdata) - len(cdata) % fd_size])
+                fds += list(fds_)
+
+    if not data.endswith(b"\n"):
+        return None, fds
+    return json.loads(data), fds
+
+
+def _worker_log(output):
+    """
+    The log file of the worker serving a workflow on this node
+
+    :rtype: str
+    :return: path to the log file
+    """
+    return os.path.join(output, "workers", f"{socket.gethostname()}.log")
+
+
+def _log(message):
+    """
+    Write a time stamped status message to the worker log, i.e., stdout
+    """
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} | {message}", flush=True)
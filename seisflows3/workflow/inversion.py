@@ -11,7 +11,7 @@ import numpy as np
 from glob import glob
 
 from seisflows3.config import custom_import, CFGPATHS
-from seisflows3.tools import msg, unix
+from seisflows3.tools import msg, unix, transfer
 from seisflows3.config import save, SeisFlowsPathsParameters
 
 PAR = sys.modules["seisflows_parameters"]
@@ -194,45 +194,64 @@ class Inversion(custom_import("workflow", "base")):
         """
         Conducts line search in given search direction
 
+        The line search is a state machine that steps through 'initialize',
+        'evaluate', 'update' and 'finalize' until it is 'done'. A record of
+        the line search is written after every step, so that an interrupted
+        line search resumes from its last completed step.
+
         Status codes:
             status > 0  : finished
             status == 0 : not finished
             status < 0  : failed
         """
-        # Calculate the initial step length based on optimization algorithm
-        if optimize.line_search.step_count == 0:
-            self.logger.info(msg.mjr(f"CONDUCTING LINE SEARCH "
-                                     f"({optimize.eval_str})")
-                             )
-            optimize.initialize_search()
-
-        # Attempt a new trial step with the given step length
-        optimize.line_search.step_count += 1
-        self.logger.info(msg.mnr(f"TRIAL STEP COUNT: {optimize.eval_str}"))
-        self.evaluate_function(path=PATH.FUNC, suffix="try")
-
-        # Check the function evaluation against line search history
-        status = optimize.update_search()
-
-        # Proceed based on the outcome of the line search
-        if status > 0:
-            self.logger.info("trial step successful")
-            # Save outcome of line search to disk; reset step to 0 for next iter
-            optimize.finalize_search()
-            return
-        elif status == 0:
-            self.logger.info("retrying with new trial step")
-            # Recursively call this function to attempt another trial step
-            self.line_search()
-        elif status < 0:
-            if optimize.retry_status():
-                self.logger.info("line search failed. restarting line search")
-                # Reset the line search machinery; set step count to 0
-                optimize.restart()
-                self.line_search()
-            else:
-                self.logger.info("line search failed. aborting inversion.")
-                sys.exit(-1)
+        step = optimize.resume_search()
+        while step != "done":
+            if step == "initialize":
+                # Calculate the initial step length based on optimization
+                self.logger.info(msg.mjr(f"CONDUCTING LINE SEARCH "
+                                         f"({optimize.eval_str})")
+                                 )
+                optimize.initialize_search()
+                step = "evaluate"
+            elif step == "evaluate":
+                # Attempt new trial step(s) with the given step length(s).
+                # Concurrent trial steps each count towards the step count
+                ntrial = optimize.ntrial
+                optimize.line_search.step_count += ntrial
+                self.logger.info(msg.mnr(f"TRIAL STEP COUNT: "
+                                         f"{optimize.eval_str}"))
+                if ntrial > 1:
+                    self.evaluate_trials(path=PATH.FUNC, ntrial=ntrial)
+                else:
+                    self.evaluate_function(path=PATH.FUNC, suffix="try")
+                step = "update"
+            elif step == "update":
+                # Check the function evaluation against line search history
+                status = optimize.update_search()
+                if status > 0:
+                    self.logger.info("trial step successful")
+                    step = "finalize"
+                elif status == 0:
+                    self.logger.info("retrying with new trial step")
+                    step = "evaluate"
+                elif optimize.retry_status():
+                    self.logger.info("line search failed. restarting line "
+                                     "search")
+                    # Reset the line search machinery; set step count to 0
+                    optimize.restart()
+                    if optimize.line_search.step_count == 0:
+                        step = "initialize"
+                    else:
+                        step = "evaluate"
+                else:
+                    self.logger.info("line search failed. aborting inversion.")
+                    sys.exit(-1)
+            elif step == "finalize":
+                # Save outcome of line search to disk; reset step to 0
+                optimize.finalize_search()
+                step = "done"
+
+            optimize.write_search_state(step)
 
     def evaluate_function(self, path, suffix):
         """
@@ -257,6 +276,43 @@ class Inversion(custom_import("workflow", "base")):
 
         self.write_misfit(path=path, tag=misfit_tag)
 
+    def evaluate_trials(self, path, ntrial):
+        """
+        Performs forward simulations for a number of trial models in one call
+        of system.run(), and evaluates the objective function for each of them.
+        Each trial model is written to and evaluated in its own subdirectory
+        of `path`
+
+        :type path: str
+        :param path: path in the scratch directory to use for I/O
+        :type ntrial: int
+        :param ntrial: number of trial models, see optimize.ntrial
+        """
+        self.logger.info(msg.sub(f"EVALUATE OBJECTIVE FUNCTION FOR {ntrial} "
+                                 f"TRIAL MODELS"))
+
+        paths = [os.path.join(path, f"trial_{i:02d}") for i in range(ntrial)]
+        for i, trial_path in enumerate(paths):
+            dst = os.path.join(trial_path, "model")
+            self.logger.debug(f"saving trial model {i} to:\n{dst}")
+            unix.rm(os.path.join(trial_path, "residuals"))
+            solver.save(solver.split(optimize.trial_model(i)), dst)
+
+        self.logger.debug(f"evaluating objective function {PAR.NTASK} times "
+                          f"on system for {ntrial} trial models...")
+        # Trials are evaluated one after another by each task
+        system.run("solver", "eval_trials", paths=paths, tasktime_scale=ntrial)
+
+        misfits = []
+        for trial_path in paths:
+            src = glob(os.path.join(trial_path, "residuals", "*"))
+            misfits.append(preprocess.sum_residuals(src))
+
+        misfit_str = ", ".join([f"{_:.3E}" for _ in misfits])
+        self.logger.debug(f"saving trial misfits {misfit_str} to tag "
+                          f"'{optimize.f_trials}'")
+        optimize.savetrials(optimize.f_trials, misfits)
+
     def evaluate_gradient(self, path=None):
         """
         Performs adjoint simulation to retrieve the gradient of the objective 
@@ -378,10 +434,10 @@ class Inversion(custom_import("workflow", "base")):
 
         if PAR.SAVEAS in ["binary", "both"]:
             src = os.path.join(PATH.GRAD, "gradient")
-            unix.mv(src, dst)
+            transfer.move(src, dst)
         if PAR.SAVEAS in ["vector", "both"]:
             src = os.path.join(PATH.OPTIMIZE, optimize.g_old)
-            unix.cp(src, dst + ".npy")
+            transfer.copy(src, dst + ".npy")
 
         self.logger.debug(f"saving gradient to path:\n{dst}")
 
@@ -412,7 +468,8 @@ class Inversion(custom_import("workflow", "base")):
 
         self.logger.debug(f"saving kernels to path:\n{dst}")
 
-        unix.mv(src, dst)
+        stats = transfer.move(src, dst)
+        self.logger.debug(f"saved kernels: {stats}")
 
     def save_traces(self):
         """
@@ -426,7 +483,8 @@ class Inversion(custom_import("workflow", "base")):
 
         self.logger.debug(f"saving traces to path:\n{dst}")
 
-        unix.mv(src, dst)
+        stats = transfer.move(src, dst)
+        self.logger.debug(f"saved traces: {stats}")
 
     def save_residuals(self):
         """
@@ -437,5 +495,5 @@ class Inversion(custom_import("workflow", "base")):
 
         self.logger.debug(f"saving residuals to path:\n{dst}")
 
-        unix.mv(src, dst)
+        transfer.move(src, dst)
 
@@ -8,7 +8,7 @@ import os
 import sys
 import logging
 
-from seisflows3.tools import unix, msg
+from seisflows3.tools import unix, msg, transfer
 from seisflows3.tools.wrappers import exists
 from seisflows3.config import custom_import, SeisFlowsPathsParameters
 
@@ -95,7 +95,7 @@ class Migration(custom_import("workflow", "base")):
         dst = os.path.join(PATH.SCRATCH, "model")
 
         assert os.path.exists(src)
-        unix.cp(src, dst)
+        transfer.copy(src, dst)
 
         self.logger.info(msg.sub("EVALUATE OBJECTIVE FUNCTION"))
         system.run("solver", "eval_func", path=PATH.SCRATCH,
@@ -145,7 +145,8 @@ class Migration(custom_import("workflow", "base")):
         src = os.path.join(PATH.SCRATCH, "kernels", "sum")
         dst = os.path.join(PATH.OUTPUT, "kernels")
         unix.mkdir(dst)
-        unix.cp(src, dst)
+        stats = transfer.copy(src, dst)
+        self.logger.debug(f"saved summed kernels: {stats}")
 
     def save_kernels(self):
         """
@@ -154,7 +155,8 @@ class Migration(custom_import("workflow", "base")):
         src = os.path.join(PATH.SCRATCH, "kernels")
         dst = PATH.OUTPUT
         unix.mkdir(dst)
-        unix.cp(src, dst)
+        stats = transfer.copy(src, dst)
+        self.logger.debug(f"saved kernels: {stats}")
 
     def save_traces(self):
         """
@@ -162,5 +164,6 @@ class Migration(custom_import("workflow", "base")):
         """
         src = os.path.join(PATH.SCRATCH, "traces")
         dst = PATH.OUTPUT
-        unix.cp(src, dst)
+        stats = transfer.copy(src, dst)
+        self.logger.debug(f"saved traces: {stats}")
 